@@ -0,0 +1,351 @@
+"""
+Benchmarks of the hot paths.
+
+Usage:
+    python -m benchmarks.run                       # Print results
+    python -m benchmarks.run --save baseline.json  # Store results as JSON
+    python -m benchmarks.run --compare benchmarks/baseline.json --tolerance 0.3
+
+With --compare the command exits with 1 if any benchmark got slower than the baseline by more
+than the tolerance
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+# Signing needs keys, which are read on import
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("API_KEY", "benchmark")
+
+import httpx
+
+from swapper.client import set_client
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.decode import decode_kline
+from swapper.decode import loads
+from swapper.exchange_info import ExchangeInfo
+from swapper.helpers import calculate_ask_price_based_on_spread
+from swapper.helpers import calculate_bid_ask_spread
+from swapper.helpers import calculate_bid_price_based_on_spread
+from swapper.helpers import calculate_candle_prices
+from swapper.helpers import calculate_prices_batch
+from swapper.helpers import order_at_risk
+from swapper.market_data import MarketDataReader
+from swapper.metrics import STAGE_SECONDS
+from swapper.models import Order
+from swapper.ratelimit import limiter
+from swapper.service import calculate_signature
+from swapper.state import State
+from swapper.subscribe import on_kline
+from swapper.volatility import ROLLING
+from swapper.volatility import RollingSpread
+
+KLINE_FRAME = (
+    '{"e":"kline","E":1675609847732,"s":"BTCUSDT","k":{"t":1675609800000,"T":1675609859999,'
+    '"s":"BTCUSDT","i":"1m","f":2636784741,"L":2636787507,"o":"23171.33000000",'
+    '"c":"23179.43000000","h":"23180.67000000","l":"23167.50000000","v":"66.74750000",'
+    '"n":2767,"x":false,"q":"1546784.10530020","V":"41.71094000","Q":"966637.21078300",'
+    '"B":"0"}}'
+)
+
+ORDER_RESPONSE = (
+    '{"symbol":"BTCUSDT","orderId":28,"orderListId":-1,"clientOrderId":"6gCrw2kRUAF9CvJDGP16IP",'
+    '"transactTime":1507725176595,"price":"23167.50000000","origQty":"0.01000000",'
+    '"executedQty":"0.00000000","cummulativeQuoteQty":"0.00000000","status":"NEW",'
+    '"timeInForce":"GTC","type":"LIMIT","side":"BUY","workingTime":1507725176595,'
+    '"selfTradePreventionMode":"NONE","fills":[]}'
+)
+
+
+class Benchmark(NamedTuple):
+    # Returns the function to time
+    setup: Callable[[], Callable]
+    # The timed function is a coroutine function
+    is_async: bool
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, is_async: bool = False) -> Callable:
+    def register(setup: Callable[[], Callable]) -> Callable[[], Callable]:
+        BENCHMARKS[name] = Benchmark(setup, is_async)
+        return setup
+    return register
+
+
+@benchmark("calculate_signature")
+def _calculate_signature() -> Callable:
+    data = {
+        "symbol": "BTCUSDT",
+        "side": SIDE_BID,
+        "type": "LIMIT",
+        "timeInForce": "GTC",
+        "quantity": 0.01,
+        "price": "23167.50",
+        "timestamp": "1675609847732",
+    }
+    return lambda: calculate_signature(data)
+
+
+@benchmark("calculate_bid_ask_spread")
+def _calculate_bid_ask_spread() -> Callable:
+    low, high = 2316750, 2318067
+    return lambda: calculate_bid_ask_spread(low, high)
+
+
+@benchmark("calculate_bid_price_based_on_spread")
+def _calculate_bid_price_based_on_spread() -> Callable:
+    low, spread = 2316750, calculate_bid_ask_spread(2316750, 2318067)
+    return lambda: calculate_bid_price_based_on_spread(low, spread)
+
+
+@benchmark("calculate_ask_price_based_on_spread")
+def _calculate_ask_price_based_on_spread() -> Callable:
+    high, spread = 2318067, calculate_bid_ask_spread(2316750, 2318067)
+    return lambda: calculate_ask_price_based_on_spread(high, spread)
+
+
+@benchmark("calculate_candle_prices")
+def _calculate_candle_prices() -> Callable:
+    low, high = 2316750, 2318067
+    return lambda: calculate_candle_prices(low, high)
+
+
+def _candles(count: int) -> List[Tuple[int, int]]:
+    """
+    High and low prices in ticks
+    """
+    rng = random.Random(0)
+    lows = [rng.randint(2_000_000, 3_000_000) for _ in range(count)]
+    return [(low + rng.randint(0, 5_000), low) for low in lows]
+
+
+@benchmark("pricing_10000_ticks")
+def _pricing_ticks() -> Callable:
+    candles = _candles(10_000)
+
+    def price():
+        for high, low in candles:
+            calculate_bid_ask_spread(low, high)
+            calculate_candle_prices(low, high)
+    return price
+
+
+@benchmark("pricing_10000_batch")
+def _pricing_batch() -> Callable:
+    candles = _candles(10_000)
+    highs = [high for high, _ in candles]
+    lows = [low for _, low in candles]
+    return lambda: calculate_prices_batch(highs, lows)
+
+
+@benchmark("spread_model_update")
+def _spread_model_update() -> Callable:
+    candles = itertools.cycle(_candles(10_000))
+    model = RollingSpread()
+    open_times = itertools.count()
+
+    def update():
+        high, low = next(candles)
+        model.update(next(open_times), high, low)
+        model.spread(ROLLING)
+
+    return update
+
+
+@benchmark("order_at_risk")
+def _order_at_risk() -> Callable:
+    bid, ask = 2315433, 2319385
+    order = Order(order_id=1, side=SIDE_ASK, status="NEW", price=2320000)
+    return lambda: order_at_risk(bid, ask, order)
+
+
+@benchmark("exchange_info_prepare")
+def _exchange_info_prepare() -> Callable:
+    cache = ExchangeInfo()
+    cache.load({"symbols": [{"symbol": "BTCUSDT", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.01000000", "maxPrice": "1000000.00000000",
+         "tickSize": "0.05000000"},
+        {"filterType": "LOT_SIZE", "minQty": "0.00001000", "maxQty": "9000.00000000",
+         "stepSize": "0.00001000"},
+        {"filterType": "NOTIONAL", "minNotional": "5.00000000", "maxNotional": "9000000.00000000"},
+        {"filterType": "PERCENT_PRICE_BY_SIDE", "bidMultiplierUp": "5", "bidMultiplierDown": "0.2",
+         "askMultiplierUp": "5", "askMultiplierDown": "0.2"},
+    ]}]})
+    cache.set_reference_price("BTCUSDT", 2316750)
+    return lambda: cache.prepare("BTCUSDT", SIDE_ASK, 2318067)
+
+
+@benchmark("metrics_stage_timer")
+def _metrics_stage_timer() -> Callable:
+    def observe():
+        with STAGE_SECONDS.labels("benchmark").time():
+            pass
+    return observe
+
+
+def _state(size: int) -> State:
+    """
+    State holding `size` orders, two of them active, the rest filled or cancelled
+    """
+    state = State(history_size=size)
+    state.add_orders(
+        {"orderId": order_id, "status": "FILLED" if order_id % 2 else "CANCELED",
+         "side": SIDE_BID if order_id % 2 else SIDE_ASK, "price": "23000.00"}
+        for order_id in range(size - 2)
+    )
+    state.add_orders([
+        {"orderId": size, "status": "NEW", "side": SIDE_BID, "price": "23000.00"},
+        {"orderId": size + 1, "status": "NEW", "side": SIDE_ASK, "price": "23300.00"},
+    ])
+    return state
+
+
+def _state_lookup(size: int) -> Callable:
+    state = _state(size)
+
+    def lookup():
+        # Everything the trading loop asks the state on one tick
+        state.get_active_orders()
+        state.has_active_orders()
+        state.get_active_bid_order()
+        state.get_active_ask_order()
+    return lookup
+
+
+for _size in (10, 1_000, 100_000):
+    benchmark(f"state_lookup_{_size}")(lambda size=_size: _state_lookup(size))
+
+
+@benchmark("kline_decode")
+def _kline_decode() -> Callable:
+    return lambda: decode_kline(loads(KLINE_FRAME))
+
+
+@benchmark("kline_decode_stdlib")
+def _kline_decode_stdlib() -> Callable:
+    """
+    The decode path before `swapper.decode`, to compare against
+    """
+    def decode():
+        data = json.loads(KLINE_FRAME)
+        return Decimal(data["k"]["h"]), Decimal(data["k"]["l"])
+    return decode
+
+
+@benchmark("order_decode")
+def _order_decode() -> Callable:
+    return lambda: Order.from_dict(loads(ORDER_RESPONSE))
+
+
+@benchmark("tick", is_async=True)
+def _tick() -> Callable:
+    """
+    Frame received to both order requests signed and sent, with no existing orders
+    """
+    def respond(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"orderId": 1, "status": "NEW", "side": SIDE_BID})
+
+    set_client(httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    # Measure the limiter's bookkeeping, not the waits of shaping thousands of orders
+    limiter.limits = {}
+    limiter.reset()
+    reader = MarketDataReader(websocket=None)
+
+    async def tick():
+        reader.publish(loads(KLINE_FRAME))
+        await on_kline(State(), await reader.get())
+    return tick
+
+
+def measure(bench: Benchmark, repeat: int = 5) -> float:
+    """
+    Best time of one call in nanoseconds
+    """
+    function = bench.setup()
+    if bench.is_async:
+        loop = asyncio.new_event_loop()
+
+        async def run(number: int) -> None:
+            for _ in range(number):
+                await function()
+
+        timer = timeit.Timer(lambda: loop.run_until_complete(run(number)))
+        number = 1
+        # Pick the number of calls the same way `autorange` does, then time in one coroutine
+        while timer.timeit(1) < 0.2:
+            number *= 2
+        best = min(timer.repeat(repeat, 1)) / number
+        loop.close()
+        return best * 1e9
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    # Warm up caches before the timed runs
+    timer.timeit(number)
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def run(names: List[str]) -> Dict[str, float]:
+    results = {}
+    for name in names:
+        results[name] = round(measure(BENCHMARKS[name]), 1)
+        print(f"{name:40} {results[name]:>14,.1f} ns", file=sys.stderr)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """
+    Names of the benchmarks slower than the baseline by more than the tolerance
+    """
+    return [
+        name for name, nanoseconds in results.items()
+        if name in baseline and nanoseconds > baseline[name] * (1 + tolerance)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks of the hot paths")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all by default")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare results with")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="Allowed slowdown against the baseline, 0.3 is 30%%")
+    args = parser.parse_args()
+
+    results = run(args.names or list(BENCHMARKS))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write("\n")
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for name in regressions:
+            print(
+                f"REGRESSION {name}: {results[name]:,.1f} ns, baseline {baseline[name]:,.1f} ns",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
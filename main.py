@@ -1,20 +1,309 @@
 import asyncio
+import atexit
 import logging
+import multiprocessing
+import signal
+import sqlite3
+import sys
+import time
+from multiprocessing.process import BaseProcess
+from typing import List
+from typing import Optional
+
+# Time to the first order counts from here
+STARTED = time.monotonic()
 
-import websockets
 from dotenv import load_dotenv
 
+# Load the environment before `swapper` reads keys and URLs from it
+load_dotenv()
+
+from swapper import metrics
+from swapper.client import open_client
+from swapper.clock import clock
+from swapper.constants import BINANCE_WS_COMBINED_STREAM_URL
 from swapper.constants import BINANCE_WS_MARKET_STREAM_URL
-from swapper.subscribe import subscribe
+from swapper.constants import METRICS_DUMP_INTERVAL
+from swapper.constants import METRICS_ENABLED
+from swapper.constants import METRICS_PORT
+from swapper.constants import ORDER_BOOK_ENABLED
+from swapper.constants import ORDER_JOURNAL_COMPACT_INTERVAL
+from swapper.constants import ORDER_JOURNAL_ENABLED
+from swapper.constants import ORDER_TRANSPORT
+from swapper.constants import RATE_LIMIT_USAGE
+from swapper.constants import SYMBOLS
+from swapper.constants import TRADER_CHECK_INTERVAL
+from swapper.constants import TRADER_SHUTDOWN_TIMEOUT
+from swapper.constants import TRADING_PROCESSES
+from swapper.constants import USER_DATA_STREAM_ENABLED
+from swapper.engine import Engine
+from swapper.exchange_info import exchange_info
+from swapper.journal import OrderJournal
+from swapper.log import setup_logging
+from swapper.market_data import MarketDataReader
+from swapper.orderbook import get_book
+from swapper.ratelimit import limiter
+from swapper.ring import RingPublisher
+from swapper.ring import TickRing
+from swapper.service import get_exchange_info
+from swapper.service import set_ws_api
+from swapper.startup import startup
+from swapper.state import State
+from swapper.subscribe import send_subscribe
+from swapper.subscribe import trade
+from swapper.supervisor import market_stream_urls
+from swapper.supervisor import MarketDataSupervisor
+from swapper.user_stream import UserDataStream
+from swapper.ws_api import WebSocketApi
+
+logger = logging.getLogger(__name__)
+
+
+def market_data_supervisor(
+        reader: MarketDataReader, symbols: List[str] = SYMBOLS
+) -> MarketDataSupervisor:
+    if len(symbols) > 1:
+        return MarketDataSupervisor(
+            market_stream_urls(BINANCE_WS_COMBINED_STREAM_URL), reader, Engine(symbols).subscribe
+        )
+    return MarketDataSupervisor(
+        market_stream_urls(BINANCE_WS_MARKET_STREAM_URL), reader, send_subscribe
+    )
+
+
+async def supervise_market_data(reader: MarketDataReader, symbols: List[str]) -> None:
+    # Prices are decoded in ticks of their symbol, so the frames wait for its exchange info
+    await startup.check_symbols(symbols)
+    await market_data_supervisor(reader, symbols).run()
+
+
+async def wait_tasks(tasks: List[asyncio.Task], background_tasks: List[asyncio.Task]) -> None:
+    """
+    Wait until `tasks` are done. The first one of them or of `background_tasks` to fail raises, so
+    a dead background loop stops the process instead of leaving it trading on stale data
+    """
+    pending = set(tasks) | set(background_tasks)
+    while not all(task.done() for task in tasks):
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+
+
+def open_journal(compact: bool) -> Optional[OrderJournal]:
+    """
+    The order journal, or None if it can't be opened. The snapshot fetches the orders then
+    """
+    try:
+        journal = OrderJournal(compact_interval=ORDER_JOURNAL_COMPACT_INTERVAL if compact else None)
+    except sqlite3.Error as err:
+        logger.error(f"Opening the order journal failed, running without it: {err!r}")
+        return None
+    if compact:
+        try:
+            journal.compact()
+        except sqlite3.Error as err:
+            # E.g. locked by a process of the last run. `run()` compacts again later
+            logger.error(f"Compacting the order journal failed: {err!r}")
+    return journal
+
+
+async def connect(
+        symbols: List[str] = SYMBOLS,
+        ring_name: Optional[str] = None,
+        metrics_port: int = METRICS_PORT,
+        compact_journal: bool = True,
+):
+    """
+    :param ring_name: Trade off the ticks of a `TickRing` instead of streaming market data
+    :param compact_journal: Compact the order journal. Only one of the processes sharing it does
+    """
+    startup.started = STARTED
+    async with open_client():
+        background_tasks = []
+        metrics_server = None
+        if METRICS_ENABLED and metrics_port:
+            metrics_server = await metrics.serve(port=metrics_port)
+        if METRICS_ENABLED and METRICS_DUMP_INTERVAL:
+            background_tasks.append(asyncio.create_task(metrics.dump(METRICS_DUMP_INTERVAL)))
+        # Everything up to the first tick runs at the same time. Signed requests wait for the
+        # clock sync
+        phases = [
+            ("clock_sync", startup.sync_clock()),
+            ("exchange_info", startup.check_symbols(symbols)),
+        ]
+        states = user_stream = ws_api = journal = None
+        if ORDER_TRANSPORT == "ws":
+            ws_api = WebSocketApi()
+            # Orders go over REST until `ws_api.run()` connects, a failed handshake isn't fatal
+            phases.append(("ws_api", ws_api.try_connect()))
+        if USER_DATA_STREAM_ENABLED:
+            states = {symbol: State() for symbol in symbols}
+            user_stream = UserDataStream(states)
+            if ORDER_JOURNAL_ENABLED:
+                journal = open_journal(compact_journal)
+            # With the journal, only orders changed since the last run are fetched in the snapshot
+            phases.append(("user_stream", startup.connect_user_stream(user_stream, journal)))
+        reader = MarketDataReader()
+        engine = Engine(symbols, states) if len(symbols) > 1 else None
+        ring = TickRing(ring_name) if ring_name else None
+        if ring:
+            supervising = asyncio.create_task(ring.consume(reader, set(symbols)))
+        else:
+            supervising = asyncio.create_task(supervise_market_data(reader, symbols))
+            if ORDER_BOOK_ENABLED:
+                background_tasks.extend(
+                    asyncio.create_task(get_book(symbol).run()) for symbol in symbols
+                )
+        background_tasks.append(supervising)
+        phases.append(("market_data", reader.wait_for_data()))
+        try:
+            await startup.run(*phases)
+            background_tasks.append(asyncio.create_task(clock.sync()))
+            background_tasks.append(asyncio.create_task(clock.run()))
+            background_tasks.append(asyncio.create_task(exchange_info.run(get_exchange_info)))
+            if ws_api:
+                set_ws_api(ws_api)
+                background_tasks.append(asyncio.create_task(ws_api.run()))
+            if user_stream:
+                background_tasks.append(asyncio.create_task(user_stream.run()))
+            if journal:
+                background_tasks.append(asyncio.create_task(journal.run()))
+            if engine:
+                trading = asyncio.create_task(engine.trade(reader))
+            else:
+                trading = asyncio.create_task(
+                    trade(reader, states[symbols[0]] if states else None, symbols[0])
+                )
+            background_tasks.append(trading)
+            await wait_tasks([supervising, trading], background_tasks)
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            if user_stream:
+                await user_stream.close()
+            if ws_api:
+                set_ws_api(None)
+                await ws_api.close()
+            if metrics_server:
+                metrics_server.close()
+            if journal:
+                journal.close()
+            if ring:
+                ring.close()
+
+
+async def watch_traders(traders: List[BaseProcess]) -> None:
+    """
+    Return as soon as one of the trading processes exited
+    """
+    while True:
+        for trader in traders:
+            if not trader.is_alive():
+                logger.error(f"Trading process {trader.name} exited with {trader.exitcode}")
+                return
+        await asyncio.sleep(TRADER_CHECK_INTERVAL)
+
+
+async def stream(ring: TickRing, traders: List[BaseProcess]) -> None:
+    """
+    Stream the market data of all symbols into a ring for the trading processes, until one of
+    them exits
+    """
+    metrics_server = None
+    if METRICS_ENABLED and METRICS_PORT:
+        metrics_server = await metrics.serve()
+    tasks = []
+    try:
+        # The ring holds prices in ticks of their symbol, the same ones the traders load
+        async with open_client():
+            exchange_info.load(await get_exchange_info(SYMBOLS))
+        tasks = [
+            asyncio.create_task(market_data_supervisor(RingPublisher(ring)).run()),
+            asyncio.create_task(watch_traders(traders)),
+        ]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if metrics_server:
+            metrics_server.close()
+
+
+async def trade_until_terminated(
+        ring_name: str, symbols: List[str], metrics_port: int, compact_journal: bool
+) -> None:
+    # SIGTERM cancels trading like an error would, so the connections are closed and the
+    # journal is written
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await connect(symbols, ring_name, metrics_port, compact_journal)
+    except asyncio.CancelledError:
+        logger.info("Trading process terminated")
+
+
+def run_trading(
+        ring_name: str, symbols: List[str], metrics_port: int, processes: int,
+        compact_journal: bool,
+) -> None:
+    # The processes share the rate limits of the account
+    limiter.usage = RATE_LIMIT_USAGE / processes
+    limiter.reset()
+    # Spawned processes don't run `__main__`, nor exit handlers
+    listener = setup_logging()
+    try:
+        asyncio.run(trade_until_terminated(ring_name, symbols, metrics_port, compact_journal))
+    finally:
+        listener.stop()
 
-logging.basicConfig(level=logging.INFO)
 
+def run_processes(processes: int = TRADING_PROCESSES) -> None:
+    """
+    Stream market data in this process and trade in `processes` others, every one of them a
+    share of the symbols. They serve metrics on the ports after `METRICS_PORT`.
 
-async def connect():
-    async with websockets.connect(BINANCE_WS_MARKET_STREAM_URL) as websocket:
-        await subscribe(websocket)
+    Once any trading process exits the others are stopped and this process exits with 1, for
+    the container to be restarted
+    """
+    processes = min(processes, len(SYMBOLS))
+    ring = TickRing()
+    context = multiprocessing.get_context("spawn")
+    traders = [
+        context.Process(
+            target=run_trading,
+            args=(ring.name, SYMBOLS[index::processes],
+                  METRICS_PORT + 1 + index if METRICS_PORT else 0, processes,
+                  # They share the journal, the first one compacts it for all
+                  index == 0),
+            daemon=True,
+        )
+        for index in range(processes)
+    ]
+    for trader in traders:
+        trader.start()
+    try:
+        asyncio.run(stream(ring, traders))
+    finally:
+        for trader in traders:
+            # Handled by `trade_until_terminated`, which shuts down and writes the queued logs
+            trader.terminate()
+        for trader in traders:
+            trader.join(TRADER_SHUTDOWN_TIMEOUT)
+            if trader.is_alive():
+                logger.error(f"Trading process {trader.name} didn't stop, killing it")
+                trader.kill()
+                trader.join()
+        ring.close()
+        ring.unlink()
+    # Streaming only stops when a trading process exited
+    sys.exit(1)
 
 
 if __name__ == "__main__":
-    load_dotenv()
-    asyncio.run(connect())
+    # Writes the records still queued on exit
+    atexit.register(setup_logging().stop)
+    if TRADING_PROCESSES:
+        run_processes()
+    else:
+        asyncio.run(connect())
@@ -0,0 +1,273 @@
+"""
+Replays historical klines through the trading decisions against a simulated exchange.
+
+Usage: python -m swapper.backtest <klines.csv|klines.jsonl> [--json]
+
+CSV files are expected in the format of https://data.binance.vision kline dumps, JSON lines can
+hold either websocket kline events or rows of the REST klines endpoint
+"""
+import argparse
+import csv
+import json
+import time
+from dataclasses import asdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from swapper.constants import OrderStatus
+from swapper.constants import PRICE_PRECISION
+from swapper.constants import QUANTITY
+from swapper.constants import SIDE_BID
+from swapper.constants import SYMBOL
+from swapper.models import Kline
+from swapper.models import Order
+from swapper.policy import RepricingPolicy
+from swapper.prices import tick_precision
+from swapper.prices import to_decimal
+from swapper.prices import to_ticks
+from swapper.state import State
+from swapper.strategy import decide
+from swapper.strategy import PLACE
+from swapper.strategy import REPLACE
+from swapper.volatility import CANDLE
+from swapper.volatility import EWMA
+from swapper.volatility import ROLLING
+from swapper.volatility import RollingSpread
+
+
+def load_klines(path: str, precision: int = PRICE_PRECISION) -> Iterator[Kline]:
+    """
+    Read klines from a CSV or JSON lines file
+    :param precision: Decimal places of the tick size of the symbol
+    """
+    with open(path) as file:
+        if path.endswith(".csv"):
+            for row in csv.reader(file):
+                if row and row[0].isdigit():  # Skip the header, if any
+                    yield _kline_from_row(row, precision)
+            return
+
+        for line in file:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if isinstance(data, list):
+                yield _kline_from_row(data, precision)
+                continue
+            data = data.get("data", data)["k"]
+            yield Kline(
+                open_time=int(data["t"]),
+                open=to_ticks(data["o"], precision),
+                high=to_ticks(data["h"], precision),
+                low=to_ticks(data["l"], precision),
+                close=to_ticks(data["c"], precision),
+            )
+
+
+def _kline_from_row(row: list, precision: int) -> Kline:
+    return Kline(
+        open_time=int(row[0]),
+        open=to_ticks(row[1], precision),
+        high=to_ticks(row[2], precision),
+        low=to_ticks(row[3], precision),
+        close=to_ticks(row[4], precision),
+    )
+
+
+@dataclass
+class Fill:
+    order_id: int
+    side: str
+    # Ticks
+    price: int
+    time: int
+
+
+class SimulatedExchange:
+    """
+    Matching engine for resting limit orders. An order is filled at its own price by any later
+    kline that trades through it
+    """
+
+    def __init__(self, symbol: str = SYMBOL, quantity: Decimal = Decimal(str(QUANTITY))) -> None:
+        self.symbol = symbol
+        self.quantity = quantity
+        self.resting: Dict[int, Order] = {}
+        self.placed = 0
+        self.cancelled = 0
+        self._next_order_id = 1
+
+    def place(self, side: str, price: int, now: int) -> Order:
+        order = Order(
+            order_id=self._next_order_id,
+            side=side,
+            status=OrderStatus.NEW.value,
+            price=price,
+            symbol=self.symbol,
+            update_time=now,
+            created_time=now,
+        )
+        self._next_order_id += 1
+        self.resting[order.order_id] = order
+        self.placed += 1
+        return order
+
+    def cancel(self, order_id: int, now: int) -> Optional[Order]:
+        order = self.resting.pop(order_id, None)
+        if order is None:
+            return None
+        self.cancelled += 1
+        return order._replace(status=OrderStatus.CANCELED.value, update_time=now)
+
+    def replace(
+            self, order_id: int, side: str, price: int, now: int
+    ) -> Tuple[Optional[Order], Optional[Order]]:
+        """
+        Same semantics as cancelReplace with STOP_ON_FAILURE
+        """
+        cancelled = self.cancel(order_id, now)
+        if cancelled is None:
+            return None, None
+        return cancelled, self.place(side, price, now)
+
+    def match(self, kline: Kline) -> List[Tuple[Order, Fill]]:
+        fills = []
+        for order in list(self.resting.values()):
+            if order.side == SIDE_BID:
+                filled = kline.low <= order.price
+            else:
+                filled = kline.high >= order.price
+            if filled:
+                del self.resting[order.order_id]
+                fills.append((
+                    order._replace(status=OrderStatus.FILLED.value, update_time=kline.open_time),
+                    Fill(order.order_id, order.side, order.price, kline.open_time),
+                ))
+        return fills
+
+
+@dataclass
+class BacktestResult:
+    klines: int = 0
+    decisions: int = 0
+    orders_placed: int = 0
+    orders_cancelled: int = 0
+    fills: int = 0
+    repricings_suppressed: int = 0
+    position: Decimal = Decimal(0)
+    cash: Decimal = Decimal(0)
+    pnl: Decimal = Decimal(0)
+    seconds: float = 0.0
+
+    @property
+    def decisions_per_second(self) -> float:
+        return self.decisions / self.seconds if self.seconds else 0.0
+
+    @property
+    def order_churn(self) -> int:
+        return self.orders_placed + self.orders_cancelled
+
+    def summary(self) -> dict:
+        return {
+            **{
+                key: str(value) if isinstance(value, Decimal) else value
+                for key, value in asdict(self).items()
+            },
+            "order_churn": self.order_churn,
+            "decisions_per_second": round(self.decisions_per_second),
+        }
+
+
+def replay(
+        klines: Iterable[Kline],
+        symbol: str = SYMBOL,
+        spread_model: str = CANDLE,
+        policy: Optional[RepricingPolicy] = None,
+        precision: int = PRICE_PRECISION,
+) -> Tuple[BacktestResult, List[Fill]]:
+    """
+    Feed klines one by one: first fill resting orders the kline trades through, then run the
+    same decisions as the live loop on it
+    :param spread_model: See `SPREAD_MODEL`
+    :param policy: Repricing policy, the `REPRICE_*` settings when not given
+    :param precision: Decimal places the kline prices are in, see `load_klines`
+    """
+    model = RollingSpread() if spread_model != CANDLE else None
+    policy = policy or RepricingPolicy()
+    state = State()
+    exchange = SimulatedExchange(symbol)
+    result = BacktestResult()
+    fills: List[Fill] = []
+    close = 0
+    started = time.perf_counter()
+
+    for kline in klines:
+        result.klines += 1
+        close = kline.close
+        for order, fill in exchange.match(kline):
+            state.add_orders([order])
+            fills.append(fill)
+            if fill.side == SIDE_BID:
+                result.position += exchange.quantity
+                result.cash -= exchange.quantity * to_decimal(fill.price, precision)
+            else:
+                result.position -= exchange.quantity
+                result.cash += exchange.quantity * to_decimal(fill.price, precision)
+
+        spread = None
+        if model is not None:
+            model.update(kline.open_time, kline.high, kline.low)
+            spread = model.spread(spread_model)
+        if len(state.get_active_orders()) > 2:
+            continue
+        result.decisions += 1
+        for action in decide(state, kline.high, kline.low, spread, policy, kline.open_time):
+            if action.kind == PLACE:
+                state.add_orders([exchange.place(action.side, action.price, kline.open_time)])
+            elif action.kind == REPLACE:
+                cancelled, new_order = exchange.replace(
+                    action.order.order_id, action.side, action.price, kline.open_time
+                )
+                state.add_orders([order for order in (cancelled, new_order) if order])
+
+    result.seconds = time.perf_counter() - started
+    result.orders_placed = exchange.placed
+    result.orders_cancelled = exchange.cancelled
+    result.fills = len(fills)
+    result.repricings_suppressed = policy.suppressed
+    # Mark the inventory to the last close
+    result.pnl = result.cash + result.position * to_decimal(close, precision)
+    return result, fills
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="CSV or JSON lines file with klines")
+    parser.add_argument("--symbol", default=SYMBOL)
+    parser.add_argument(
+        "--tick-size", default=None, help="PRICE_FILTER tick size of the symbol, e.g. 0.01"
+    )
+    parser.add_argument("--spread-model", default=CANDLE, choices=(CANDLE, EWMA, ROLLING))
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    precision = tick_precision(args.tick_size) if args.tick_size else PRICE_PRECISION
+    result, _ = replay(
+        load_klines(args.path, precision), args.symbol, args.spread_model, precision=precision
+    )
+    summary = result.summary()
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        for key, value in summary.items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Shared HTTP client used for all Binance REST calls
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from typing import Optional
+
+import httpx
+
+from swapper.constants import HTTP2_ENABLED
+from swapper.constants import HTTP_CONNECT_TIMEOUT
+from swapper.constants import HTTP_KEEPALIVE_EXPIRY
+from swapper.constants import HTTP_MAX_CONNECTIONS
+from swapper.constants import HTTP_MAX_KEEPALIVE_CONNECTIONS
+from swapper.constants import HTTP_TIMEOUT
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_client(http2: bool = HTTP2_ENABLED) -> httpx.AsyncClient:
+    """
+    Create a keep-alive client. HTTP/2 is only used when the `h2` package is installed
+    :param http2: Whether to multiplex requests over HTTP/2
+    """
+    return httpx.AsyncClient(
+        http2=http2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get the shared client, creating one lazily if nothing was opened yet
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+def set_client(client: Optional[httpx.AsyncClient]) -> None:
+    """
+    Inject the client to be used by `swapper.service`
+    """
+    global _client
+    _client = client
+
+
+@asynccontextmanager
+async def open_client(
+        client: Optional[httpx.AsyncClient] = None
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Keep one client open for the lifetime of the context and close its pool on exit
+    :param client: Optional client to use instead of the default one
+    """
+    client = client or create_client()
+    set_client(client)
+    try:
+        yield client
+    finally:
+        set_client(None)
+        await client.aclose()
@@ -0,0 +1,112 @@
+"""
+Keeps track of the offset between the local clock and Binance server time, so signed requests
+get a corrected timestamp without asking the server for its time first
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque
+from typing import Optional
+
+import httpx
+
+from swapper.client import get_client
+from swapper.constants import BINANCE_TIME_API_URL
+from swapper.constants import CLOCK_SYNC_BURST
+from swapper.constants import CLOCK_SYNC_INTERVAL
+from swapper.constants import CLOCK_SYNC_SAMPLES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClockSample:
+    # Server time minus local time, in milliseconds
+    offset: float
+    # Round trip time of the request, in milliseconds
+    rtt: float
+
+
+class ClockSync:
+    """
+    NTP-style clock filter: every sample assumes the server read its clock halfway through the
+    round trip, and the sample with the lowest RTT out of the recent ones is trusted the most
+    """
+
+    def __init__(
+            self,
+            url: str = BINANCE_TIME_API_URL,
+            interval: float = CLOCK_SYNC_INTERVAL,
+            max_samples: int = CLOCK_SYNC_SAMPLES,
+    ) -> None:
+        self.url = url
+        self.interval = interval
+        self.samples: Deque[ClockSample] = deque(maxlen=max_samples)
+
+    @property
+    def best(self) -> Optional[ClockSample]:
+        if not self.samples:
+            return None
+        return min(self.samples, key=lambda sample: sample.rtt)
+
+    @property
+    def offset(self) -> float:
+        best = self.best
+        return best.offset if best else 0.0
+
+    def now_ms(self) -> int:
+        """
+        Current server time estimate in milliseconds
+        """
+        return int(time.time() * 1000 + self.offset)
+
+    def timestamp(self) -> str:
+        """
+        Timestamp to be used in signed requests
+        """
+        return str(self.now_ms())
+
+    async def sample(self) -> Optional[ClockSample]:
+        """
+        Take one sample of the server time and store it
+        """
+        local_sent = time.time() * 1000
+        started = time.perf_counter()
+        response = await get_client().get(self.url)
+        rtt = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            logger.warning(f"Could not get server time: {response.status_code}")
+            return None
+
+        server_time = response.json()["serverTime"]
+        sample = ClockSample(offset=server_time - (local_sent + rtt / 2), rtt=rtt)
+        self.samples.append(sample)
+        return sample
+
+    async def sync(self, burst: int = CLOCK_SYNC_BURST) -> Optional[ClockSample]:
+        """
+        Take a burst of samples and return the best estimate so far
+        """
+        for _ in range(burst):
+            try:
+                await self.sample()
+            except (httpx.HTTPError, ValueError, KeyError) as err:
+                # A body that isn't JSON or has no serverTime, e.g. from a proxy, fails the same
+                logger.warning(f"Clock sync failed: {err!r}")
+        best = self.best
+        if best:
+            logger.debug(f"Clock offset {best.offset:.1f}ms, rtt {best.rtt:.1f}ms")
+        return best
+
+    async def run(self) -> None:
+        """
+        Periodically resync the clock. Meant to be run as a background task
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+
+clock = ClockSync()
@@ -1,20 +1,149 @@
+import os
 from enum import Enum
 
-# URLS
-BINANCE_WS_MARKET_STREAM_URL = "wss://stream.binance.com:9443/ws/btcusdt@kline_1m"  # Production ws
-BINANCE_REST_API_BASE_URL = "https://testnet.binance.vision/api/v3"  # Testnet API
-BINANCE_TIME_API_URL = "https://api.binance.com/api/v3/time"
+# URLS. Can be overridden from the environment, e.g. to run against `swapper.fake_exchange`
+BINANCE_WS_MARKET_STREAM_URL = os.getenv(  # Production ws
+    "BINANCE_WS_MARKET_STREAM_URL", "wss://stream.binance.com:9443/ws/btcusdt@kline_1m"
+)
+BINANCE_WS_COMBINED_STREAM_URL = os.getenv(  # Production combined ws
+    "BINANCE_WS_COMBINED_STREAM_URL", "wss://stream.binance.com:9443/stream"
+)
+BINANCE_REST_API_BASE_URL = os.getenv(  # Testnet API
+    "BINANCE_REST_API_BASE_URL", "https://testnet.binance.vision/api/v3"
+)
+BINANCE_WS_USER_STREAM_URL = os.getenv(  # Testnet user data stream
+    "BINANCE_WS_USER_STREAM_URL", "wss://testnet.binance.vision/ws"
+)
+BINANCE_WS_API_URL = os.getenv(  # Testnet WebSocket API
+    "BINANCE_WS_API_URL", "wss://testnet.binance.vision/ws-api/v3"
+)
+BINANCE_TIME_API_URL = f"{BINANCE_REST_API_BASE_URL}/time"  # Same host that validates timestamps
+# Other endpoints serving the same market streams. Raced against the configured one on connect
+BINANCE_WS_MARKET_STREAM_MIRRORS = {
+    "wss://stream.binance.com:9443": [
+        "wss://stream.binance.com:443", "wss://data-stream.binance.vision",
+    ],
+}
 
 # Misc
 SLEEP_TIME = 5
 
+# HTTP client
+HTTP_TIMEOUT = 10
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 60
+HTTP2_ENABLED = True  # Only used when `h2` is installed
+
+# Order transport. "ws" sends orders over the WebSocket API, with REST used while it's down
+ORDER_TRANSPORT = os.getenv("ORDER_TRANSPORT", "rest")
+WS_API_MAX_RECONNECT_DELAY = 30  # Seconds
+
+# Market data connection
+MARKET_DATA_STANDBY = True  # Keep a second connection streaming, so a drop loses no frames
+MARKET_DATA_CONNECT_TIMEOUT = 5  # Seconds
+MARKET_DATA_PING_INTERVAL = 10  # Seconds between pings, a connection without a pong is dropped
+MARKET_DATA_STALE_AFTER = 10  # Seconds without a frame before a connection is replaced
+MARKET_DATA_MAX_CONNECTION_AGE = 23 * 60 * 60  # Replaced before Binance drops it at 24 hours
+MARKET_DATA_MAX_RECONNECT_DELAY = 30  # Seconds
+USER_STREAM_MAX_RECONNECT_DELAY = 30  # Seconds
+
+# Rate limits. Header suffix -> (what counts, limit, seconds), from the exchangeInfo of spot
+RATE_LIMITS = {
+    "USED-WEIGHT-1M": ("WEIGHT", 6000, 60),
+    "ORDER-COUNT-10S": ("ORDERS", 100, 10),
+    "ORDER-COUNT-1D": ("ORDERS", 200000, 24 * 60 * 60),
+}
+RATE_LIMIT_USAGE = 0.9  # Share of the limits to use, leaves room for manual requests
+RATE_LIMIT_DEFAULT_RETRY_AFTER = 60  # Seconds to back off on a 429 without Retry-After
+
+# Clock sync
+CLOCK_SYNC_INTERVAL = 60  # Seconds between syncs
+CLOCK_SYNC_BURST = 3  # Samples taken on each sync
+CLOCK_SYNC_SAMPLES = 30  # Samples kept to pick the best estimate from
+
+# User data stream
+USER_DATA_STREAM_ENABLED = True  # Otherwise orders are polled from REST on every message
+LISTEN_KEY_KEEPALIVE_INTERVAL = 30 * 60
+RECONCILE_INTERVAL = 5 * 60  # Seconds between REST snapshots that fix up missed events
+
+# State
+ORDER_HISTORY_SIZE = 1000  # Terminal orders kept in memory
+ALL_ORDERS_LIMIT = 1000  # Orders per allOrders page, the most Binance returns
+# SQLite journal of order updates, replayed on start so only orders changed since are fetched.
+# Used with the user data stream
+ORDER_JOURNAL_ENABLED = True
+# Relative to the working directory. The Docker image keeps it on the /data volume
+ORDER_JOURNAL_PATH = os.getenv("ORDER_JOURNAL_PATH", "orders.db")
+ORDER_JOURNAL_FLUSH_INTERVAL = 1  # Seconds between writes of the queued updates
+ORDER_JOURNAL_COMPACT_INTERVAL = 60 * 60  # Seconds between dropping updates no longer needed
+
+# Local order book, kept from the depth snapshot and diff stream of every symbol. Not kept in
+# multi-process mode
+ORDER_BOOK_ENABLED = False
+ORDER_BOOK_SNAPSHOT_LIMIT = 1000  # Levels per side of the REST snapshot
+ORDER_BOOK_BUFFER_SIZE = 1000  # Diff events kept while waiting for a snapshot
+
+# Multi-process mode. One process streams market data into a shared memory ring buffer and
+# `TRADING_PROCESSES` processes trade off it, each a share of the symbols. 0 runs everything in
+# one process
+TRADING_PROCESSES = int(os.getenv("TRADING_PROCESSES", "0"))
+RING_SIZE = 4096  # Ticks the ring buffer holds before the oldest unread one is overwritten
+RING_POLL_INTERVAL = 0.0005  # Seconds a trading process sleeps when it has read every tick
+TRADER_CHECK_INTERVAL = 1  # Seconds between checks that every trading process is still running
+TRADER_SHUTDOWN_TIMEOUT = 10  # Seconds a trading process gets to stop before it's killed
+
+# Multi-symbol engine
+ENGINE_WORKERS = 8  # Symbols processed at the same time, bounds concurrent REST work
+ENGINE_SUBSCRIBE_BATCH = 100  # Streams per SUBSCRIBE message
+
+# Metrics
+METRICS_ENABLED = True
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Prometheus endpoint, 0 turns it off
+METRICS_DUMP_INTERVAL = 0  # Seconds between logging stage percentiles, 0 turns it off
+
+# Logging. Records are queued on the event loop and written by a background thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" for JSON lines, "text" for plain lines
+LOG_QUEUE_SIZE = 10_000  # Records waiting to be written, more are dropped
+LOG_SAMPLE_EVERY = 1  # Keep one in this many records below WARNING, 1 keeps them all
+
 # Trades
 ORDER_TYPE = "LIMIT"
 SYMBOL = "BTCUSDT"
+SYMBOLS = [SYMBOL]  # More than one symbol runs the multi-symbol engine over a combined stream
+KLINE_INTERVAL = "1m"
 SIDE_BID = "BUY"
 SIDE_ASK = "SELL"
 TIME_IN_FORCE = "GTC"
 QUANTITY = 0.01
+PRICE_PRECISION = 2  # Decimal places of prices of symbols without exchange info loaded
+# Filters of the symbols from exchangeInfo, orders failing them are never sent. Fetched again
+# after this many seconds, or after the exchange rejected an order for a filter failure
+EXCHANGE_INFO_TTL = 60 * 60
+EXCHANGE_INFO_MIN_REFRESH_INTERVAL = 10  # Seconds between two fetches
+# Spread model. "candle" prices off the range of the current kline only, "ewma" off a moving
+# average of the range of the last klines and "rolling" off the range of the last klines together
+SPREAD_MODEL = "candle"
+SPREAD_WINDOW = 20  # Klines
+SPREAD_EWMA_ALPHA = "0.2"  # Weight of the latest kline in the "ewma" model
+# Repricing. An order is replaced once the new price has crossed it by the threshold, and stays
+# due until it's back inside the threshold minus the hysteresis. The defaults replace as soon as
+# the new price reaches the order
+REPRICE_THRESHOLD = "0"
+REPRICE_THRESHOLD_UNIT = "bps"  # Or "ticks", of the tick size in the symbol's PRICE_FILTER
+REPRICE_HYSTERESIS = "0"  # Same unit as the threshold
+REPRICE_MIN_ORDER_AGE = 0  # Milliseconds an order rests before it can be replaced
+REPRICE_COOLDOWN = 0  # Milliseconds between two replaces of the same side
+# With an order book, "book" prices off its best bid and ask instead of the kline low and high,
+# with the spread still from the spread model
+PRICE_REFERENCE = "kline"
+# With an order book, orders with at most this quantity resting ahead of them are at risk too
+ORDER_BOOK_MIN_DEPTH_AHEAD = "0"
+CANCEL_REPLACE_ENABLED = True  # Otherwise orders are replaced with separate cancel and place
+CANCEL_REPLACE_MODE = "STOP_ON_FAILURE"  # Don't place the new order if the cancel failed
 
 
 class OrderStatus(Enum):
@@ -25,3 +154,14 @@ class OrderStatus(Enum):
     PENDING_CANCEL = "PENDING_CANCEL"
     REJECTED = "REJECTED"
     EXPIRED = "EXPIRED"
+    EXPIRED_IN_MATCH = "EXPIRED_IN_MATCH"
+
+
+# Orders in these statuses can't change anymore
+TERMINAL_ORDER_STATUSES = frozenset({
+    OrderStatus.FILLED.value,
+    OrderStatus.CANCELED.value,
+    OrderStatus.REJECTED.value,
+    OrderStatus.EXPIRED.value,
+    OrderStatus.EXPIRED_IN_MATCH.value,
+})
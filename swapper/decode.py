@@ -0,0 +1,37 @@
+"""
+Decodes exchange payloads into the compact records the bot works with. Uses orjson, from the
+requirements, and the standard library when it isn't installed
+"""
+import json
+import sys
+from typing import Any
+from typing import Union
+
+from swapper.models import KlineEvent
+from swapper.prices import price_precision
+from swapper.prices import to_ticks
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse a JSON document
+    """
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+
+def decode_kline(event: dict) -> KlineEvent:
+    """
+    Build a kline record from a parsed kline event
+    """
+    kline = event["k"]
+    symbol = sys.intern(event["s"])
+    precision = price_precision(symbol)
+    # Positional arguments, keywords make building the record twice as slow
+    return KlineEvent(symbol, event.get("E", 0), to_ticks(kline["h"], precision),
+                      to_ticks(kline["l"], precision), kline.get("t", 0))
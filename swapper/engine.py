@@ -0,0 +1,123 @@
+"""
+Market making on many symbols from one process over a Binance combined stream
+"""
+import asyncio
+import json
+import logging
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+import websockets
+from httpx import HTTPError
+
+from swapper.constants import ENGINE_SUBSCRIBE_BATCH
+from swapper.constants import ENGINE_WORKERS
+from swapper.constants import KLINE_INTERVAL
+from swapper.constants import ORDER_BOOK_ENABLED
+from swapper.errors import SwapperError
+from swapper.market_data import MarketDataReader
+from swapper.models import KlineEvent
+from swapper.state import State
+from swapper.subscribe import load_state
+from swapper.subscribe import on_kline
+
+logger = logging.getLogger(__name__)
+
+
+class Engine:
+    """
+    Keeps a State per symbol and prices every symbol independently.
+
+    Every symbol has at most one kline waiting, because the reader conflates frames per stream,
+    and symbols are picked up in the order their data arrived by a fixed pool of workers. A slow
+    symbol therefore only delays itself, and the wait of any symbol is bounded by
+    `len(symbols) / workers` ticks of REST work
+    """
+
+    def __init__(
+            self,
+            symbols: List[str],
+            states: Optional[Dict[str, State]] = None,
+            workers: int = ENGINE_WORKERS,
+    ) -> None:
+        self.symbols = symbols
+        self._symbols = set(symbols)
+        # Without states kept up to date by the user data stream, orders are polled every tick
+        self.states = states
+        self.workers = workers
+        self._busy: Set[str] = set()
+        self._next: Dict[str, KlineEvent] = {}
+
+    @property
+    def streams(self) -> List[str]:
+        streams = [f"{symbol.lower()}@kline_{KLINE_INTERVAL}" for symbol in self.symbols]
+        if ORDER_BOOK_ENABLED:
+            streams += [f"{symbol.lower()}@depth@100ms" for symbol in self.symbols]
+        return streams
+
+    async def subscribe(self, websocket: websockets.WebSocketClientProtocol) -> None:
+        """
+        Subscribe to all streams in batches to stay under the message size and rate limits
+        """
+        streams = self.streams
+        for request_id, start in enumerate(range(0, len(streams), ENGINE_SUBSCRIBE_BATCH), 1):
+            await websocket.send(json.dumps({
+                "method": "SUBSCRIBE",
+                "params": streams[start:start + ENGINE_SUBSCRIBE_BATCH],
+                "id": request_id,
+            }))
+            if start + ENGINE_SUBSCRIBE_BATCH < len(streams):
+                # Binance allows 5 incoming messages per second
+                await asyncio.sleep(0.25)
+
+    async def run(self, websocket: websockets.WebSocketClientProtocol) -> None:
+        await self.subscribe(websocket)
+        reader = MarketDataReader(websocket)
+        reading = asyncio.create_task(reader.run())
+        try:
+            await self.trade(reader)
+        finally:
+            reading.cancel()
+
+    async def trade(self, reader: MarketDataReader) -> None:
+        """
+        Trade off the klines of a reader fed by someone else, e.g. a `MarketDataSupervisor`
+        """
+        workers = [asyncio.create_task(self._work(reader)) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _work(self, reader: MarketDataReader) -> None:
+        while True:
+            kline = await reader.get()
+            if not isinstance(kline, KlineEvent) or kline.symbol not in self._symbols:
+                continue
+            symbol = kline.symbol
+            if symbol in self._busy:
+                # Another worker is on this symbol. Leave it the newest kline to pick up next
+                self._next[symbol] = kline
+                continue
+
+            self._busy.add(symbol)
+            try:
+                while kline is not None:
+                    await self.tick(symbol, kline)
+                    kline = self._next.pop(symbol, None)
+            finally:
+                self._busy.discard(symbol)
+
+    async def tick(self, symbol: str, kline: KlineEvent) -> None:
+        try:
+            state = self.states[symbol] if self.states else await load_state(symbol)
+            if len(state.get_active_orders()) > 2:
+                logger.error(f"There are more than 2 active {symbol} orders. Something is wrong")
+                return
+            await on_kline(state, kline, symbol)
+        except (HTTPError, SwapperError) as err:
+            # Don't let one symbol take the others down, its next kline will retry
+            logger.error(f"{symbol} tick failed: {err!r}")
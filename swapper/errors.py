@@ -0,0 +1,30 @@
+"""
+Errors the bot raises itself, apart from httpx's. They tell whether the request they stopped
+reached the exchange, which decides whether an order can be retried as is
+"""
+
+
+class SwapperError(Exception):
+    """
+    Base of the errors raised by the bot
+    """
+
+
+class RequestNotSent(SwapperError):
+    """
+    A request refused before it was sent. Nothing happened on the exchange, retrying is safe
+    """
+
+
+class RequestFateUnknown(SwapperError):
+    """
+    A request that was sent but got no response. The exchange may have executed it, so an order
+    isn't retried before its state is known
+    """
+
+
+class ExchangeError(SwapperError):
+    """
+    The exchange answered a request with an error, so it wasn't executed. Like
+    `httpx.HTTPStatusError` for the transports other than REST
+    """
@@ -0,0 +1,293 @@
+"""
+Trading rules of the symbols from exchangeInfo, compiled into integer bounds on the price in
+ticks, so orders the exchange would reject for a filter failure never leave the process
+"""
+import asyncio
+import logging
+import time
+from decimal import Decimal
+from decimal import ROUND_CEILING
+from decimal import ROUND_FLOOR
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from httpx import HTTPError
+
+from swapper.constants import EXCHANGE_INFO_MIN_REFRESH_INTERVAL
+from swapper.constants import EXCHANGE_INFO_TTL
+from swapper.constants import PRICE_PRECISION
+from swapper.constants import QUANTITY
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.errors import RequestNotSent
+from swapper.errors import SwapperError
+from swapper.metrics import ORDERS_REJECTED
+from swapper.prices import clear_price_precisions
+from swapper.prices import from_ticks
+from swapper.prices import set_price_precision
+from swapper.prices import tick_precision
+from swapper.prices import to_ticks
+
+logger = logging.getLogger(__name__)
+
+# Error code of orders the exchange rejected for a filter failure
+FILTER_FAILURE = -1013
+
+
+class OrderRejected(RequestNotSent):
+    """
+    An order failing a filter of its symbol. Raised instead of sending it
+    """
+
+    def __init__(self, filter_type: str, message: str) -> None:
+        super().__init__(f"Filter failure: {filter_type}. {message}")
+        self.filter_type = filter_type
+
+
+def _price_bound(value: Decimal, rounding: str, precision: int) -> int:
+    return int(value.scaleb(precision).to_integral_value(rounding))
+
+
+def _filters_precision(filters: List[dict]) -> int:
+    """
+    Decimal places of the tick size in the PRICE_FILTER of a symbol
+    """
+    for rule in filters:
+        if rule["filterType"] == "PRICE_FILTER" and Decimal(rule["tickSize"]):
+            return tick_precision(rule["tickSize"])
+    return PRICE_PRECISION
+
+
+class SymbolFilters:
+    """
+    The filters of a symbol that apply to limit orders of `QUANTITY`. The quantity is rounded to
+    the lot size once, and the notional limits become limits on the price for it, so checking an
+    order is a few integer comparisons
+    """
+
+    def __init__(
+            self,
+            symbol: str,
+            filters: List[dict],
+            quantity: Optional[Decimal] = None,
+            precision: Optional[int] = None,
+    ) -> None:
+        """
+        :param precision: Decimal places prices are counted in, by default those of the tick size
+        """
+        self.symbol = symbol
+        quantity = Decimal(str(QUANTITY)) if quantity is None else quantity
+        self.precision = _filters_precision(filters) if precision is None else precision
+        # Price units per tick of the symbol, more than 1 for ticks like 0.05
+        self.tick = 1
+        self.min_price = 0
+        self.max_price: Optional[int] = None
+        self.min_quantity = Decimal(0)
+        self.max_quantity: Optional[Decimal] = None
+        self.min_notional_price = 0
+        self.max_notional_price: Optional[int] = None
+        # Side -> bounds on the price relative to the average price, see
+        # `ExchangeInfo.set_reference_price`
+        self.percent_price: Dict[str, Tuple[float, float]] = {}
+
+        min_notional = max_notional = Decimal(0)
+        for rule in filters:
+            filter_type = rule["filterType"]
+            if filter_type == "PRICE_FILTER":
+                self.tick = max(to_ticks(rule["tickSize"], self.precision), 1)
+                self.min_price = to_ticks(rule["minPrice"], self.precision)
+                self.max_price = to_ticks(rule["maxPrice"], self.precision) or None
+            elif filter_type == "LOT_SIZE":
+                step = Decimal(rule["stepSize"])
+                if step:
+                    quantity = quantity // step * step
+                self.min_quantity = Decimal(rule["minQty"])
+                self.max_quantity = Decimal(rule["maxQty"]) or None
+            elif filter_type in ("NOTIONAL", "MIN_NOTIONAL"):
+                min_notional = Decimal(rule["minNotional"])
+                max_notional = Decimal(rule.get("maxNotional", 0))
+            elif filter_type == "PERCENT_PRICE_BY_SIDE":
+                self.percent_price[SIDE_BID] = (
+                    float(rule["bidMultiplierDown"]), float(rule["bidMultiplierUp"])
+                )
+                self.percent_price[SIDE_ASK] = (
+                    float(rule["askMultiplierDown"]), float(rule["askMultiplierUp"])
+                )
+            elif filter_type == "PERCENT_PRICE":
+                bounds = (float(rule["multiplierDown"]), float(rule["multiplierUp"]))
+                self.percent_price = {SIDE_BID: bounds, SIDE_ASK: bounds}
+
+        self.quantity = quantity
+        # As the exchange gets it, without trailing zeros
+        self.quantity_text = format(quantity.normalize(), "f")
+        self.quantity_valid = quantity > 0 and quantity >= self.min_quantity and (
+            self.max_quantity is None or quantity <= self.max_quantity
+        )
+        if quantity and min_notional:
+            self.min_notional_price = _price_bound(
+                min_notional / quantity, ROUND_CEILING, self.precision
+            )
+        if quantity and max_notional:
+            self.max_notional_price = _price_bound(
+                max_notional / quantity, ROUND_FLOOR, self.precision
+            )
+
+    def round_price(self, side: str, price: int) -> int:
+        """
+        Round a price in ticks to the tick size of the symbol, away from the market: bids down
+        and asks up
+        """
+        if self.tick == 1:
+            return price
+        if side == SIDE_BID:
+            return price // self.tick * self.tick
+        return -(-price // self.tick) * self.tick
+
+    def check(self, side: str, price: int, reference: Optional[int] = None) -> None:
+        """
+        Check an order at a price in ticks, already rounded, passes every filter
+        :param reference: Average price in ticks for `PERCENT_PRICE_BY_SIDE`. Not checked without
+        :raises OrderRejected: With the first filter it fails
+        """
+        if price < self.min_price or (self.max_price is not None and price > self.max_price):
+            raise OrderRejected(
+                "PRICE_FILTER",
+                f"{self.symbol} price {from_ticks(price, self.precision)} is out of range",
+            )
+        if not self.quantity_valid:
+            raise OrderRejected(
+                "LOT_SIZE", f"{self.symbol} quantity {self.quantity_text} is out of range"
+            )
+        if price < self.min_notional_price or (
+                self.max_notional_price is not None and price > self.max_notional_price
+        ):
+            raise OrderRejected(
+                "NOTIONAL", f"{self.symbol} order of {self.quantity_text} at "
+                f"{from_ticks(price, self.precision)} is out of range"
+            )
+        bounds = self.percent_price.get(side)
+        if bounds is not None and reference:
+            down, up = bounds
+            if not reference * down <= price <= reference * up:
+                raise OrderRejected(
+                    "PERCENT_PRICE_BY_SIDE", f"{self.symbol} {side} price "
+                    f"{from_ticks(price, self.precision)} is too far from "
+                    f"{from_ticks(reference, self.precision)}"
+                )
+
+
+class ExchangeInfo:
+    """
+    Filters of the symbols traded, seeded from the exchangeInfo fetched on startup. `run()`
+    fetches them again every `ttl` seconds, and right after the exchange rejected an order for a
+    filter failure, which means they changed
+    """
+
+    def __init__(
+            self,
+            ttl: float = EXCHANGE_INFO_TTL,
+            min_refresh_interval: float = EXCHANGE_INFO_MIN_REFRESH_INTERVAL,
+    ) -> None:
+        """
+        :param min_refresh_interval: Seconds between two fetches, however many orders the
+        exchange rejects
+        """
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self._filters: Dict[str, SymbolFilters] = {}
+        self._reference: Dict[str, int] = {}
+        self._stale: Optional[asyncio.Event] = None
+
+    def clear(self) -> None:
+        self._filters.clear()
+        self._reference.clear()
+        self.loaded_at = None
+        clear_price_precisions()
+
+    def load(self, exchange_info: dict) -> None:
+        """
+        Compile the filters of every symbol in an exchangeInfo response, and count the prices of
+        every symbol in the decimal places of its tick size
+        """
+        for info in exchange_info["symbols"]:
+            symbol, filters = info["symbol"], info.get("filters", [])
+            precision = _filters_precision(filters)
+            in_use = set_price_precision(symbol, precision)
+            if in_use < precision:
+                logger.warning(
+                    f"{symbol} tick size now has {precision} decimal places, prices stay in "
+                    f"{in_use} until restarted"
+                )
+            self._filters[symbol] = SymbolFilters(symbol, filters, precision=in_use)
+        self.loaded_at = time.monotonic()
+
+    def get(self, symbol: str) -> Optional[SymbolFilters]:
+        return self._filters.get(symbol)
+
+    def set_reference_price(self, symbol: str, price: int) -> None:
+        """
+        Price in ticks the `PERCENT_PRICE_BY_SIDE` filter is checked against. The exchange uses
+        the average price of the last minutes, the latest kline is close enough for orders that
+        are priced off it
+        """
+        self._reference[symbol] = price
+
+    def prepare(self, symbol: str, side: str, price: int) -> Tuple[int, Union[str, float]]:
+        """
+        Round an order to the filters of its symbol and check it passes them. Orders of symbols
+        without filters loaded are sent as they are
+        :param price: In ticks
+        :return: The price in ticks and the quantity to send
+        :raises OrderRejected: Counted in `swapper_orders_rejected_total`
+        """
+        filters = self._filters.get(symbol)
+        if filters is None:
+            return price, QUANTITY
+        price = filters.round_price(side, price)
+        try:
+            filters.check(side, price, self._reference.get(symbol))
+        except OrderRejected as err:
+            ORDERS_REJECTED.labels(err.filter_type).inc()
+            raise
+        return price, filters.quantity_text
+
+    def invalidate(self, reason: str) -> None:
+        """
+        Fetch the filters again as soon as `min_refresh_interval` allows
+        """
+        logger.warning(f"Order rejected by the exchange: {reason}. Refreshing exchange info")
+        if self._stale is not None:
+            self._stale.set()
+
+    async def run(self, fetch: Callable[[List[str]], Awaitable[dict]]) -> None:
+        """
+        Keep the filters of the loaded symbols fresh
+        :param fetch: Gets the exchangeInfo of symbols, `swapper.service.get_exchange_info`
+        """
+        self._stale = asyncio.Event()
+        while True:
+            expires_in = 0.0
+            if self.loaded_at is not None:
+                expires_in = max(self.loaded_at + self.ttl - time.monotonic(), 0.0)
+            try:
+                await asyncio.wait_for(self._stale.wait(), expires_in)
+            except asyncio.TimeoutError:
+                pass
+            self._stale.clear()
+            try:
+                self.load(await fetch(list(self._filters)))
+                self.refreshes += 1
+                logger.info(f"Exchange info of {len(self._filters)} symbols refreshed")
+            except (HTTPError, SwapperError) as err:
+                logger.error(f"Refreshing exchange info failed: {err!r}")
+            await asyncio.sleep(self.min_refresh_interval)
+
+
+exchange_info = ExchangeInfo()
@@ -0,0 +1,612 @@
+"""
+Local stand-in for Binance to load test the bot offline.
+
+Serves the REST endpoints the bot uses on one port, and kline and user data streams and the
+WebSocket API on another. Signed requests are verified with SECRET_KEY the same way the bot
+signs them.
+
+Usage: python -m swapper.fake_exchange [--latency-ms 20] [--error-rate 0.01] [--rate-limit 1200]
+
+The command prints the environment variables that point `swapper.constants` at the fake exchange
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import secrets
+import tempfile
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from decimal import Decimal
+from decimal import InvalidOperation
+from http import HTTPStatus
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from urllib.parse import parse_qsl
+
+import websockets
+
+from swapper.constants import OrderStatus
+from swapper.constants import SIDE_BID
+
+logger = logging.getLogger(__name__)
+
+Response = Tuple[int, object, Dict[str, str]]
+
+
+@dataclass
+class FakeExchangeConfig:
+    secret_key: str = ""
+    # Added to every REST response, with up to the same amount of random jitter
+    latency_ms: float = 0.0
+    # Share of REST requests answered with a 503
+    error_rate: float = 0.0
+    # Requests allowed per rate limit window before answering with a 429, 0 to disable
+    rate_limit: int = 0
+    rate_limit_window: float = 60.0
+    # Seconds between kline updates
+    tick_interval: float = 0.25
+    start_price: float = 23000.0
+    # Standard deviation of the price random walk per tick, relative to the price
+    volatility: float = 0.0005
+    # Order book levels quoted on each side, 1 bps apart
+    depth_levels: int = 10
+    recv_window: int = 5000
+    # Filters of every symbol, orders failing them are rejected
+    tick_size: str = "0.01"
+    min_notional: str = "5"
+
+
+@dataclass
+class _MarketSubscriber:
+    websocket: websockets.WebSocketServerProtocol
+    combined: bool
+    streams: Set[str] = field(default_factory=set)
+
+
+class FakeExchange:
+    def __init__(self, config: Optional[FakeExchangeConfig] = None) -> None:
+        self.config = config or FakeExchangeConfig(secret_key=os.getenv("SECRET_KEY", ""))
+        self.orders: Dict[int, dict] = {}
+        self.prices: Dict[str, float] = {}
+        self.klines: Dict[str, dict] = {}
+        # Symbol -> bid and ask levels, price -> quantity
+        self.depth: Dict[str, Tuple[Dict[str, str], Dict[str, str]]] = {}
+        self.depth_update_ids: Dict[str, int] = {}
+        self.listen_keys: Set[str] = set()
+        self.requests = 0
+        self._order_ids = itertools.count(1)
+        self._market_subscribers: List[_MarketSubscriber] = []
+        self._user_subscribers: Set[websockets.WebSocketServerProtocol] = set()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._servers: list = []
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self._ticking: Optional[asyncio.Task] = None
+        self.rest_port: Optional[int] = None
+        self.ws_port: Optional[int] = None
+        self.ws_api_methods = {
+            "order.place": self._place_order,
+            "order.cancel": self._cancel_order,
+            "order.cancelReplace": self._cancel_replace_order,
+            "allOrders": self._all_orders,
+        }
+        self.routes = {
+            ("GET", "/api/v3/ping"): (False, self._ping),
+            ("GET", "/api/v3/time"): (False, self._time),
+            ("GET", "/api/v3/exchangeInfo"): (False, self._exchange_info),
+            ("GET", "/api/v3/depth"): (False, self._depth_snapshot),
+            ("POST", "/api/v3/order"): (True, self._place_order),
+            ("DELETE", "/api/v3/order"): (True, self._cancel_order),
+            ("GET", "/api/v3/allOrders"): (True, self._all_orders),
+            ("POST", "/api/v3/order/cancelReplace"): (True, self._cancel_replace_order),
+            ("POST", "/api/v3/userDataStream"): (False, self._create_listen_key),
+            ("PUT", "/api/v3/userDataStream"): (False, self._keepalive_listen_key),
+        }
+
+    @property
+    def env(self) -> Dict[str, str]:
+        """
+        Environment variables pointing `swapper.constants` at this exchange
+        """
+        return {
+            "BINANCE_REST_API_BASE_URL": f"http://127.0.0.1:{self.rest_port}/api/v3",
+            "BINANCE_WS_MARKET_STREAM_URL": f"ws://127.0.0.1:{self.ws_port}/ws/btcusdt@kline_1m",
+            "BINANCE_WS_COMBINED_STREAM_URL": f"ws://127.0.0.1:{self.ws_port}/stream",
+            "BINANCE_WS_USER_STREAM_URL": f"ws://127.0.0.1:{self.ws_port}/ws",
+            "BINANCE_WS_API_URL": f"ws://127.0.0.1:{self.ws_port}/ws-api/v3",
+            # Order IDs start over with every exchange, so don't resume the journal of another
+            "ORDER_JOURNAL_PATH": os.path.join(
+                tempfile.gettempdir(), f"swapper-orders-{os.getpid()}-{self.rest_port}.db"
+            ),
+        }
+
+    async def start(self, host: str = "127.0.0.1", rest_port: int = 0, ws_port: int = 0) -> None:
+        rest_server = await asyncio.start_server(self._handle_http, host, rest_port)
+        ws_server = await websockets.serve(self._handle_ws, host, ws_port)
+        self._servers = [rest_server, ws_server]
+        self.rest_port = rest_server.sockets[0].getsockname()[1]
+        self.ws_port = next(iter(ws_server.sockets)).getsockname()[1]
+        self._ticking = asyncio.create_task(self._tick_forever())
+
+    async def close(self) -> None:
+        if self._ticking:
+            self._ticking.cancel()
+        for server in self._servers:
+            server.close()
+        for writer in self._connections:
+            writer.close()
+        for server in self._servers:
+            await server.wait_closed()
+
+    # REST
+
+    async def _handle_http(
+            self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload, extra_headers = await self.handle(
+                    method, target, headers, body.decode()
+                )
+                data = json.dumps(payload).encode()
+                head = "".join(
+                    f"{name}: {value}\r\n" for name, value in {
+                        "Content-Type": "application/json",
+                        "Content-Length": str(len(data)),
+                        **extra_headers,
+                    }.items()
+                )
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n{head}\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def handle(self, method: str, target: str, headers: dict, body: str) -> Response:
+        """
+        Answer one REST request
+        """
+        self.requests += 1
+        if self.config.latency_ms:
+            await asyncio.sleep(self.config.latency_ms * (1 + random.random()) / 1000)
+
+        now = time.monotonic()
+        if now - self._window_start >= self.config.rate_limit_window:
+            self._window_start, self._window_requests = now, 0
+        self._window_requests += 1
+        weight_headers = {"X-MBX-USED-WEIGHT-1M": str(self._window_requests)}
+        if self.config.rate_limit and self._window_requests > self.config.rate_limit:
+            retry_after = self.config.rate_limit_window - (now - self._window_start)
+            return 429, _error(-1003, "Too many requests."), {
+                **weight_headers, "Retry-After": str(max(1, int(retry_after)))
+            }
+        if random.random() < self.config.error_rate:
+            return 503, _error(-1001, "Internal error."), weight_headers
+
+        path, _, query = target.partition("?")
+        route = self.routes.get((method, path))
+        if route is None:
+            return 404, _error(-1000, "Not found."), weight_headers
+        signed, handler = route
+        params = dict(parse_qsl(query))
+        params.update(parse_qsl(body))
+        if "userDataStream" in path or signed:
+            if not headers.get("x-mbx-apikey"):
+                return 401, _error(-2015, "Invalid API-key, IP, or permissions."), weight_headers
+        if signed:
+            error = self._verify(query, body, params)
+            if error:
+                return 400, error, weight_headers
+        status, payload = handler(params)
+        return status, payload, weight_headers
+
+    def _verify(self, query: str, body: str, params: dict) -> Optional[dict]:
+        unsigned_query = "&".join(
+            part for part in query.split("&") if part and not part.startswith("signature=")
+        )
+        signature = hmac.new(
+            self.config.secret_key.encode("utf-8"),
+            (unsigned_query + body).encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+        if not hmac.compare_digest(signature, params.get("signature", "")):
+            return _error(-1022, "Signature for this request is not valid.")
+        return self._verify_timestamp(params)
+
+    def _verify_timestamp(self, params: dict) -> Optional[dict]:
+        timestamp = int(params.get("timestamp", 0))
+        recv_window = int(params.get("recvWindow", self.config.recv_window))
+        server_time = _now_ms()
+        if timestamp >= server_time + 1000 or server_time - timestamp > recv_window:
+            return _error(-1021, "Timestamp for this request is outside of the recvWindow.")
+        return None
+
+    def _ping(self, params: dict) -> Tuple[int, object]:
+        return 200, {}
+
+    def _time(self, params: dict) -> Tuple[int, object]:
+        return 200, {"serverTime": _now_ms()}
+
+    def _exchange_info(self, params: dict) -> Tuple[int, object]:
+        symbols = json.loads(params["symbols"]) if "symbols" in params else [params["symbol"]]
+        return 200, {
+            "timezone": "UTC",
+            "serverTime": _now_ms(),
+            "symbols": [
+                {
+                    "symbol": symbol,
+                    "status": "TRADING",
+                    "baseAsset": symbol[:-4],
+                    "quoteAsset": symbol[-4:],
+                    "filters": [
+                        {"filterType": "PRICE_FILTER", "minPrice": self.config.tick_size,
+                         "maxPrice": "1000000.00000000", "tickSize": self.config.tick_size},
+                        {"filterType": "LOT_SIZE", "minQty": "0.00001000",
+                         "maxQty": "9000.00000000", "stepSize": "0.00001000"},
+                        {"filterType": "NOTIONAL", "minNotional": self.config.min_notional,
+                         "applyMinToMarket": True, "maxNotional": "9000000.00000000",
+                         "applyMaxToMarket": False, "avgPriceMins": 5},
+                    ],
+                }
+                for symbol in symbols
+            ],
+        }
+
+    def _depth_snapshot(self, params: dict) -> Tuple[int, object]:
+        symbol = params.get("symbol")
+        limit = int(params.get("limit", 100))
+        bids, asks = self.depth.get(symbol, ({}, {}))
+        return 200, {
+            "lastUpdateId": self.depth_update_ids.get(symbol, 0),
+            "bids": sorted(bids.items(), key=lambda level: -float(level[0]))[:limit],
+            "asks": sorted(asks.items(), key=lambda level: float(level[0]))[:limit],
+        }
+
+    def _place_order(self, params: dict) -> Tuple[int, object]:
+        try:
+            symbol, side, price = params["symbol"], params["side"], float(params["price"])
+            quantity = params["quantity"]
+            exact_price = Decimal(params["price"])
+            notional = exact_price * Decimal(quantity)
+        except (KeyError, ValueError, InvalidOperation):
+            return 400, _error(-1102, "Mandatory parameter was not sent or is malformed.")
+        if exact_price <= 0 or exact_price % Decimal(self.config.tick_size):
+            return 400, _error(-1013, "Filter failure: PRICE_FILTER")
+        if notional < Decimal(self.config.min_notional):
+            return 400, _error(-1013, "Filter failure: NOTIONAL")
+        now = _now_ms()
+        order = {
+            "symbol": symbol,
+            "orderId": next(self._order_ids),
+            "clientOrderId": secrets.token_hex(8),
+            "transactTime": now,
+            "price": f"{price:.8f}",
+            "origQty": quantity,
+            "executedQty": "0.00000000",
+            "status": OrderStatus.NEW.value,
+            "timeInForce": params.get("timeInForce", "GTC"),
+            "type": params.get("type", "LIMIT"),
+            "side": side,
+            "time": now,
+            "updateTime": now,
+        }
+        self.orders[order["orderId"]] = order
+        self._publish_execution(order)
+        self._match(symbol)
+        return 200, dict(order)
+
+    def _cancel_order(self, params: dict) -> Tuple[int, object]:
+        order = self.orders.get(int(params.get("orderId", 0)))
+        if order is None or order["status"] != OrderStatus.NEW.value:
+            return 400, _error(-2011, "Unknown order sent.")
+        order["status"] = OrderStatus.CANCELED.value
+        order["updateTime"] = order["transactTime"] = _now_ms()
+        self._publish_execution(order)
+        return 200, dict(order)
+
+    def _cancel_replace_order(self, params: dict) -> Tuple[int, object]:
+        status, cancel_response = self._cancel_order({"orderId": params.get("cancelOrderId")})
+        if status != 200:
+            return 400, {**_error(-2022, "Order cancel-replace failed."), "data": {
+                "cancelResult": "FAILURE",
+                "newOrderResult": "NOT_ATTEMPTED",
+                "cancelResponse": cancel_response,
+                "newOrderResponse": None,
+            }}
+        status, new_order_response = self._place_order(params)
+        if status != 200:
+            return 409, {**_error(-2021, "Order cancel-replace partially failed."), "data": {
+                "cancelResult": "SUCCESS",
+                "newOrderResult": "FAILURE",
+                "cancelResponse": cancel_response,
+                "newOrderResponse": new_order_response,
+            }}
+        return 200, {
+            "cancelResult": "SUCCESS",
+            "newOrderResult": "SUCCESS",
+            "cancelResponse": cancel_response,
+            "newOrderResponse": new_order_response,
+        }
+
+    def _all_orders(self, params: dict) -> Tuple[int, object]:
+        start_time = int(params.get("startTime", 0))
+        end_time = int(params.get("endTime", _now_ms()))
+        from_order_id = int(params.get("orderId", 0))
+        orders = [
+            dict(order) for order in self.orders.values()
+            if order["symbol"] == params.get("symbol") and start_time <= order["time"] <= end_time
+            and order["orderId"] >= from_order_id
+        ]
+        return 200, orders[:int(params.get("limit", 500))]
+
+    def _create_listen_key(self, params: dict) -> Tuple[int, object]:
+        listen_key = secrets.token_hex(32)
+        self.listen_keys.add(listen_key)
+        return 200, {"listenKey": listen_key}
+
+    def _keepalive_listen_key(self, params: dict) -> Tuple[int, object]:
+        if params.get("listenKey") not in self.listen_keys:
+            return 400, _error(-1125, "This listenKey does not exist.")
+        return 200, {}
+
+    # Websockets
+
+    async def _handle_ws(self, websocket: websockets.WebSocketServerProtocol, *_) -> None:
+        path = websocket.path.strip("/")
+        if path == "ws-api/v3":
+            await self._handle_ws_api(websocket)
+            return
+        if path.startswith("ws/") and path[3:] in self.listen_keys:
+            self._user_subscribers.add(websocket)
+            try:
+                await websocket.wait_closed()
+            finally:
+                self._user_subscribers.discard(websocket)
+            return
+
+        subscriber = _MarketSubscriber(websocket, combined=path.startswith("stream"))
+        if path.startswith("ws/"):
+            subscriber.streams.add(path[3:])
+        self._market_subscribers.append(subscriber)
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                if request.get("method") == "SUBSCRIBE":
+                    subscriber.streams.update(request.get("params", []))
+                elif request.get("method") == "UNSUBSCRIBE":
+                    subscriber.streams.difference_update(request.get("params", []))
+                await websocket.send(json.dumps({"result": None, "id": request.get("id")}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._market_subscribers.remove(subscriber)
+
+    async def _handle_ws_api(self, websocket: websockets.WebSocketServerProtocol) -> None:
+        async def respond(request: dict) -> None:
+            status, payload = await self.handle_ws_api(request)
+            response = {"id": request.get("id"), "status": status}
+            response["result" if status == 200 else "error"] = payload
+            await websocket.send(json.dumps(response))
+
+        responding: Set[asyncio.Task] = set()
+        try:
+            async for message in websocket:
+                # Answer concurrently, like the exchange does
+                task = asyncio.create_task(respond(json.loads(message)))
+                responding.add(task)
+                task.add_done_callback(responding.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in responding:
+                task.cancel()
+
+    async def handle_ws_api(self, request: dict) -> Tuple[int, object]:
+        """
+        Answer one WebSocket API request
+        """
+        self.requests += 1
+        if self.config.latency_ms:
+            await asyncio.sleep(self.config.latency_ms * (1 + random.random()) / 1000)
+        handler = self.ws_api_methods.get(request.get("method"))
+        if handler is None:
+            return 400, _error(-1100, "Unknown method.")
+        params = dict(request.get("params", {}))
+        if not params.get("apiKey"):
+            return 401, _error(-2015, "Invalid API-key, IP, or permissions.")
+        signature = hmac.new(
+            self.config.secret_key.encode("utf-8"),
+            "&".join(
+                f"{key}={params[key]}" for key in sorted(params) if key != "signature"
+            ).encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+        if not hmac.compare_digest(signature, str(params.get("signature", ""))):
+            return 400, _error(-1022, "Signature for this request is not valid.")
+        error = self._verify_timestamp(params)
+        if error:
+            return 400, error
+        return handler(params)
+
+    async def _tick_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.tick_interval)
+            self.tick()
+
+    def tick(self) -> None:
+        """
+        Move the price of every subscribed symbol, publish klines and depth updates and fill
+        crossed orders
+        """
+        symbols = {
+            stream.split("@")[0].upper()
+            for subscriber in self._market_subscribers for stream in subscriber.streams
+        }
+        for symbol in symbols:
+            kline = self._next_kline(symbol)
+            event = {"e": "kline", "E": _now_ms(), "s": symbol, "k": kline}
+            self._broadcast(f"{symbol.lower()}@kline_1m", event)
+            self._broadcast(f"{symbol.lower()}@depth@100ms", self._next_depth(symbol))
+            self._match(symbol)
+
+    def _broadcast(self, stream: str, event: dict) -> None:
+        websockets.broadcast([
+            subscriber.websocket for subscriber in self._market_subscribers
+            if stream in subscriber.streams and not subscriber.combined
+        ], json.dumps(event))
+        websockets.broadcast([
+            subscriber.websocket for subscriber in self._market_subscribers
+            if stream in subscriber.streams and subscriber.combined
+        ], json.dumps({"stream": stream, "data": event}))
+
+    def _next_kline(self, symbol: str) -> dict:
+        price = self.prices.get(symbol, self.config.start_price)
+        price = max(0.01, price * (1 + random.gauss(0, self.config.volatility)))
+        self.prices[symbol] = price
+
+        open_time = _now_ms() // 60000 * 60000
+        kline = self.klines.get(symbol)
+        if kline is None or kline["t"] != open_time:
+            kline = {
+                "t": open_time, "T": open_time + 59999, "s": symbol, "i": "1m",
+                "o": f"{price:.8f}", "h": f"{price:.8f}", "l": f"{price:.8f}", "x": False,
+            }
+            self.klines[symbol] = kline
+        kline["h"] = f"{max(float(kline['h']), price):.8f}"
+        kline["l"] = f"{min(float(kline['l']), price):.8f}"
+        kline["c"] = f"{price:.8f}"
+        return dict(kline)
+
+    def _next_depth(self, symbol: str) -> dict:
+        """
+        Quote new levels around the price and return the depth update from the last ones
+        """
+        price = self.prices[symbol]
+        old_bids, old_asks = self.depth.get(symbol, ({}, {}))
+        bids, asks = (
+            {
+                f"{price * (1 + sign * level / 10000):.2f}": f"{random.uniform(0.01, 2):.8f}"
+                for level in range(1, self.config.depth_levels + 1)
+            }
+            for sign in (-1, 1)
+        )
+        first_update_id = self.depth_update_ids.get(symbol, 0) + 1
+        self.depth[symbol] = bids, asks
+        self.depth_update_ids[symbol] = first_update_id
+        return {
+            "e": "depthUpdate", "E": _now_ms(), "s": symbol,
+            "U": first_update_id, "u": first_update_id,
+            "b": _depth_diff(old_bids, bids), "a": _depth_diff(old_asks, asks),
+        }
+
+    def _match(self, symbol: str) -> None:
+        price = self.prices.get(symbol)
+        if price is None:
+            return
+        for order in self.orders.values():
+            if order["symbol"] != symbol or order["status"] != OrderStatus.NEW.value:
+                continue
+            order_price = float(order["price"])
+            if order_price >= price if order["side"] == SIDE_BID else order_price <= price:
+                order["status"] = OrderStatus.FILLED.value
+                order["executedQty"] = order["origQty"]
+                order["updateTime"] = _now_ms()
+                self._publish_execution(order)
+
+    def _publish_execution(self, order: dict) -> None:
+        event = json.dumps({
+            "e": "executionReport",
+            "E": _now_ms(),
+            "s": order["symbol"],
+            "c": order["clientOrderId"],
+            "S": order["side"],
+            "o": order["type"],
+            "f": order["timeInForce"],
+            "q": order["origQty"],
+            "p": order["price"],
+            "X": order["status"],
+            "i": order["orderId"],
+            "z": order["executedQty"],
+            "T": order["updateTime"],
+            "O": order["time"],
+        })
+        websockets.broadcast(self._user_subscribers, event)
+
+
+def _depth_diff(old: Dict[str, str], new: Dict[str, str]) -> List[List[str]]:
+    return [[price, quantity] for price, quantity in new.items() if old.get(price) != quantity] + [
+        [price, "0.00000000"] for price in old if price not in new
+    ]
+
+
+def _error(code: int, msg: str) -> dict:
+    return {"code": code, "msg": msg}
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+async def serve(config: FakeExchangeConfig, rest_port: int, ws_port: int) -> None:
+    exchange = FakeExchange(config)
+    await exchange.start(rest_port=rest_port, ws_port=ws_port)
+    for name, value in exchange.env.items():
+        print(f"export {name}={value}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local fake Binance exchange")
+    parser.add_argument("--rest-port", type=int, default=8080)
+    parser.add_argument("--ws-port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="Requests per minute")
+    parser.add_argument("--tick-interval", type=float, default=0.25)
+    parser.add_argument("--tick-size", default="0.01", help="PRICE_FILTER tick size")
+    parser.add_argument("--min-notional", default="5", help="NOTIONAL minimum")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = FakeExchangeConfig(
+        secret_key=os.getenv("SECRET_KEY", ""),
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        tick_interval=args.tick_interval,
+        tick_size=args.tick_size,
+        min_notional=args.min_notional,
+    )
+    asyncio.run(serve(config, args.rest_port, args.ws_port))
+
+
+if __name__ == "__main__":
+    main()
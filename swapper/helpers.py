@@ -1,54 +1,105 @@
-from decimal import Decimal
-from typing import Optional
+from math import isqrt
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
 
 from swapper.constants import SIDE_ASK
 from swapper.constants import SIDE_BID
+from swapper.models import Order
+
+# Tick counts above this overflow int64 when squared
+MAX_INT64_SQUARE_ROOT = isqrt(2 ** 63 - 1)
 
 
-def calculate_bid_ask_spread(low_price: Decimal, high_price: Decimal) -> Decimal:
+def calculate_bid_ask_spread(low_price: int, high_price: int) -> float:
     """
-    Calculate the bid/ask spread for BTCUSDT.
+    Calculate the bid/ask spread for BTCUSDT, in percent of the low price.
     """
     # Make sure prices are not negative
     if low_price < 0 or high_price < 0:
         raise ValueError("Prices cannot be negative")
-    return Decimal((high_price - low_price) / low_price * 100)
+    return (high_price - low_price) / low_price * 100
 
 
-def calculate_bid_price_based_on_spread(low_price: Decimal, spread: Decimal) -> Decimal:
+def calculate_bid_price_based_on_spread(low_price: int, spread: float) -> int:
     """
     Calculate the bid price based on the spread. Should be lower than the price
     """
     # Make sure prices and spread are not negative
     if low_price < 0 or spread < 0:
         raise ValueError("Prices and spread cannot be negative")
-    return Decimal(low_price * (1 - spread / 100))
+    return round(low_price * (1 - spread / 100))
 
 
-def calculate_ask_price_based_on_spread(high_price: Decimal, spread: Decimal) -> Decimal:
+def calculate_ask_price_based_on_spread(high_price: int, spread: float) -> int:
     """
     Calculate the ask price based on the spread. Should be higher than the price
     """
     # Make sure prices and spread are not negative
     if high_price < 0 or spread < 0:
         raise ValueError("Prices and spread cannot be negative")
-    return Decimal(high_price * (1 + spread / 100))
+    return round(high_price * (1 + spread / 100))
 
 
-def order_at_risk(
-        bid_price: Optional[Decimal], ask_price: Optional[Decimal], order: dict
-) -> bool:
+def calculate_candle_prices(low_price: int, high_price: int) -> Tuple[int, int]:
     """
-    Check if the order is close to be filled.
+    Bid and ask price off the spread of the candle itself, worked out exactly: bid = 2 * low -
+    high and ask = high * high / low, rounded half to even
+    """
+    if low_price < 0 or high_price < 0:
+        raise ValueError("Prices cannot be negative")
+    if high_price < low_price:
+        raise ValueError("Prices and spread cannot be negative")
+    ask_price, remainder = divmod(high_price * high_price, low_price)
+    if 2 * remainder > low_price or (2 * remainder == low_price and ask_price % 2):
+        ask_price += 1
+    return 2 * low_price - high_price, ask_price
 
-    TODO: Can make this more efficient by checking if the order is within the spread or
-    use threshold
+
+def order_at_risk(bid_price: int, ask_price: int, order: Order) -> bool:
+    """
+    Check if the order is close to be filled. See `swapper.policy.RepricingPolicy` for a version
+    with a threshold
     """
     # Check prices are not negative
     if bid_price < 0 or ask_price < 0:
         raise ValueError("Prices cannot be negative")
-    if order["side"] == SIDE_BID:
-        return Decimal(order["price"]) <= bid_price
-    if order["side"] == SIDE_ASK:
-        return Decimal(order["price"]) >= ask_price
+    if order.side == SIDE_BID:
+        return order.price <= bid_price
+    if order.side == SIDE_ASK:
+        return order.price >= ask_price
     return False
+
+
+def calculate_prices_batch(
+        high_prices: Sequence, low_prices: Sequence
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Batch version of `calculate_bid_ask_spread()` and `calculate_candle_prices()` for many
+    candles or symbols at once
+    :param high_prices: High prices in ticks, anything `np.asarray` takes
+    :param low_prices: Low prices of the same candles
+    :return: Arrays of spreads, bid prices and ask prices in ticks
+    """
+    high_ticks = np.asarray(high_prices, dtype=np.int64)
+    low_ticks = np.asarray(low_prices, dtype=np.int64)
+    if (low_ticks < 0).any() or (high_ticks < 0).any():
+        raise ValueError("Prices cannot be negative")
+    if (high_ticks < low_ticks).any():
+        raise ValueError("Prices and spread cannot be negative")
+
+    spreads = (high_ticks - low_ticks) / low_ticks * 100
+    bid_ticks = 2 * low_ticks - high_ticks
+    if high_ticks.size and high_ticks.max() > MAX_INT64_SQUARE_ROOT:
+        # Square as Python ints so the ticks stay exact like `calculate_candle_prices()`
+        squares = high_ticks.astype(object) ** 2
+        ask_ticks = squares // low_ticks.astype(object)
+        remainders = squares % low_ticks.astype(object)
+    else:
+        ask_ticks, remainders = np.divmod(high_ticks * high_ticks, low_ticks)
+    ask_ticks += (2 * remainders > low_ticks) | (
+        (2 * remainders == low_ticks) & (ask_ticks % 2 == 1)
+    )
+    # Raises OverflowError if an ask price itself does not fit into int64
+    return spreads, bid_ticks, ask_ticks.astype(np.int64)
@@ -0,0 +1,212 @@
+"""
+Append-only journal of order updates in SQLite, so a restart picks up the orders it knew about
+instead of fetching them all again
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from swapper.constants import ORDER_HISTORY_SIZE
+from swapper.constants import ORDER_JOURNAL_COMPACT_INTERVAL
+from swapper.constants import ORDER_JOURNAL_FLUSH_INTERVAL
+from swapper.constants import ORDER_JOURNAL_PATH
+from swapper.constants import TERMINAL_ORDER_STATUSES
+from swapper.models import Order
+from swapper.prices import from_ticks
+from swapper.prices import price_precision
+from swapper.prices import to_ticks
+from swapper.state import State
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT,
+    order_id INTEGER NOT NULL,
+    side TEXT,
+    status TEXT,
+    price TEXT,
+    update_time INTEGER NOT NULL,
+    created_time INTEGER NOT NULL
+)
+"""
+
+
+class OrderJournal:
+    """
+    Every order update a State accepts is appended as a row. Appends only queue the row, `run()`
+    writes them in one transaction every `flush_interval` seconds on a thread of its own, so the
+    trading loop never waits for SQLite. In WAL mode with `synchronous=NORMAL` that's a write to the
+    end of the log without an fsync. A crash can lose the last updates. They're always the newest
+    ones, which the reconciliation on start fetches again.
+
+    `compact()` keeps the journal as small as the state it rebuilds: the last update of every
+    open order and of the newest `history_size` terminal orders of every symbol. Processes sharing
+    a journal pass `compact_interval=None` to all but one of them
+    """
+
+    def __init__(
+            self,
+            path: str = ORDER_JOURNAL_PATH,
+            history_size: int = ORDER_HISTORY_SIZE,
+            flush_interval: float = ORDER_JOURNAL_FLUSH_INTERVAL,
+            compact_interval: Optional[float] = ORDER_JOURNAL_COMPACT_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.history_size = history_size
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._rows: List[tuple] = []
+        # Only used by one thread at a time: the loop's before `run()` and after `close()`, the
+        # executor's in between
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    def append(self, orders: Iterable[Order]) -> None:
+        """
+        Queue order updates for the next `flush()`
+        """
+        self._rows.extend(
+            (
+                order.symbol, order.order_id, order.side, order.status,
+                from_ticks(order.price, price_precision(order.symbol))
+                if order.price is not None else None,
+                order.update_time, order.created_time,
+            )
+            for order in orders
+        )
+
+    def flush(self) -> None:
+        """
+        Write the queued updates in one transaction. They stay queued if it fails
+        """
+        self._write(compact=False)
+
+    def _take_rows(self) -> List[tuple]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def _write(self, compact: bool) -> None:
+        rows = self._take_rows()
+        try:
+            self._write_rows(rows, compact)
+        except sqlite3.Error:
+            # Ahead of the updates queued meanwhile, so they're written in order
+            self._rows[:0] = rows
+            raise
+
+    def _write_rows(self, rows: List[tuple], compact: bool) -> None:
+        if not rows and not compact:
+            return
+        try:
+            if rows:
+                self._connection.executemany(
+                    "INSERT INTO order_events "
+                    "(symbol, order_id, side, status, price, update_time, created_time) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            if compact:
+                self._compact()
+            self._connection.commit()
+        except sqlite3.Error:
+            self._connection.rollback()
+            raise
+
+    def replay(self, symbol: str) -> Iterator[Order]:
+        """
+        The updates of a symbol's orders in the order they were journaled
+        """
+        self.flush()
+        rows = self._connection.execute(
+            "SELECT order_id, side, status, price, symbol, update_time, created_time "
+            "FROM order_events WHERE symbol = ? ORDER BY seq",
+            (symbol,),
+        )
+        # Prices are journaled as decimals, so they read back right if the tick size changed
+        precision = price_precision(symbol)
+        for order_id, side, status, price, symbol, update_time, created_time in rows:
+            yield Order(
+                order_id, side, status,
+                to_ticks(price, precision) if price is not None else None, symbol,
+                update_time, created_time,
+            )
+
+    def load(self, symbol: str, state: Optional[State] = None) -> State:
+        """
+        Rebuild the state of a symbol. Updates it accepts from then on are journaled. Prices are
+        read in the precision of the symbol, so load its exchange info first
+        :param state: Rebuild into this state instead of a new one
+        """
+        state = State() if state is None else state
+        state.add_orders(self.replay(symbol))
+        state.journal = self
+        logger.info(
+            f"Loaded {len(state.orders)} open and {len(state.history)} closed {symbol} orders "
+            f"from {self.path}"
+        )
+        return state
+
+    def compact(self) -> None:
+        """
+        Drop the updates that a later update of the same order replaced, and the terminal orders
+        older than the newest `history_size` of their symbol, which a rebuilt state would evict
+        """
+        self._write(compact=True)
+
+    def _compact(self) -> None:
+        self._connection.execute(
+            "DELETE FROM order_events WHERE seq NOT IN "
+            "(SELECT MAX(seq) FROM order_events GROUP BY symbol, order_id)"
+        )
+        statuses = sorted(TERMINAL_ORDER_STATUSES)
+        self._connection.execute(
+            "DELETE FROM order_events WHERE seq IN ("
+            "SELECT seq FROM ("
+            "SELECT seq, ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY order_id DESC) AS newer "
+            f"FROM order_events WHERE status IN ({', '.join('?' * len(statuses))})"
+            ") WHERE newer > ?)",
+            (*statuses, self.history_size),
+        )
+
+    async def run(self) -> None:
+        """
+        Flush the queued updates every `flush_interval` seconds and compact every
+        `compact_interval` seconds, unless it's None
+        """
+        loop = asyncio.get_running_loop()
+        compacted_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            compact = (
+                self.compact_interval is not None
+                and time.monotonic() - compacted_at >= self.compact_interval
+            )
+            # Taken on the loop, so appends meanwhile go to the next batch
+            rows = self._take_rows()
+            try:
+                await loop.run_in_executor(self._executor, self._write_rows, rows, compact)
+            except sqlite3.Error as err:
+                # E.g. another process holds the lock for too long. Retried on the next flush
+                logger.error(f"Writing the order journal failed: {err!r}")
+                self._rows[:0] = rows
+                continue
+            if compact:
+                compacted_at = time.monotonic()
+
+    def close(self) -> None:
+        # Waits for a write `run()` was cancelled during
+        self._executor.shutdown()
+        self.flush()
+        self._connection.close()
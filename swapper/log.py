@@ -0,0 +1,116 @@
+"""
+Logging that never blocks the event loop. Records are put on a bounded queue as they are, and a
+background thread formats and writes them, as JSON lines by default. Log calls on the hot path
+pass their fields as a mapping, e.g. `logger.info("Placed %(order_id)s", {"order_id": 1})`, so
+nothing is formatted on the loop and every field ends up in the JSON line
+"""
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from typing import IO
+from typing import Mapping
+from typing import Optional
+
+from swapper.constants import LOG_FORMAT
+from swapper.constants import LOG_LEVEL
+from swapper.constants import LOG_QUEUE_SIZE
+from swapper.constants import LOG_SAMPLE_EVERY
+from swapper.metrics import LOG_RECORDS_DROPPED
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, with the fields of mapping arguments next to the message
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if isinstance(record.args, Mapping):
+            event.update(record.args)
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            event["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(event, default=str)
+
+
+class NonBlockingHandler(QueueHandler):
+    """
+    Hands records to the queue of a `LogListener` without formatting them, unlike
+    `QueueHandler`, which formats on the calling thread. Records are dropped and counted in
+    `swapper_log_records_dropped_total` when the queue is full, and only one in `sample_every`
+    records below WARNING is kept
+    """
+
+    def __init__(self, log_queue: queue.Queue, sample_every: int = LOG_SAMPLE_EVERY) -> None:
+        super().__init__(log_queue)
+        self.sample_every = sample_every
+        self._sampled = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments are formatted later on the listener thread, so they must not change after
+        # the call. The hot path only logs numbers and strings
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.sample_every > 1 and record.levelno < logging.WARNING:
+            self._sampled += 1
+            if self._sampled % self.sample_every:
+                LOG_RECORDS_DROPPED.labels("sampled").inc()
+                return
+        self.enqueue(record)
+
+
+class LogListener(QueueListener):
+    """
+    Formats and writes the records of the queue on a background thread
+    """
+
+    def enqueue_sentinel(self) -> None:
+        # Waits for room, a full queue mustn't lose the records still in it on shutdown
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(
+        level: str = LOG_LEVEL,
+        log_format: str = LOG_FORMAT,
+        stream: Optional[IO[str]] = None,
+        queue_size: int = LOG_QUEUE_SIZE,
+        sample_every: int = LOG_SAMPLE_EVERY,
+) -> LogListener:
+    """
+    Route all logging through a `NonBlockingHandler` on the root logger, replacing its handlers,
+    and start the thread writing the records. Stop the returned listener on exit to write the
+    records still queued
+    :param log_format: "json" for JSON lines, "text" for the format of `logging.basicConfig`
+    :param stream: Where the records are written, stderr by default
+    """
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingHandler(log_queue, sample_every))
+    root.setLevel(level)
+
+    listener = LogListener(log_queue, output)
+    listener.start()
+    return listener
@@ -0,0 +1,149 @@
+"""
+Reads market data off the websocket independently from the trading loop
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import websockets
+
+from swapper.clock import clock
+from swapper.decode import decode_kline
+from swapper.decode import loads
+from swapper.metrics import STAGE_SECONDS
+from swapper.models import KlineEvent
+from swapper.orderbook import get_book
+
+logger = logging.getLogger(__name__)
+
+Frame = Union[KlineEvent, dict]
+
+
+@dataclass
+class MarketDataStats:
+    frames_received: int = 0
+    # Frames replaced by a newer one of the same stream before the trading loop read them
+    frames_conflated: int = 0
+    frames_consumed: int = 0
+    # Seconds between a frame being received and the trading loop reading it
+    last_age: float = 0.0
+    max_age: float = 0.0
+    total_age: float = 0.0
+
+    @property
+    def avg_age(self) -> float:
+        if not self.frames_consumed:
+            return 0.0
+        return self.total_age / self.frames_consumed
+
+
+class MarketDataReader:
+    """
+    Drains the websocket continuously and keeps only the latest frame of every stream, so the
+    trading loop always prices off the freshest data no matter how long its REST work takes
+    """
+
+    def __init__(self, websocket: Optional[websockets.WebSocketClientProtocol] = None) -> None:
+        """
+        :param websocket: The websocket `run()` reads. Leave out when frames are published by a
+        `swapper.supervisor.MarketDataSupervisor` instead
+        """
+        self.websocket = websocket
+        self.stats = MarketDataStats()
+        # Stream name -> (time received, frame). Streams are consumed in the order they got data
+        self._latest: "OrderedDict[Optional[str], Tuple[float, Frame]]" = OrderedDict()
+        self._updated = asyncio.Event()
+        self._error: Optional[BaseException] = None
+
+    def publish(self, data: dict) -> None:
+        """
+        Store a parsed frame, replacing the unread one of the same stream. Kline events are kept
+        as `KlineEvent` records, anything else as is
+        """
+        if "stream" in data and "data" in data:
+            # Combined stream envelope
+            key, data = data["stream"], data["data"]
+        else:
+            key = data.get("s")
+
+        if "E" in data:
+            # Exchange event time to now, on the clock corrected for server time
+            STAGE_SECONDS.labels("receive").observe((clock.now_ms() - data["E"]) / 1000)
+        if data.get("e") == "depthUpdate":
+            # Every diff counts, so they go to the order book as they come instead of being
+            # conflated
+            get_book(data["s"]).apply(data)
+            return
+        self.put(key, decode_kline(data) if "k" in data else data)
+
+    def put(self, key: Optional[str], frame: Frame) -> None:
+        """
+        Store a decoded frame of a stream, replacing its unread one
+        """
+        if key in self._latest:
+            self.stats.frames_conflated += 1
+        self._latest[key] = (time.monotonic(), frame)
+        self._updated.set()
+
+    def parse(self, message: Union[bytes, str]) -> Optional[dict]:
+        """
+        Parse a websocket message. Responses to requests aren't market data and give None
+        """
+        self.stats.frames_received += 1
+        with STAGE_SECONDS.labels("decode").time():
+            data = loads(message)
+        if "id" in data and ("result" in data or "error" in data):
+            # Response to a SUBSCRIBE request
+            if data.get("error"):
+                logger.warning(f"Market data request failed: {data['error']}")
+            return None
+        return data
+
+    async def run(self) -> None:
+        """
+        Read the websocket until it fails. The error is raised to whoever waits in `get()`
+        """
+        try:
+            while True:
+                data = self.parse(await self.websocket.recv())
+                if data is not None:
+                    self.publish(data)
+                    # Let the trading loop pick the frame up if it is waiting for one
+                    await asyncio.sleep(0)
+        except Exception as err:
+            self._error = err
+            self._updated.set()
+
+    async def wait_for_data(self) -> None:
+        """
+        Wait until there is a frame to read, without reading it
+        """
+        while not self._latest:
+            if self._error is not None:
+                raise self._error
+            self._updated.clear()
+            await self._updated.wait()
+
+    async def get(self) -> Frame:
+        """
+        Wait for the latest unread frame. With several streams, the one waiting longest goes first
+        """
+        while not self._latest:
+            if self._error is not None:
+                raise self._error
+            self._updated.clear()
+            await self._updated.wait()
+
+        _, (received_at, data) = self._latest.popitem(last=False)
+        age = time.monotonic() - received_at
+        self.stats.frames_consumed += 1
+        self.stats.last_age = age
+        self.stats.total_age += age
+        self.stats.max_age = max(self.stats.max_age, age)
+        STAGE_SECONDS.labels("wait").observe(age)
+        return data
@@ -0,0 +1,327 @@
+"""
+In-process metrics: latency histograms of the trading stages and counters of REST calls.
+Exported in the Prometheus text format over HTTP or dumped to the log periodically
+"""
+import asyncio
+import logging
+import time
+from abc import ABC
+from abc import abstractmethod
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from swapper.constants import METRICS_HOST
+from swapper.constants import METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from 50µs to 10s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, histogram: "HistogramChild") -> None:
+        self._histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._started)
+
+
+class HistogramChild:
+    """
+    Histogram of one set of label values. Observing is a bisect and three additions
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # The last count is for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """
+        Context manager that observes the time spent in it
+        """
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile, inf if it's above the largest bucket
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    @abstractmethod
+    def _new_child(self):
+        """
+        The value of one set of label values
+        """
+
+    def labels(self, *values: str):
+        """
+        The metric of the given label values. Keep the result around on hot paths
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _format_labels(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    @abstractmethod
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        """
+        The exposition lines of one child
+        """
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Tuple[str, ...] = (),
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def _render_child(self, values: Tuple[str, ...], child: HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = self._format_labels(values, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._format_labels(values)} {child.sum}")
+        lines.append(f"{self.name}_count{self._format_labels(values)} {child.count}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def _render_child(self, values: Tuple[str, ...], child: CounterChild) -> List[str]:
+        return [f"{self.name}_total{self._format_labels(values)} {child.value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def _render_child(self, values: Tuple[str, ...], child: GaugeChild) -> List[str]:
+        return [f"{self.name}{self._format_labels(values)} {child.value}"]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self.metrics:
+            metric._children.clear()
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "swapper_stage_seconds",
+    "Time spent in each stage from a kline arriving to orders reaching the exchange",
+    ("stage",),
+))
+REST_REQUESTS = registry.register(Counter(
+    "swapper_rest_requests", "REST responses by endpoint and status code", ("endpoint", "status"),
+))
+REST_ERRORS = registry.register(Counter(
+    "swapper_rest_errors", "REST requests that got no response, by error", ("endpoint", "error"),
+))
+RETRIES = registry.register(Counter(
+    "swapper_retries", "Operations retried after a failure", ("operation",),
+))
+MARKET_DATA_GAP_SECONDS = registry.register(Histogram(
+    "swapper_market_data_gap_seconds",
+    "Time without any market data connection streaming, from the last frame to the next",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+))
+STARTUP_SECONDS = registry.register(Gauge(
+    "swapper_startup_seconds",
+    "Time from the process starting to the end of each startup phase and to the first order",
+    ("phase",),
+))
+RING_LAG = registry.register(Gauge(
+    "swapper_ring_lag", "Ticks in the market data ring buffer a trading process is behind on",
+))
+RING_OVERRUNS = registry.register(Counter(
+    "swapper_ring_overruns",
+    "Ticks overwritten in the market data ring buffer before a trading process read them",
+))
+ORDER_BOOK_RESYNCS = registry.register(Counter(
+    "swapper_order_book_resyncs",
+    "Order book snapshots loaded again after updates of the diff stream were missed",
+))
+ORDERS_REJECTED = registry.register(Counter(
+    "swapper_orders_rejected",
+    "Orders failing a filter of the symbol, never sent to the exchange, by filter",
+    ("filter",),
+))
+LOG_RECORDS_DROPPED = registry.register(Counter(
+    "swapper_log_records_dropped",
+    "Log records never written, by reason: the queue was full or they were sampled out",
+    ("reason",),
+))
+REPRICINGS_SUPPRESSED = registry.register(Counter(
+    "swapper_repricings_suppressed",
+    "Orders reached by the new price but not replaced, by the rule that held them",
+    ("reason",),
+))
+
+
+def timed(stage: str) -> Callable:
+    """
+    Decorator observing the run time of a coroutine function as a stage
+    """
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            # Looked up on every call, so the histogram survives `registry.reset()`
+            with STAGE_SECONDS.labels(stage).time():
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        # Skip the headers, no request of ours has a body
+        while (await reader.readline()).strip():
+            pass
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b""
+        if path == b"/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b""
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host: str = METRICS_HOST, port: int = METRICS_PORT) -> asyncio.AbstractServer:
+    """
+    Serve the metrics on http://host:port/metrics for Prometheus to scrape
+    """
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+async def dump(interval: float, path: Optional[str] = None) -> None:
+    """
+    Write the metrics every `interval` seconds to a file, or log the stage percentiles when no
+    path is given
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if path:
+            with open(path, "w") as file:
+                file.write(registry.render())
+            continue
+        for (stage,), child in sorted(STAGE_SECONDS._children.items()):
+            logger.info(
+                f"{stage}: count={child.count} p50<={child.quantile(0.5)}s "
+                f"p99<={child.quantile(0.99)}s"
+            )
@@ -0,0 +1,67 @@
+"""
+Compact records the bot keeps in memory instead of raw API responses
+"""
+import sys
+from typing import NamedTuple
+from typing import Optional
+
+from swapper.prices import price_precision
+from swapper.prices import to_ticks
+
+
+class Order(NamedTuple):
+    order_id: int
+    side: Optional[str] = None
+    status: Optional[str] = None
+    # Ticks, see `swapper.prices`
+    price: Optional[int] = None
+    symbol: Optional[str] = None
+    # Milliseconds, used to tell which of two updates of the same order is newer
+    update_time: int = 0
+    # Milliseconds, when the order was placed
+    created_time: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Order":
+        """
+        Build an order from a REST order response
+        """
+        price = data.get("price")
+        symbol = _intern(data.get("symbol"))
+        return cls(
+            order_id=data["orderId"],
+            side=_intern(data.get("side")),
+            status=_intern(data.get("status")),
+            price=to_ticks(price, price_precision(symbol)) if price is not None else None,
+            symbol=symbol,
+            update_time=data.get("updateTime") or data.get("transactTime") or 0,
+            created_time=data.get("time") or data.get("transactTime") or 0,
+        )
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # Side, status and symbol repeat across every order, so share one copy of each string
+    return sys.intern(value) if value is not None else None
+
+
+class Kline(NamedTuple):
+    open_time: int
+    # Prices in ticks
+    open: int
+    high: int
+    low: int
+    close: int
+
+
+class KlineEvent(NamedTuple):
+    """
+    The fields of a live kline event the trading loop prices off
+    """
+    symbol: str
+    # Milliseconds, when the exchange sent the event
+    event_time: int
+    # Ticks
+    high: int
+    low: int
+    # Milliseconds, tells updates of the same candle from a new candle
+    open_time: int = 0
@@ -0,0 +1,255 @@
+"""
+Local order book of a symbol, kept from a depth snapshot and the diff stream the way Binance
+describes it, so pricing and risk checks can see the top of the book and not only the kline
+"""
+import asyncio
+import logging
+from bisect import bisect_left
+from collections import deque
+from decimal import Decimal
+from typing import Deque
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from httpx import HTTPError
+
+from swapper.constants import ORDER_BOOK_BUFFER_SIZE
+from swapper.constants import ORDER_BOOK_SNAPSHOT_LIMIT
+from swapper.constants import PRICE_PRECISION
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.constants import SLEEP_TIME
+from swapper.errors import SwapperError
+from swapper.metrics import ORDER_BOOK_RESYNCS
+from swapper.models import Order
+from swapper.prices import price_precision
+from swapper.prices import to_ticks
+from swapper.service import get_depth
+
+logger = logging.getLogger(__name__)
+
+# Price references, see `swapper.constants.PRICE_REFERENCE`
+BOOK = "book"
+KLINE = "kline"
+
+
+class BookSide:
+    """
+    The price levels of one side in two parallel lists sorted so the best level comes last. Best
+    price lookups are O(1) and updates find their level by bisection in O(log n). Levels are
+    inserted and removed mostly near the top of the book, the end of the lists, where that moves
+    few elements
+    """
+
+    def __init__(self, side: str) -> None:
+        self.side = side
+        # Bid prices, or negated ask prices, in ticks, increasing
+        self._keys: List[int] = []
+        self._quantities: List[Decimal] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _key(self, price: int) -> int:
+        return price if self.side == SIDE_BID else -price
+
+    def update(self, price: int, quantity: Decimal) -> None:
+        """
+        Set the quantity of a level. A quantity of 0 removes it
+        """
+        key = self._key(price)
+        index = bisect_left(self._keys, key)
+        found = index < len(self._keys) and self._keys[index] == key
+        if quantity:
+            if found:
+                self._quantities[index] = quantity
+            else:
+                self._keys.insert(index, key)
+                self._quantities.insert(index, quantity)
+        elif found:
+            del self._keys[index]
+            del self._quantities[index]
+
+    def load(self, levels: Iterable[List[str]], precision: int = PRICE_PRECISION) -> None:
+        """
+        Replace all levels with the [price, quantity] pairs of a snapshot
+        :param precision: Decimal places of the tick size of the symbol
+        """
+        self._keys.clear()
+        self._quantities.clear()
+        for price, quantity in levels:
+            self.update(to_ticks(price, precision), Decimal(quantity))
+
+    @property
+    def best_price(self) -> Optional[int]:
+        return self._key(self._keys[-1]) if self._keys else None
+
+    @property
+    def best_quantity(self) -> Optional[Decimal]:
+        return self._quantities[-1] if self._quantities else None
+
+    def quantity(self, price: int) -> Decimal:
+        """
+        The quantity resting at a price
+        """
+        key = self._key(price)
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return self._quantities[index]
+        return Decimal(0)
+
+    def depth_ahead(self, price: int, limit: Optional[Decimal] = None) -> Decimal:
+        """
+        The quantity resting at better prices than `price`, which fills before an order at it
+        :param limit: Stop adding up levels once the quantity is past it
+        """
+        key = self._key(price)
+        depth = Decimal(0)
+        for index in range(len(self._keys) - 1, -1, -1):
+            if self._keys[index] <= key or (limit is not None and depth > limit):
+                break
+            depth += self._quantities[index]
+        return depth
+
+
+class OrderBook:
+    """
+    Applies `depthUpdate` events of a diff depth stream to a REST snapshot. Events received
+    before the snapshot are buffered and replayed on top of it. An event that doesn't start
+    right after the last one applied means updates were lost: the book is marked out of sync
+    and `run()` loads a new snapshot
+    """
+
+    def __init__(
+            self,
+            symbol: str,
+            snapshot_limit: int = ORDER_BOOK_SNAPSHOT_LIMIT,
+            buffer_size: int = ORDER_BOOK_BUFFER_SIZE,
+    ) -> None:
+        self.symbol = symbol
+        self.snapshot_limit = snapshot_limit
+        self.bids = BookSide(SIDE_BID)
+        self.asks = BookSide(SIDE_ASK)
+        self.last_update_id = 0
+        self.synced = False
+        self.resyncs = 0
+        self._buffer: Deque[dict] = deque(maxlen=buffer_size)
+        self._buffered = asyncio.Event()
+        self._out_of_sync = asyncio.Event()
+        self._out_of_sync.set()
+
+    @property
+    def best_bid(self) -> Optional[int]:
+        return self.bids.best_price
+
+    @property
+    def best_ask(self) -> Optional[int]:
+        return self.asks.best_price
+
+    @property
+    def ready(self) -> bool:
+        """
+        Synced with both sides quoted
+        """
+        return self.synced and bool(self.bids) and bool(self.asks)
+
+    def side(self, side: str) -> BookSide:
+        return self.bids if side == SIDE_BID else self.asks
+
+    def apply(self, event: dict) -> None:
+        """
+        Apply a diff event, or buffer it until there is a snapshot
+        """
+        if not self.synced:
+            self._buffer.append(event)
+            self._buffered.set()
+            return
+        if event["u"] <= self.last_update_id:
+            return  # Already in the book
+        if event["U"] > self.last_update_id + 1:
+            logger.warning(
+                f"{self.symbol} order book missed updates {self.last_update_id + 1} to "
+                f"{event['U'] - 1}. Resyncing"
+            )
+            self.resyncs += 1
+            ORDER_BOOK_RESYNCS.labels().inc()
+            self.synced = False
+            self._buffer.clear()
+            self._buffer.append(event)
+            self._buffered.set()
+            self._out_of_sync.set()
+            return
+        self._update(event)
+
+    def _update(self, event: dict) -> None:
+        precision = price_precision(self.symbol)
+        for price, quantity in event["b"]:
+            self.bids.update(to_ticks(price, precision), Decimal(quantity))
+        for price, quantity in event["a"]:
+            self.asks.update(to_ticks(price, precision), Decimal(quantity))
+        self.last_update_id = event["u"]
+
+    def load(self, snapshot: dict) -> bool:
+        """
+        Load a snapshot and replay the buffered events newer than it. False when the snapshot is
+        older than the buffered events, it has to be fetched again
+        """
+        last_update_id = snapshot["lastUpdateId"]
+        while self._buffer and self._buffer[0]["u"] <= last_update_id:
+            self._buffer.popleft()
+        if self._buffer and self._buffer[0]["U"] > last_update_id + 1:
+            return False
+
+        precision = price_precision(self.symbol)
+        self.bids.load(snapshot["bids"], precision)
+        self.asks.load(snapshot["asks"], precision)
+        self.last_update_id = last_update_id
+        self.synced = True
+        self._out_of_sync.clear()
+        buffered, self._buffer = list(self._buffer), deque(maxlen=self._buffer.maxlen)
+        self._buffered.clear()
+        for event in buffered:
+            self.apply(event)
+        return True
+
+    def order_at_risk(self, order: Order, min_depth_ahead: Decimal = Decimal(0)) -> bool:
+        """
+        Check if no more than `min_depth_ahead` rests ahead of the order, so it's next to fill
+        """
+        return self.side(order.side).depth_ahead(order.price, min_depth_ahead) <= min_depth_ahead
+
+    async def run(self) -> None:
+        """
+        Load a snapshot whenever the book is out of sync. The snapshot is only fetched once an
+        event is buffered, so it's never older than the stream
+        """
+        while True:
+            await self._out_of_sync.wait()
+            await self._buffered.wait()
+            try:
+                snapshot = await get_depth(self.symbol, self.snapshot_limit)
+            except (HTTPError, SwapperError) as err:
+                logger.error(f"{self.symbol} order book snapshot failed: {err!r}")
+                await asyncio.sleep(SLEEP_TIME)
+                continue
+            if self.load(snapshot):
+                logger.info(f"{self.symbol} order book synced at update {self.last_update_id}")
+            else:
+                # The snapshot can lag the stream a little, the next one catches up
+                logger.warning(f"{self.symbol} order book snapshot older than the stream")
+                await asyncio.sleep(1)
+
+
+_books: Dict[str, OrderBook] = {}
+
+
+def get_book(symbol: str) -> OrderBook:
+    """
+    The order book of a symbol, shared by the market data reader and the trading loop
+    """
+    book = _books.get(symbol)
+    if book is None:
+        book = _books[symbol] = OrderBook(symbol)
+    return book
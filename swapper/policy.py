@@ -0,0 +1,131 @@
+"""
+Decides when an order is worth replacing. Every replace costs requests and weight, so small moves
+of the price past an order can be ignored
+"""
+from typing import Dict
+
+from swapper.constants import REPRICE_COOLDOWN
+from swapper.constants import REPRICE_HYSTERESIS
+from swapper.constants import REPRICE_MIN_ORDER_AGE
+from swapper.constants import REPRICE_THRESHOLD
+from swapper.constants import REPRICE_THRESHOLD_UNIT
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.exchange_info import exchange_info
+from swapper.metrics import REPRICINGS_SUPPRESSED
+from swapper.models import Order
+
+BPS = "bps"
+TICKS = "ticks"
+
+
+class RepricingPolicy:
+    """
+    Holds back replaces of orders at risk (see `swapper.helpers.order_at_risk`) until the new price
+    is past them by a threshold, they are old enough and the side hasn't been replaced recently.
+    Keep one per symbol, it remembers which orders are due and when each side was last replaced.
+
+    The defaults hold nothing back
+    """
+
+    def __init__(
+            self,
+            threshold: float = float(REPRICE_THRESHOLD),
+            unit: str = REPRICE_THRESHOLD_UNIT,
+            hysteresis: float = float(REPRICE_HYSTERESIS),
+            min_order_age: int = REPRICE_MIN_ORDER_AGE,
+            cooldown: int = REPRICE_COOLDOWN,
+    ) -> None:
+        """
+        :param threshold: How far the new price has to be past the order, in `unit`
+        :param unit: "bps" of the order price or "ticks", the tick size of the order's symbol
+        :param hysteresis: How far back inside the threshold an order that was due has to come to
+        not be due anymore, in `unit`. Keeps orders held by the age or cooldown due while the
+        price hovers around the threshold
+        :param min_order_age: Milliseconds
+        :param cooldown: Milliseconds
+        """
+        if unit not in (BPS, TICKS):
+            raise ValueError(f"Unknown threshold unit: {unit}")
+        if not 0 <= hysteresis <= threshold:
+            raise ValueError("Hysteresis must be between 0 and the threshold")
+        self.threshold = threshold
+        self.unit = unit
+        self.hysteresis = hysteresis
+        self.min_order_age = min_order_age
+        self.cooldown = cooldown
+        # Side -> id of the order that went past the threshold but wasn't replaced yet
+        self._due: Dict[str, int] = {}
+        # Side -> when it was last replaced, in milliseconds
+        self._replaced_at: Dict[str, int] = {}
+        self.suppressed = 0
+
+    def distance(self, bid_price: int, ask_price: int, order: Order) -> float:
+        """
+        How far the new price of the side of the order is past it, in `unit`. Negative while it
+        hasn't reached the order. Prices are in units of the price precision, which only match
+        exchange ticks when the tick size is one unit, e.g. 0.01 at 2 decimals
+        """
+        if order.side == SIDE_BID:
+            crossed = bid_price - order.price
+        elif order.side == SIDE_ASK:
+            crossed = order.price - ask_price
+        else:
+            raise ValueError(f"Unknown order side: {order.side}")
+        if self.unit == TICKS:
+            filters = exchange_info.get(order.symbol)
+            return crossed / filters.tick if filters else crossed
+        return crossed / order.price * 10000
+
+    def should_reprice(
+            self, bid_price: int, ask_price: int, order: Order, now: int
+    ) -> bool:
+        """
+        Check if an order at risk should be replaced now. A positive answer counts as a replace of
+        the side for the cooldown
+        :param now: Milliseconds, same clock as the order times
+        """
+        if self.threshold:
+            threshold = self.threshold
+            if self._due.get(order.side) == order.order_id:
+                threshold -= self.hysteresis
+            if self.distance(bid_price, ask_price, order) < threshold:
+                self._due.pop(order.side, None)
+                self._suppress("threshold")
+                return False
+            self._due[order.side] = order.order_id
+
+        if order.created_time and now - order.created_time < self.min_order_age:
+            self._suppress("min_order_age")
+            return False
+        replaced_at = self._replaced_at.get(order.side)
+        if replaced_at is not None and now - replaced_at < self.cooldown:
+            self._suppress("cooldown")
+            return False
+
+        self._due.pop(order.side, None)
+        self._replaced_at[order.side] = now
+        return True
+
+    def forget(self, side: str) -> None:
+        """
+        The order of the side isn't at risk anymore
+        """
+        self._due.pop(side, None)
+
+    def _suppress(self, reason: str) -> None:
+        self.suppressed += 1
+        REPRICINGS_SUPPRESSED.labels(reason).inc()
+
+
+_policies: Dict[str, RepricingPolicy] = {}
+
+
+def get_policy(symbol: str) -> RepricingPolicy:
+    """
+    The repricing policy of a symbol
+    """
+    policy = _policies.get(symbol)
+    if policy is None:
+        policy = _policies[symbol] = RepricingPolicy()
+    return policy
@@ -0,0 +1,96 @@
+"""
+Prices as integer multiples of the tick size. They are parsed once on the way in and formatted
+once on the way out, so everything in between is integer arithmetic.
+
+Every symbol counts its prices in units of the last decimal place of its own tick size, taken
+from the PRICE_FILTER of its exchangeInfo. Symbols without exchange info loaded use
+`PRICE_PRECISION`
+"""
+from decimal import Decimal
+from typing import Dict
+from typing import Optional
+
+from swapper.constants import PRICE_PRECISION
+
+_POWERS = [10 ** exponent for exponent in range(20)]
+# Below this many ticks a double is off from the exact value by less than 1/100 of a tick
+_FLOAT_EXACT = 2 ** 44
+
+# Symbol -> decimal places its prices are counted in
+_precisions: Dict[str, int] = {}
+
+
+def tick_precision(tick_size: str) -> int:
+    """
+    Decimal places of a tick size, e.g. 4 for "0.00010000"
+    """
+    return max(-Decimal(tick_size).normalize().as_tuple().exponent, 0)
+
+
+def price_precision(symbol: Optional[str]) -> int:
+    """
+    Decimal places the prices of a symbol are counted in
+    """
+    return _precisions.get(symbol, PRICE_PRECISION)
+
+
+def set_price_precision(symbol: str, precision: int) -> int:
+    """
+    Count the prices of a symbol in `precision` decimal places. Only the first call per symbol
+    counts: prices already held in ticks would change value otherwise
+    :return: The precision the symbol uses
+    """
+    return _precisions.setdefault(symbol, precision)
+
+
+def clear_price_precisions() -> None:
+    _precisions.clear()
+
+
+def to_ticks(price: str, precision: int = PRICE_PRECISION) -> int:
+    """
+    Parse a decimal price into ticks, rounding half to even like `round()` does on a Decimal
+    :param price: E.g. "23167.50000000"
+    :param precision: Decimal places of the tick size
+    """
+    # Exchange prices are multiples of the tick, which the C float parser gets exactly. Only
+    # prices close to halfway between two ticks need the exact integer rounding
+    scaled = float(price) * _POWERS[precision]
+    # Faster than round(). Whatever it gets wrong isn't within 0.49 of the price
+    ticks = int(scaled + 0.5)
+    if -0.49 < scaled - ticks < 0.49 and scaled < _FLOAT_EXACT:
+        return ticks
+    return _to_ticks_exact(price, precision)
+
+
+def _to_ticks_exact(price: str, precision: int) -> int:
+    point = price.find(".")
+    if point < 0:
+        return int(price) * _POWERS[precision]
+    # All digits as one integer, then scaled to ticks. Much faster than slicing the string
+    excess = len(price) - point - 1 - precision
+    digits = int(price.replace(".", "", 1))
+    if excess <= 0:
+        return digits * _POWERS[-excess]
+    scale = _POWERS[excess]
+    ticks, rest = divmod(digits, scale)
+    if 2 * rest > scale or (2 * rest == scale and ticks % 2):
+        ticks += 1
+    return ticks
+
+
+def from_ticks(ticks: int, precision: int = PRICE_PRECISION) -> str:
+    """
+    Format ticks as a decimal price for the exchange, e.g. 2316750 as "23167.50"
+    """
+    if not precision:
+        return str(ticks)
+    whole, fraction = divmod(ticks, 10 ** precision)
+    return f"{whole}.{fraction:0{precision}d}"
+
+
+def to_decimal(ticks: int, precision: int = PRICE_PRECISION) -> Decimal:
+    """
+    The price of ticks as a Decimal, for reports off the hot path
+    """
+    return Decimal(ticks).scaleb(-precision)
@@ -0,0 +1,218 @@
+"""
+Client-side view of the Binance rate limits. Shapes requests to stay under them and lets the
+most urgent requests go first when the budget is short
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+from swapper.constants import RATE_LIMIT_USAGE
+from swapper.constants import RATE_LIMITS
+from swapper.errors import RequestNotSent
+from swapper.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Lower goes first
+PRIORITY_CANCEL = 0
+PRIORITY_PLACE = 1
+PRIORITY_QUERY = 2
+
+WEIGHT = "WEIGHT"
+ORDERS = "ORDERS"
+
+# (method, REST endpoint) -> (request weight, orders, priority). The WebSocket API methods of the
+# same requests cost the same
+REQUEST_COSTS = {
+    ("POST", "/order"): (1, 1, PRIORITY_PLACE),
+    ("DELETE", "/order"): (1, 0, PRIORITY_CANCEL),
+    # Reprices an order at risk, so it goes with the cancels
+    ("POST", "/order/cancelReplace"): (1, 1, PRIORITY_CANCEL),
+    ("GET", "/allOrders"): (20, 0, PRIORITY_QUERY),
+    ("GET", "/exchangeInfo"): (20, 0, PRIORITY_QUERY),
+    ("GET", "/depth"): (50, 0, PRIORITY_QUERY),
+    ("POST", "/userDataStream"): (2, 0, PRIORITY_QUERY),
+    ("PUT", "/userDataStream"): (2, 0, PRIORITY_QUERY),
+}
+
+
+class RateLimited(RequestNotSent):
+    """
+    The exchange asked to back off. Raised instead of sending a request until it allows them again
+    """
+
+
+class TokenBucket:
+    """
+    Holds up to `capacity` tokens and refills them evenly over `interval` seconds
+    """
+
+    def __init__(self, capacity: float, interval: float) -> None:
+        self.capacity = capacity
+        self.rate = capacity / interval
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available, after a refill
+        """
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def sync(self, used: float, limit: float) -> None:
+        """
+        Trust the exchange when it has counted more usage than the bucket has
+        """
+        self.tokens = min(self.tokens, self.capacity - used * self.capacity / limit)
+
+
+@dataclass
+class _Waiter:
+    priority: int
+    sequence: int
+    weight: int
+    orders: int
+    future: asyncio.Future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class RateLimiter:
+    """
+    One token bucket per exchange limit, kept in line with the usage the exchange reports in
+    response headers. Requests that can't go right away wait in priority order, so a cancel
+    never waits behind a place or a reconciliation query
+    """
+
+    def __init__(
+            self,
+            limits: Mapping[str, Tuple[str, int, int]] = RATE_LIMITS,
+            usage: float = RATE_LIMIT_USAGE,
+    ) -> None:
+        """
+        :param limits: Header suffix, e.g. "USED-WEIGHT-1M" -> (WEIGHT or ORDERS, limit, seconds)
+        :param usage: Share of every limit the buckets allow, to leave room for other clients
+        """
+        self.limits = limits
+        self.usage = usage
+        self.reset()
+
+    def reset(self) -> None:
+        limits, usage = self.limits, self.usage
+        self.buckets: Dict[str, TokenBucket] = {
+            name: TokenBucket(limit * usage, interval)
+            for name, (_, limit, interval) in limits.items()
+        }
+        self.blocked_until = 0.0
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    def _cost(self, name: str, weight: int, orders: int) -> int:
+        return weight if self.limits[name][0] == WEIGHT else orders
+
+    async def acquire_request(self, method: str, endpoint: str) -> None:
+        """
+        `acquire()` the cost and priority of a REST request, see `REQUEST_COSTS`. Await it before
+        taking the request timestamp, so waiting doesn't eat into the recvWindow
+        """
+        await self.acquire(*REQUEST_COSTS[method, endpoint])
+
+    async def acquire(self, weight: int, orders: int = 0, priority: int = PRIORITY_QUERY) -> None:
+        """
+        Wait until a request of this weight and order count fits under every limit. While the
+        exchange has asked to back off, cancels wait for it to allow requests again and go first
+        then, everything else is rejected
+        :raises RateLimited: While the exchange has asked to back off
+        """
+        remaining = self.blocked_until - time.monotonic()
+        if remaining > 0 and priority != PRIORITY_CANCEL:
+            raise RateLimited(f"Rate limited for another {remaining:.1f}s")
+        waiter = _Waiter(
+            priority, next(self._sequence), weight, orders,
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._waiters, waiter)
+        self._schedule()
+        if waiter.future.done():
+            return
+        started = time.perf_counter()
+        try:
+            await waiter.future
+        finally:
+            STAGE_SECONDS.labels("rate_limit_wait").observe(time.perf_counter() - started)
+
+    def _schedule(self) -> None:
+        """
+        Let waiters go in priority order while the buckets have tokens for them. The first one
+        that doesn't fit holds the rest back until its tokens have refilled
+        """
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        now = time.monotonic()
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.future.done():  # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            wait_time = max((
+                bucket.wait_time(self._cost(name, waiter.weight, waiter.orders))
+                for name, bucket in self.buckets.items()
+            ), default=0.0)
+            wait_time = max(wait_time, self.blocked_until - now)
+            if wait_time > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(wait_time, self._schedule)
+                return
+            heapq.heappop(self._waiters)
+            for name, bucket in self.buckets.items():
+                bucket.tokens -= self._cost(name, waiter.weight, waiter.orders)
+            waiter.future.set_result(None)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """
+        Sync the buckets with the usage counted by the exchange, from `X-MBX-USED-WEIGHT-*` and
+        `X-MBX-ORDER-COUNT-*` response headers
+        """
+        for name, bucket in self.buckets.items():
+            used = headers.get(f"X-MBX-{name}")
+            if used is not None:
+                bucket.sync(int(used), self.limits[name][1])
+
+    def update_from_rate_limits(self, rate_limits: List[dict]) -> None:
+        """
+        Same as `update()`, from the "rateLimits" of a WebSocket API response
+        """
+        units = {"SECOND": "S", "MINUTE": "M", "HOUR": "H", "DAY": "D"}
+        prefixes = {"REQUEST_WEIGHT": "USED-WEIGHT", "ORDERS": "ORDER-COUNT"}
+        self.update({
+            f"X-MBX-{prefixes.get(limit['rateLimitType'])}-"
+            f"{limit['intervalNum']}{units.get(limit['interval'])}": limit["count"]
+            for limit in rate_limits
+        })
+
+    def back_off(self, retry_after: float) -> None:
+        """
+        Hold every request for `retry_after` seconds, after a 429 or a 418 ban
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"Rate limited by the exchange. Backing off for {retry_after}s")
+
+
+limiter = RateLimiter()
@@ -0,0 +1,170 @@
+"""
+Shared memory ring buffer of kline ticks, so market data can be read off the websocket in one
+process and traded off in others
+"""
+import asyncio
+import logging
+import struct
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Collection
+from typing import Optional
+
+from swapper.constants import RING_POLL_INTERVAL
+from swapper.constants import RING_SIZE
+from swapper.market_data import Frame
+from swapper.market_data import MarketDataReader
+from swapper.metrics import RING_LAG
+from swapper.metrics import RING_OVERRUNS
+from swapper.models import KlineEvent
+
+logger = logging.getLogger(__name__)
+
+# Number of ticks written so far, then the number of slots, on a cache line of their own
+_HEADER = struct.Struct("<Q")
+_CAPACITY = struct.Struct("<Q")
+_HEADER_SIZE = 64
+# Number of the tick in the slot plus one, 0 while it's being written
+_SEQ = struct.Struct("<Q")
+# Symbol, event time, open time, high and low
+_TICK = struct.Struct("<24sqqqq")
+_SLOT_SIZE = _SEQ.size + _TICK.size
+
+
+@dataclass
+class RingStats:
+    ticks_read: int = 0
+    # Ticks overwritten by the writer before they were read
+    overruns: int = 0
+    # Ticks written but not read yet, as of the last read
+    lag: int = 0
+    max_lag: int = 0
+
+
+class TickRing:
+    """
+    Single writer, many readers, no locks. The writer never waits: every slot carries the number
+    of the tick in it and is zeroed while being written, so a reader that copied a slot and finds
+    the same number before and after got a whole tick, and anything else means the writer lapped
+    it. Every reader keeps its own position and skips ahead to the oldest tick still in the
+    buffer when it falls more than `size` ticks behind, counting the ticks it lost as overruns
+    """
+
+    def __init__(self, name: Optional[str] = None, size: int = RING_SIZE) -> None:
+        """
+        :param name: Shared memory block of an existing ring to attach to. Leave out to create
+        one, which `name` is set to
+        :param size: Ticks a new ring holds
+        """
+        if name is None:
+            self._memory = SharedMemory(create=True, size=_HEADER_SIZE + size * _SLOT_SIZE)
+            _CAPACITY.pack_into(self._memory.buf, _HEADER.size, size)
+        else:
+            self._memory = SharedMemory(name)
+        self._buffer = self._memory.buf
+        self.name = self._memory.name
+        self.size = _CAPACITY.unpack_from(self._buffer, _HEADER.size)[0]
+        self.stats = RingStats()
+        # Number of the next tick to read. Readers start at the tick written next
+        self.position = self.written
+
+    @property
+    def written(self) -> int:
+        return _HEADER.unpack_from(self._buffer, 0)[0]
+
+    def write(self, tick: KlineEvent) -> None:
+        written = self.written
+        offset = _HEADER_SIZE + written % self.size * _SLOT_SIZE
+        _SEQ.pack_into(self._buffer, offset, 0)
+        _TICK.pack_into(
+            self._buffer, offset + _SEQ.size, tick.symbol.encode(), tick.event_time,
+            tick.open_time, tick.high, tick.low,
+        )
+        _SEQ.pack_into(self._buffer, offset, written + 1)
+        _HEADER.pack_into(self._buffer, 0, written + 1)
+
+    def read(self) -> Optional[KlineEvent]:
+        """
+        The next tick, or None when the reader is caught up
+        """
+        while True:
+            written = self.written
+            if self.position >= written:
+                return None
+            if written - self.position > self.size:
+                self._overrun(written)
+                continue
+
+            offset = _HEADER_SIZE + self.position % self.size * _SLOT_SIZE
+            expected = self.position + 1
+            if _SEQ.unpack_from(self._buffer, offset)[0] != expected:
+                self._overrun(self.written)
+                continue
+            symbol, event_time, open_time, high, low = _TICK.unpack_from(
+                self._buffer, offset + _SEQ.size
+            )
+            if _SEQ.unpack_from(self._buffer, offset)[0] != expected:
+                # Overwritten while it was copied
+                self._overrun(self.written)
+                continue
+
+            self.position = expected
+            self.stats.ticks_read += 1
+            self.stats.lag = written - expected
+            self.stats.max_lag = max(self.stats.max_lag, self.stats.lag)
+            return KlineEvent(symbol.rstrip(b"\0").decode(), event_time, high, low, open_time)
+
+    def _overrun(self, written: int) -> None:
+        # Skip to the oldest tick that's safe to read, leaving the writer a slot of room
+        position = max(self.position + 1, written - self.size + 1)
+        lost = position - self.position
+        self.position = position
+        self.stats.overruns += lost
+        RING_OVERRUNS.labels().inc(lost)
+        logger.warning(f"Market data ring buffer overrun, {lost} ticks lost")
+
+    async def consume(
+            self, reader: MarketDataReader, symbols: Optional[Collection[str]] = None
+    ) -> None:
+        """
+        Feed the ticks of some symbols into a reader as they are written. The reader conflates
+        them per symbol like it does the frames of a websocket
+        """
+        while True:
+            tick = self.read()
+            if tick is None:
+                await asyncio.sleep(RING_POLL_INTERVAL)
+                continue
+            # Ticks behind the writer on waking up
+            RING_LAG.labels().set(self.stats.lag)
+            while tick is not None:
+                if symbols is None or tick.symbol in symbols:
+                    reader.put(tick.symbol, tick)
+                tick = self.read()
+            # Let the trading loop pick the ticks up
+            await asyncio.sleep(0)
+
+    def close(self) -> None:
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """
+        Free the shared memory, done by the process that created the ring once every process
+        closed it
+        """
+        self._memory.unlink()
+
+
+class RingPublisher(MarketDataReader):
+    """
+    Takes the frames of a `swapper.supervisor.MarketDataSupervisor` and writes the klines to a
+    ring instead of keeping them
+    """
+
+    def __init__(self, ring: TickRing) -> None:
+        super().__init__()
+        self.ring = ring
+
+    def put(self, key: Optional[str], frame: Frame) -> None:
+        if isinstance(frame, KlineEvent):
+            self.ring.write(frame)
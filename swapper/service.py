@@ -3,24 +3,40 @@ Module that interacts with Binance API
 """
 import hashlib
 import hmac
+import json
 import logging
 import os
-import time
-from decimal import Decimal
 from typing import List
 from typing import Optional
+from typing import Tuple
 from typing import Union
 
 import httpx
 
+from swapper.client import get_client
+from swapper.clock import clock
+from swapper.constants import ALL_ORDERS_LIMIT
 from swapper.constants import BINANCE_REST_API_BASE_URL
-from swapper.constants import BINANCE_TIME_API_URL
+from swapper.constants import CANCEL_REPLACE_ENABLED
+from swapper.constants import CANCEL_REPLACE_MODE
+from swapper.constants import ORDER_BOOK_SNAPSHOT_LIMIT
 from swapper.constants import ORDER_TYPE
-from swapper.constants import QUANTITY
+from swapper.constants import RATE_LIMIT_DEFAULT_RETRY_AFTER
 from swapper.constants import SIDE_ASK
 from swapper.constants import SIDE_BID
 from swapper.constants import SYMBOL
 from swapper.constants import TIME_IN_FORCE
+from swapper.decode import loads
+from swapper.errors import ExchangeError
+from swapper.exchange_info import exchange_info
+from swapper.exchange_info import FILTER_FAILURE
+from swapper.metrics import REST_ERRORS
+from swapper.metrics import REST_REQUESTS
+from swapper.metrics import timed
+from swapper.prices import from_ticks
+from swapper.prices import price_precision
+from swapper.ratelimit import limiter
+from swapper.ws_api import WebSocketApi
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 API_KEY = os.getenv("API_KEY")
@@ -32,6 +48,19 @@ HEADERS = {
 
 logger = logging.getLogger(__name__)
 
+# Error code of cancels of orders the exchange doesn't know, e.g. already filled or cancelled
+UNKNOWN_ORDER = -2011
+
+# Turned off the first time the exchange doesn't know the cancelReplace endpoint
+_cancel_replace_supported = True
+
+# Orders go over this WebSocket API session while it's connected, and over REST otherwise
+_ws_api: Optional[WebSocketApi] = None
+
+
+class CancelReplaceUnsupported(ExchangeError):
+    pass
+
 
 def calculate_signature(data: dict) -> str:
     """
@@ -45,92 +74,363 @@ def calculate_signature(data: dict) -> str:
     return signature.hexdigest()
 
 
-async def place_order(side: Union[SIDE_BID, SIDE_ASK], price: Decimal) -> dict:
+def set_ws_api(ws_api: Optional[WebSocketApi]) -> None:
+    """
+    Send orders, cancels and order queries over a WebSocket API session. None goes back to REST
+    """
+    global _ws_api
+    _ws_api = ws_api
+
+
+def _ws_api_connected() -> bool:
+    return _ws_api is not None and _ws_api.connected
+
+
+async def _ws_request(method: str, params: dict) -> dict:
+    """
+    Send a request over the WebSocket API session and keep the rate limiter in line with it
+    """
+    response = await _ws_api.request(method, params)
+    limiter.update_from_rate_limits(response.get("rateLimits", []))
+    if response["status"] in (418, 429):
+        retry_after = ((response.get("error") or {}).get("data") or {}).get("retryAfter")
+        limiter.back_off(
+            (retry_after - clock.now_ms()) / 1000 if retry_after
+            else RATE_LIMIT_DEFAULT_RETRY_AFTER
+        )
+    return response
+
+
+def _ws_result(response: dict):
+    if response["status"] != 200:
+        _check_filter_failure(response.get("error"))
+        raise ExchangeError(f"Error {response['status']}: {response.get('error')}")
+    return response["result"]
+
+
+def _check_filter_failure(error: Optional[dict]) -> None:
+    """
+    Refresh the filters of the symbols if the exchange rejected an order for one, they must have
+    changed since they were fetched
+    """
+    if error and error.get("code") == FILTER_FAILURE:
+        exchange_info.invalidate(error.get("msg", ""))
+
+
+def _check_order_response(response: httpx.Response) -> None:
+    if response.status_code == 400:
+        try:
+            _check_filter_failure(loads(response.content))
+        except ValueError:
+            pass
+
+
+async def _send(method: str, endpoint: str, **kwargs) -> httpx.Response:
+    """
+    Send a request to the REST API, count its response status, or the error that stopped it,
+    and keep the rate limiter in line with the usage the exchange reports
+    :param method: The HTTP method
+    :param endpoint: The path after the API base URL
+    """
+    try:
+        response = await get_client().request(
+            method, f"{BINANCE_REST_API_BASE_URL}{endpoint}", **kwargs
+        )
+    except httpx.HTTPError as err:
+        REST_ERRORS.labels(endpoint, type(err).__name__).inc()
+        raise
+    REST_REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    limiter.update(response.headers)
+    if response.status_code in (418, 429):
+        # 429 warns before a 418 ban, both say for how long to stop
+        limiter.back_off(
+            int(response.headers.get("Retry-After", RATE_LIMIT_DEFAULT_RETRY_AFTER))
+        )
+    return response
+
+
+@timed("place_order")
+async def place_order(
+        side: Union[SIDE_BID, SIDE_ASK], price: int, symbol: str = SYMBOL
+) -> dict:
     """
     Place an order on Binance
     :param side: The side of the order, either "BUY" or "SELL"
-    :param price: The price of the order
+    :param price: The price of the order, in ticks
+    :param symbol: The symbol to trade
+    :raises OrderRejected: The order fails a filter of the symbol, it isn't sent
     """
+    price, quantity = exchange_info.prepare(symbol, side, price)
+    await limiter.acquire_request("POST", "/order")
     # Build the request body
     data = {
-        "symbol": SYMBOL,
+        "symbol": symbol,
         "side": side,
         "type": ORDER_TYPE,
         "timeInForce": TIME_IN_FORCE,
-        "quantity": QUANTITY,
-        "price": round(price, 2),
-        "timestamp": str(int(time.time() * 1000)),
+        "quantity": quantity,
+        "price": from_ticks(price, price_precision(symbol)),
+        "timestamp": clock.timestamp(),
     }
+    if _ws_api_connected():
+        return _ws_result(await _ws_request("order.place", data))
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{BINANCE_REST_API_BASE_URL}/order",
-            # Send the signature as a query param
-            params={"signature": calculate_signature(data)},
-            headers=HEADERS,
-            data=data
-        )
-        # TODO: Better error handling
-        response.raise_for_status()
+    response = await _send(
+        "POST",
+        "/order",
+        # Send the signature as a query param
+        params={"signature": calculate_signature(data)},
+        headers=HEADERS,
+        data=data
+    )
+    _check_order_response(response)
+    # TODO: Better error handling
+    response.raise_for_status()
 
-    return response.json()
+    return loads(response.content)
 
 
-async def get_all_orders() -> List[dict]:
+@timed("get_all_orders")
+async def get_all_orders(symbol: str = SYMBOL, from_order_id: Optional[int] = None) -> List[dict]:
     """
     Get all orders from Binance
+    :param symbol: The symbol to get orders for
+    :param from_order_id: Get up to `ALL_ORDERS_LIMIT` orders from this order ID on, however old,
+    instead of the orders of the last hour
     """
+    await limiter.acquire_request("GET", "/allOrders")
+    now = clock.now_ms()
     # Build the request body
     params = {
-        "symbol": SYMBOL,
-        "timestamp": str(int(time.time() * 1000)),
-        # Get all orders from the last 1 hour
-        "startTime": str(int(time.time() * 1000) - 1 * 60 * 60 * 1000),
-        "endTime": str(int(time.time() * 1000)),
+        "symbol": symbol,
+        "timestamp": str(now),
     }
+    if from_order_id is not None:
+        params["orderId"] = str(from_order_id)
+        params["limit"] = str(ALL_ORDERS_LIMIT)
+    else:
+        # Get all orders from the last 1 hour
+        params["startTime"] = str(now - 1 * 60 * 60 * 1000)
+        params["endTime"] = str(now)
+    if _ws_api_connected():
+        return _ws_result(await _ws_request("allOrders", params))
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{BINANCE_REST_API_BASE_URL}/allOrders",
-            # Send the signature as a query param
-            params={**params, "signature": calculate_signature(params)},
-            headers=HEADERS,
-        )
-        response.raise_for_status()
-    return response.json()
+    response = await _send(
+        "GET",
+        "/allOrders",
+        # Send the signature as a query param
+        params={**params, "signature": calculate_signature(params)},
+        headers=HEADERS,
+    )
+    response.raise_for_status()
+    return loads(response.content)
 
 
-async def cancel_order(order_id: int) -> Optional[dict]:
+async def cancel_order(order_id: int, symbol: str = SYMBOL) -> Optional[dict]:
     """
     Cancel an order from Binance
     :param order_id: The order ID
+    :param symbol: The symbol of the order
+    :return: The cancelled order, None if the cancel failed
     """
-    # Get Binance server time to avoid timestamp errors
-    async with httpx.AsyncClient() as client:
-        time_response = await client.get(BINANCE_TIME_API_URL)
-        if time_response.status_code == 200:
-            timestamp = time_response.json()["serverTime"]
-        else:
-            timestamp = str(int(time.time() * 1000))
+    response, _ = await _cancel_order(order_id, symbol)
+    return response
 
-    # Build the request body
+
+@timed("cancel_order")
+async def _cancel_order(order_id: int, symbol: str) -> Tuple[Optional[dict], Optional[int]]:
+    """
+    :return: The cancelled order, or None and the error code of the exchange
+    """
+    await limiter.acquire_request("DELETE", "/order")
+    # Build the request body. The clock is corrected for server time to avoid timestamp errors
     params = {
-        "symbol": SYMBOL,
+        "symbol": symbol,
         "orderId": order_id,
-        "timestamp": timestamp,
+        "timestamp": clock.timestamp(),
         "recvWindow": 5000,
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(
-            f"{BINANCE_REST_API_BASE_URL}/order",
-            # Send the signature as a query param
-            params={**params, "signature": calculate_signature(params)},
-            headers=HEADERS,
-        )
-        if response.status_code == 200:
-            logger.info(f"Order {order_id} cancelled successfully")
-        else:
-            logger.error(f"Error cancelling order {order_id}: {response.json()}")
-            return
+    if _ws_api_connected():
+        response = await _ws_request("order.cancel", params)
+        if response["status"] != 200:
+            error = response.get("error") or {}
+            logger.error(f"Error cancelling order {order_id}: {error}")
+            return None, error.get("code")
+        logger.info(f"Order {order_id} cancelled successfully")
+        return response["result"], None
 
-    return response.json()
+    response = await _send(
+        "DELETE",
+        "/order",
+        # Send the signature as a query param
+        params={**params, "signature": calculate_signature(params)},
+        headers=HEADERS,
+    )
+    if response.status_code == 200:
+        logger.info(f"Order {order_id} cancelled successfully")
+    else:
+        logger.error(f"Error cancelling order {order_id}: {response.text}")
+        try:
+            return None, loads(response.content).get("code")
+        except ValueError:
+            return None, None
+
+    return loads(response.content), None
+
+
+@timed("cancel_replace")
+async def cancel_replace_order(
+        order_id: int, side: Union[SIDE_BID, SIDE_ASK], price: int, symbol: str = SYMBOL
+) -> dict:
+    """
+    Cancel an order and place a new one in a single request. The new order is only placed if
+    the cancel succeeded
+    :param order_id: The ID of the order to cancel
+    :param side: The side of the new order, either "BUY" or "SELL"
+    :param price: The price of the new order, in ticks
+    :param symbol: The symbol of both orders
+    :return: Dict with "cancelResponse" and "newOrderResponse", either can be None on failure
+    :raises OrderRejected: The new order fails a filter of the symbol, nothing is sent
+    """
+    price, quantity = exchange_info.prepare(symbol, side, price)
+    await limiter.acquire_request("POST", "/order/cancelReplace")
+    # Build the request body
+    data = {
+        "symbol": symbol,
+        "side": side,
+        "type": ORDER_TYPE,
+        "cancelReplaceMode": CANCEL_REPLACE_MODE,
+        "timeInForce": TIME_IN_FORCE,
+        "quantity": quantity,
+        "price": from_ticks(price, price_precision(symbol)),
+        "cancelOrderId": order_id,
+        "timestamp": clock.timestamp(),
+    }
+    if _ws_api_connected():
+        body = await _cancel_replace_order_ws(order_id, data)
+        return _cancel_replace_result(body)
+
+    response = await _send(
+        "POST",
+        "/order/cancelReplace",
+        # Send the signature as a query param
+        params={"signature": calculate_signature(data)},
+        headers=HEADERS,
+        data=data
+    )
+    if response.status_code == 404:
+        raise CancelReplaceUnsupported(response.text)
+    if response.status_code in (400, 409) and "data" in loads(response.content):
+        # 400: the cancel failed, 409: the cancel succeeded but the new order failed
+        error = loads(response.content)
+        logger.error(f"Error replacing order {order_id}: {error}")
+        body = error["data"]
+        _check_filter_failure(body["newOrderResponse"])
+    else:
+        response.raise_for_status()
+        body = loads(response.content)
+    return _cancel_replace_result(body)
+
+
+async def _cancel_replace_order_ws(order_id: int, data: dict) -> dict:
+    response = await _ws_request("order.cancelReplace", data)
+    error = response.get("error") or {}
+    if response["status"] in (400, 409) and "data" in error:
+        logger.error(f"Error replacing order {order_id}: {error}")
+        _check_filter_failure(error["data"]["newOrderResponse"])
+        return error["data"]
+    return _ws_result(response)
+
+
+def _cancel_replace_result(body: dict) -> dict:
+    return {
+        "cancelResponse": body["cancelResponse"] if body["cancelResult"] == "SUCCESS" else None,
+        "newOrderResponse": (
+            body["newOrderResponse"] if body["newOrderResult"] == "SUCCESS" else None
+        ),
+    }
+
+
+async def replace_order(
+        order_id: int, side: Union[SIDE_BID, SIDE_ASK], price: int, symbol: str = SYMBOL
+) -> dict:
+    """
+    Replace an order with one at a new price. Uses the atomic cancelReplace endpoint when it's
+    available, otherwise cancels and places the order in two requests
+    :return: Same shape as `cancel_replace_order`
+    """
+    global _cancel_replace_supported
+    if CANCEL_REPLACE_ENABLED and _cancel_replace_supported:
+        try:
+            return await cancel_replace_order(order_id, side, price, symbol)
+        except CancelReplaceUnsupported:
+            logger.warning("cancelReplace is not supported. Falling back to cancel and place")
+            _cancel_replace_supported = False
+
+    # Keep the order if the new one would be rejected
+    exchange_info.prepare(symbol, side, price)
+    cancel_response, error_code = await _cancel_order(order_id, symbol)
+    if cancel_response is None and error_code != UNKNOWN_ORDER:
+        # The order can still be live, and a new one would make two on the side. Like
+        # STOP_ON_FAILURE, nothing is placed
+        return {"cancelResponse": None, "newOrderResponse": None}
+    return {
+        "cancelResponse": cancel_response,
+        "newOrderResponse": await place_order(side, price, symbol),
+    }
+
+
+async def create_listen_key() -> str:
+    """
+    Start a new user data stream and return its listen key
+    """
+    await limiter.acquire_request("POST", "/userDataStream")
+    response = await _send(
+        "POST",
+        "/userDataStream",
+        headers=HEADERS,
+    )
+    response.raise_for_status()
+    return loads(response.content)["listenKey"]
+
+
+async def get_exchange_info(symbols: List[str]) -> dict:
+    """
+    Get the trading status and filters of symbols
+    :param symbols: The symbols to get, all of them in one request
+    """
+    await limiter.acquire_request("GET", "/exchangeInfo")
+    response = await _send(
+        "GET",
+        "/exchangeInfo",
+        params={"symbols": json.dumps(symbols, separators=(",", ":"))},
+    )
+    response.raise_for_status()
+    return loads(response.content)
+
+
+async def get_depth(symbol: str, limit: int = ORDER_BOOK_SNAPSHOT_LIMIT) -> dict:
+    """
+    Get an order book snapshot
+    :param symbol: The symbol
+    :param limit: Price levels of each side. The weight of `REQUEST_COSTS` is that of up to 1000
+    """
+    await limiter.acquire_request("GET", "/depth")
+    response = await _send("GET", "/depth", params={"symbol": symbol, "limit": limit})
+    response.raise_for_status()
+    return loads(response.content)
+
+
+async def keepalive_listen_key(listen_key: str) -> None:
+    """
+    Extend the validity of a listen key for another 60 minutes
+    :param listen_key: The listen key
+    """
+    await limiter.acquire_request("PUT", "/userDataStream")
+    response = await _send(
+        "PUT",
+        "/userDataStream",
+        params={"listenKey": listen_key},
+        headers=HEADERS,
+    )
+    response.raise_for_status()
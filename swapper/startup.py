@@ -0,0 +1,120 @@
+"""
+Gets the bot from starting to its first order as fast as possible, by warming up every
+connection and fetching every piece of state at the same time
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from swapper.clock import clock
+from swapper.exchange_info import exchange_info
+from swapper.journal import OrderJournal
+from swapper.metrics import STARTUP_SECONDS
+from swapper.service import get_exchange_info
+from swapper.user_stream import UserDataStream
+
+logger = logging.getLogger(__name__)
+
+
+class Startup:
+    """
+    Runs the startup phases concurrently and records when each one finished, counting from the
+    process start, in `swapper_startup_seconds`
+    """
+
+    def __init__(self, started: Optional[float] = None) -> None:
+        """
+        :param started: When the process started, on the monotonic clock
+        """
+        self.started = time.monotonic() if started is None else started
+        self.exchange_info: Optional[dict] = None
+        self._clock_synced: Optional[asyncio.Task] = None
+        self._symbols_checked: Optional[asyncio.Task] = None
+        self._first_order = False
+
+    def mark(self, phase: str) -> float:
+        elapsed = time.monotonic() - self.started
+        STARTUP_SECONDS.labels(phase).set(elapsed)
+        return elapsed
+
+    def order_placed(self) -> None:
+        """
+        Record the time to the first order, called with every order placed
+        """
+        if not self._first_order:
+            self._first_order = True
+            logger.info(f"First order placed {self.mark('first_order'):.3f}s after start")
+
+    async def run(self, *phases: Tuple[str, Awaitable]) -> None:
+        """
+        Run named phases at the same time. Fails as soon as one of them fails
+        """
+        async def run_phase(name: str, phase: Awaitable) -> None:
+            await phase
+            logger.info(f"Startup phase {name} done after {self.mark(name):.3f}s")
+
+        tasks = [asyncio.ensure_future(run_phase(name, phase)) for name, phase in phases]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        logger.info(f"Ready to trade {self.mark('ready'):.3f}s after start")
+
+    async def sync_clock(self) -> None:
+        """
+        Take one clock sample, however many phases wait for it. That's close enough for the
+        timestamps of signed requests, the clock is synced properly once trading
+        """
+        if self._clock_synced is None:
+            self._clock_synced = asyncio.ensure_future(clock.sync(burst=1))
+        await asyncio.shield(self._clock_synced)
+
+    async def check_symbols(self, symbols: List[str]) -> None:
+        """
+        Fetch the exchange info of the symbols and fail if any of them can't be traded. Their
+        filters are cached to check orders against, and their prices are counted in the tick
+        size from then on. Fetched once, however many phases wait for it
+        """
+        if self._symbols_checked is None:
+            self._symbols_checked = asyncio.ensure_future(self._check_symbols(symbols))
+        await asyncio.shield(self._symbols_checked)
+
+    async def wait_for_symbols(self) -> None:
+        """
+        Wait for `check_symbols()`, if it was started, before parsing any price
+        """
+        if self._symbols_checked is not None:
+            await asyncio.shield(self._symbols_checked)
+
+    async def _check_symbols(self, symbols: List[str]) -> None:
+        self.exchange_info = await get_exchange_info(symbols)
+        exchange_info.load(self.exchange_info)
+        statuses = {info["symbol"]: info["status"] for info in self.exchange_info["symbols"]}
+        not_trading = [symbol for symbol in symbols if statuses.get(symbol) != "TRADING"]
+        if not_trading:
+            raise ValueError(f"Symbols not trading: {', '.join(not_trading)}")
+
+    async def connect_user_stream(
+            self, user_stream: UserDataStream, journal: Optional[OrderJournal] = None
+    ) -> None:
+        """
+        Open the stream right away, and take the signed snapshot once the clock is synced
+        :param journal: Rebuild the states from it first, once the tick sizes are known
+        """
+        await user_stream.open()
+        if journal is not None:
+            await self.wait_for_symbols()
+            for symbol, state in user_stream.states.items():
+                journal.load(symbol, state)
+        await self.sync_clock()
+        await self.wait_for_symbols()
+        await user_stream.snapshot()
+
+
+startup = Startup()
@@ -1,38 +1,111 @@
+from collections import OrderedDict
+from collections import defaultdict
 from dataclasses import dataclass
 from dataclasses import field
+from typing import Dict
+from typing import Iterable
+from typing import TYPE_CHECKING
 from typing import List
 from typing import Optional
+from typing import Union
 
+from swapper.constants import ORDER_HISTORY_SIZE
 from swapper.constants import OrderStatus
 from swapper.constants import SIDE_ASK
 from swapper.constants import SIDE_BID
+from swapper.constants import TERMINAL_ORDER_STATUSES
+from swapper.models import Order
+
+if TYPE_CHECKING:
+    from swapper.journal import OrderJournal
 
 
 @dataclass
 class State:
-    orders: dict = field(default_factory=dict)
+    """
+    Orders that can still change are indexed by status and side, so lookups don't scan all of
+    them. Terminal orders move to a bounded history, oldest evicted first
+    """
+    history_size: int = ORDER_HISTORY_SIZE
+    orders: Dict[int, Order] = field(default_factory=dict)
+    history: "OrderedDict[int, Order]" = field(default_factory=OrderedDict)
+    _by_status: Dict[str, Dict[int, Order]] = field(
+        default_factory=lambda: defaultdict(dict), init=False, repr=False
+    )
+    _active_by_side: Dict[str, Dict[int, Order]] = field(
+        default_factory=lambda: defaultdict(dict), init=False, repr=False
+    )
+    # Journals the updates the state accepts, see `swapper.journal`
+    journal: Optional["OrderJournal"] = field(default=None, repr=False, compare=False)
 
-    def add_orders(self, orders: List[dict]) -> None:
+    def add_orders(self, orders: Iterable[Union[Order, dict]]) -> None:
+        added = []
         for order in orders:
-            self.orders[order["orderId"]] = order
+            if not isinstance(order, Order):
+                order = Order.from_dict(order)
+            if self._add(order):
+                added.append(order)
+        if self.journal is not None and added:
+            self.journal.append(added)
+
+    def _add(self, order: Order) -> bool:
+        known = self.get_order(order.order_id)
+        if known:
+            if known.update_time > order.update_time:
+                # Don't let a stale REST snapshot overwrite a newer stream event
+                return False
+            if known == order:
+                # Nothing new, e.g. an unchanged order in a reconciliation snapshot
+                return False
+            self._remove(known)
+
+        if order.status in TERMINAL_ORDER_STATUSES:
+            self.history[order.order_id] = order
+            while len(self.history) > self.history_size:
+                self.history.popitem(last=False)
+            return True
+
+        self.orders[order.order_id] = order
+        self._by_status[order.status][order.order_id] = order
+        if order.status == OrderStatus.NEW.value:
+            self._active_by_side[order.side][order.order_id] = order
+        return True
+
+    def _remove(self, order: Order) -> None:
+        if self.history.pop(order.order_id, None):
+            return
+        del self.orders[order.order_id]
+        del self._by_status[order.status][order.order_id]
+        self._active_by_side[order.side].pop(order.order_id, None)
+
+    def resume_order_id(self) -> Optional[int]:
+        """
+        The first order ID that can have changed since the state was last up to date: the oldest
+        open order, or the one after the newest order when none are open
+        """
+        if self.orders:
+            return min(self.orders)
+        if self.history:
+            return max(self.history) + 1
+        return None
+
+    def get_order(self, order_id: int) -> Optional[Order]:
+        return self.orders.get(order_id) or self.history.get(order_id)
+
+    def get_orders_by_status(self, status: str) -> List[Order]:
+        return list(self._by_status[status].values())
 
-    def get_active_orders(self) -> Optional[List[dict]]:
-        return [
-            order for order in self.orders.values() if order["status"] == OrderStatus.NEW.value
-        ]
+    def get_active_orders(self) -> Optional[List[Order]]:
+        return self.get_orders_by_status(OrderStatus.NEW.value)
 
     def has_active_orders(self) -> bool:
-        return bool(self.get_active_orders())
+        return bool(self._by_status[OrderStatus.NEW.value])
 
     def has_both_bid_ask(self) -> bool:
-        return len(self.get_active_orders()) == 2
+        return bool(self._active_by_side[SIDE_BID]) and bool(self._active_by_side[SIDE_ASK])
 
-    def get_active_bid_order(self) -> Optional[dict]:
-        orders = [order for order in self.get_active_orders() if order["side"] == SIDE_BID]
-        if orders:
-            return orders[0]
+    def get_active_bid_order(self) -> Optional[Order]:
+        return next(iter(self._active_by_side[SIDE_BID].values()), None)
 
-    def get_active_ask_order(self) -> Optional[dict]:
-        orders = [order for order in self.get_active_orders() if order["side"] == SIDE_ASK]
-        if orders:
-            return orders[0]
+    def get_active_ask_order(self) -> Optional[Order]:
+        return next(iter(self._active_by_side[SIDE_ASK].values()), None)
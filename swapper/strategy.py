@@ -0,0 +1,88 @@
+"""
+Decides which orders to place or replace for a kline. Has no I/O, so the live loop and the
+backtest run the exact same logic
+"""
+from decimal import Decimal
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.helpers import calculate_ask_price_based_on_spread
+from swapper.helpers import calculate_bid_price_based_on_spread
+from swapper.helpers import calculate_candle_prices
+from swapper.helpers import order_at_risk
+from swapper.models import Order
+from swapper.orderbook import OrderBook
+from swapper.policy import RepricingPolicy
+from swapper.state import State
+
+PLACE = "PLACE"
+REPLACE = "REPLACE"
+
+
+class Action(NamedTuple):
+    kind: str
+    side: str
+    # Ticks
+    price: int
+    # Order to be replaced
+    order: Optional[Order] = None
+
+
+def get_prices(
+        high_price: int, low_price: int, spread: Optional[float] = None,
+) -> Tuple[int, int]:
+    """
+    Calculate spread and find out the bid and ask price, all prices in ticks
+    :param spread: Spread from a model over several klines, see `swapper.volatility`. The spread
+    of this kline when not given
+    """
+    if spread is None:
+        return calculate_candle_prices(low_price, high_price)
+    return (
+        calculate_bid_price_based_on_spread(low_price, spread),
+        calculate_ask_price_based_on_spread(high_price, spread),
+    )
+
+
+def decide(
+        state: State,
+        high_price: int,
+        low_price: int,
+        spread: Optional[float] = None,
+        policy: Optional[RepricingPolicy] = None,
+        now: int = 0,
+        book: Optional[OrderBook] = None,
+        min_depth_ahead: Decimal = Decimal(0),
+) -> List[Action]:
+    """
+    Place both orders if there are no active orders. Otherwise replace orders at risk to be
+    filled and place the missing side
+    :param policy: Holds back replaces of orders at risk, all of them are replaced when not given
+    :param now: Milliseconds, the time of the kline for the policy
+    :param book: Order book of the symbol. Orders with at most `min_depth_ahead` ahead of them
+    in it are at risk too
+    """
+    curr_bid_price, curr_ask_price = get_prices(high_price, low_price, spread)
+
+    if not state.has_active_orders():
+        return [Action(PLACE, SIDE_BID, curr_bid_price), Action(PLACE, SIDE_ASK, curr_ask_price)]
+
+    actions = []
+    for side, order, price in (
+            (SIDE_BID, state.get_active_bid_order(), curr_bid_price),
+            (SIDE_ASK, state.get_active_ask_order(), curr_ask_price),
+    ):
+        if not order:
+            actions.append(Action(PLACE, side, price))
+        elif order_at_risk(curr_bid_price, curr_ask_price, order) or (
+                book is not None and book.order_at_risk(order, min_depth_ahead)
+        ):
+            if policy is None or policy.should_reprice(curr_bid_price, curr_ask_price, order, now):
+                actions.append(Action(REPLACE, side, price, order))
+        elif policy is not None:
+            policy.forget(side)
+    return actions
@@ -1,30 +1,79 @@
 import asyncio
 import json
 import logging
+import time
 from decimal import Decimal
+from typing import Awaitable
+from typing import List
+from typing import Optional
 
 import websockets
+from httpx import HTTPError
 from httpx import TimeoutException
 from tenacity import retry
+from tenacity import RetryCallState
 from tenacity import retry_if_exception_type
 
-from swapper.constants import SIDE_ASK
-from swapper.constants import SIDE_BID
+from swapper.constants import KLINE_INTERVAL
+from swapper.constants import ORDER_BOOK_ENABLED
+from swapper.constants import ORDER_BOOK_MIN_DEPTH_AHEAD
+from swapper.constants import OrderStatus
+from swapper.constants import PRICE_REFERENCE
 from swapper.constants import SLEEP_TIME
-from swapper.helpers import calculate_ask_price_based_on_spread
+from swapper.constants import SPREAD_MODEL
+from swapper.constants import SYMBOL
+from swapper.errors import RequestFateUnknown
+from swapper.errors import RequestNotSent
+from swapper.errors import SwapperError
+from swapper.exchange_info import exchange_info
 from swapper.helpers import calculate_bid_ask_spread
-from swapper.helpers import calculate_bid_price_based_on_spread
-from swapper.helpers import order_at_risk
-from swapper.service import cancel_order
+from swapper.market_data import MarketDataReader
+from swapper.metrics import RETRIES
+from swapper.metrics import STAGE_SECONDS
+from swapper.models import KlineEvent
+from swapper.models import Order
+from swapper.orderbook import BOOK
+from swapper.orderbook import get_book
+from swapper.policy import get_policy
+from swapper.prices import from_ticks
+from swapper.prices import price_precision
 from swapper.service import get_all_orders
 from swapper.service import place_order
+from swapper.service import replace_order
+from swapper.startup import startup
 from swapper.state import State
+from swapper.strategy import Action
+from swapper.strategy import decide
+from swapper.strategy import PLACE
+from swapper.strategy import REPLACE
+from swapper.volatility import CANDLE
+from swapper.volatility import get_model
 
 logger = logging.getLogger(__name__)
 
 
-@retry(retry=retry_if_exception_type(TimeoutException))
-async def subscribe(websocket: websockets.WebSocketClientProtocol) -> None:
+def _count_retry(retry_state: RetryCallState) -> None:
+    RETRIES.labels(retry_state.fn.__name__).inc()
+
+
+async def send_subscribe(websocket: websockets.WebSocketClientProtocol) -> None:
+    """
+    Subscribe to the kline stream of the symbol, and its depth stream with the order book
+    """
+    streams = [f"{SYMBOL.lower()}@kline_{KLINE_INTERVAL}"]
+    if ORDER_BOOK_ENABLED:
+        streams.append(f"{SYMBOL.lower()}@depth@100ms")
+    await websocket.send(json.dumps({
+        "method": "SUBSCRIBE",
+        "params": streams,
+        "id": 1
+    }))
+
+
+@retry(retry=retry_if_exception_type(TimeoutException), before_sleep=_count_retry)
+async def subscribe(
+        websocket: websockets.WebSocketClientProtocol, state: Optional[State] = None
+) -> None:
     """
     Subscribe to the BTCUSDT 1s kline stream. Continuously listen to the websocket and calculate
     spread changes.
@@ -35,18 +84,37 @@ async def subscribe(websocket: websockets.WebSocketClientProtocol) -> None:
     3. There are existing orders on the exchange. We need to load them to state and monitor if
         their price is getting closer to order be filled. If so, we need to cancel orders and place
         new ones
+
+    When `state` is given, it is expected to be kept up to date by the user data stream and
+    orders are read from memory. Otherwise all orders are polled from REST before every message
     """
-    await websocket.send(json.dumps({
-        "method": "SUBSCRIBE",
-        "params": ["btcusdt@kline_1m"],
-        "id": 1
-    }))
+    await send_subscribe(websocket)
 
+    reader = MarketDataReader(websocket)
+    reading = asyncio.create_task(reader.run())
+    try:
+        await trade(reader, state)
+    finally:
+        reading.cancel()
+
+
+async def trade(
+        reader: MarketDataReader, state: Optional[State] = None, symbol: str = SYMBOL
+) -> None:
+    """
+    Trading loop. Every iteration prices off the freshest kline the reader has
+    """
+    poll_orders = state is None
     while True:
-        # First, get all orders and load them to state
-        state = State()
-        orders = await get_all_orders()
-        state.add_orders(orders)
+        if poll_orders:
+            # First, get all orders and load them to state
+            try:
+                state = await load_state(symbol)
+            except (HTTPError, SwapperError) as err:
+                # E.g. rate limited. Wait instead of dropping the connection
+                logger.error(f"Loading orders failed: {err!r}. Sleeping for {SLEEP_TIME} seconds")
+                await asyncio.sleep(SLEEP_TIME)
+                continue
 
         if len(state.get_active_orders()) > 2:
             # If there are more than 2 active orders, something is wrong. Let it resolve itself
@@ -54,68 +122,112 @@ async def subscribe(websocket: websockets.WebSocketClientProtocol) -> None:
             await asyncio.sleep(SLEEP_TIME)
             continue
 
-        klines_response = await websocket.recv()
-        data = json.loads(klines_response)
-        if not data or data.get('k') is None:
+        kline = await reader.get()
+        if not isinstance(kline, KlineEvent):
             # Sleep for a bit in case of a connection error
             logger.info(f"No data received from websocket. Sleeping for {SLEEP_TIME} seconds")
             await asyncio.sleep(SLEEP_TIME)
             continue
-        # Calculate spread and find out the bid and ask price
-        high_price = Decimal(data["k"]["h"])
-        low_price = Decimal(data["k"]["l"])
-
-        spread = calculate_bid_ask_spread(low_price, high_price)
-        curr_bid_price = calculate_bid_price_based_on_spread(low_price, spread)
-        curr_ask_price = calculate_ask_price_based_on_spread(high_price, spread)
-
-        # Create two new active orders if there are no active orders
-        if not state.has_active_orders():
-            initial_orders_placement = await asyncio.gather(
-                *[place_order(SIDE_BID, curr_bid_price),
-                  place_order(SIDE_ASK, curr_ask_price)]
-            )
-            logger.info(
-                f"Placed BID order: {initial_orders_placement[0]['orderId']} "
-                f"with ${round(curr_bid_price, 2)} price"
-                f"Placed ASK order: {initial_orders_placement[0]['orderId']} "
-                f"with ${round(curr_ask_price, 2)} price"
+        await on_kline(state, kline, symbol)
+
+
+async def load_state(symbol: str = SYMBOL) -> State:
+    state = State()
+    orders = await get_all_orders(symbol)
+    state.add_orders(orders)
+    return state
+
+
+async def on_kline(state: State, kline: KlineEvent, symbol: str = SYMBOL) -> None:
+    """
+    Price a kline and place, or replace the orders of one symbol. Both sides are handled at the
+    same time
+    """
+    with STAGE_SECONDS.labels("tick").time():
+        with STAGE_SECONDS.labels("pricing").time():
+            spread = None
+            if SPREAD_MODEL != CANDLE:
+                model = get_model(symbol)
+                model.update(kline.open_time, kline.high, kline.low)
+                spread = model.spread(SPREAD_MODEL)
+            high, low = kline.high, kline.low
+            exchange_info.set_reference_price(symbol, (high + low) // 2)
+            book = get_book(symbol) if ORDER_BOOK_ENABLED else None
+            if book is not None and not book.ready:
+                book = None
+            if book is not None and PRICE_REFERENCE == BOOK:
+                if spread is None:
+                    spread = calculate_bid_ask_spread(low, high)
+                high, low = book.best_ask, book.best_bid
+            actions = decide(
+                state, high, low, spread, get_policy(symbol), kline.event_time, book,
+                Decimal(ORDER_BOOK_MIN_DEPTH_AHEAD),
             )
-        else:
-            # There are active orders. Check if they need to be cancelled and replaced
-            bid_order = state.get_active_bid_order()
-            if bid_order and order_at_risk(curr_bid_price, curr_ask_price, bid_order):
-                logger.warning(
-                    f"Bid Order {bid_order['orderId']} is close to be filled. Cancelling now!"
-                )
-                # Cancel the order
-                await cancel_order(bid_order['orderId'])
-                new_order = await place_order(SIDE_BID, curr_bid_price)
-                logger.info(
-                    f"Placed BID order: {new_order['orderId']} "
-                    f"with ${round(curr_bid_price, 2)} price"
-                )
-            elif not bid_order:
-                new_order = await place_order(SIDE_BID, curr_bid_price)
-                logger.info(
-                    f"Placed BID order: {new_order['orderId']} "
-                    f"with ${round(curr_bid_price, 2)} price"
-                )
-            ask_order = state.get_active_ask_order()
-            if ask_order and order_at_risk(curr_bid_price, curr_ask_price, ask_order):
-                logger.warning(
-                    f"Ask Order {ask_order['orderId']} is close to be filled. Cancelling now!"
-                )
-                # Cancel the order
-                await cancel_order(ask_order['orderId'])
-                new_order = await place_order(SIDE_ASK, curr_ask_price)
-                logger.info(
-                    f"Placed ASK order: {new_order['orderId']} "
-                    f"with ${round(curr_ask_price, 2)} price"
-                )
-            elif not ask_order:
-                new_order = await place_order(SIDE_ASK, curr_ask_price)
-                logger.info(
-                    f"Placed ASK order: {new_order['orderId']} "
-                    f"with ${round(curr_ask_price, 2)} price"
-                )
+        await _run_concurrently([_execute(state, symbol, action) for action in actions])
+
+
+async def _execute(state: State, symbol: str, action: Action) -> None:
+    if action.kind == PLACE:
+        await _place(state, symbol, action.side, action.price)
+    elif action.kind == REPLACE:
+        logger.warning(
+            "%(symbol)s %(side)s Order %(order_id)s is close to be filled. Replacing now!",
+            {"symbol": symbol, "side": action.side, "order_id": action.order.order_id},
+        )
+        await _replace(state, symbol, action.order, action.price)
+
+
+async def _place(state: State, symbol: str, side: str, price: int) -> None:
+    started = time.perf_counter()
+    new_order = await place_order(side, price, symbol)
+    latency = time.perf_counter() - started
+    startup.order_placed()
+    state.add_orders([new_order])
+    _log_placed(symbol, side, new_order, price, latency)
+
+
+async def _replace(state: State, symbol: str, order: Order, price: int) -> None:
+    started = time.perf_counter()
+    result = await replace_order(order.order_id, order.side, price, symbol)
+    latency = time.perf_counter() - started
+    if result["cancelResponse"]:
+        state.add_orders([order._replace(status=OrderStatus.CANCELED.value)])
+    new_order = result["newOrderResponse"]
+    if new_order:
+        startup.order_placed()
+        state.add_orders([new_order])
+        _log_placed(symbol, order.side, new_order, price, latency)
+
+
+def _log_placed(symbol: str, side: str, new_order: dict, price: int, latency: float) -> None:
+    # Fields for `swapper.log.JsonFormatter`, formatted off the event loop. The price is the one
+    # after rounding to the filters of the symbol
+    logger.info(
+        "Placed %(symbol)s %(side)s order: %(order_id)s with $%(price)s price",
+        {
+            "symbol": symbol,
+            "side": side,
+            "order_id": new_order["orderId"],
+            "price": new_order.get("price", from_ticks(price, price_precision(symbol))),
+            "latency_ms": round(latency * 1000, 3),
+        },
+    )
+
+
+async def _run_concurrently(requests: List[Awaitable]) -> None:
+    """
+    Run order requests at the same time. A failed request is logged and doesn't affect the
+    others, the next tick will retry it
+    """
+    results = await asyncio.gather(*requests, return_exceptions=True)
+    for result in results:
+        if isinstance(result, RequestNotSent):
+            # Rate limited or failing a filter, the exchange has nothing to undo
+            logger.error("Order request not sent: %r", result)
+        elif isinstance(result, RequestFateUnknown):
+            # The order may exist. The user data stream, or the next poll, tells
+            logger.error("Order request got no response: %r", result)
+        elif isinstance(result, (HTTPError, SwapperError)):
+            logger.error("Order request failed: %r", result)
+        elif isinstance(result, BaseException):
+            raise result
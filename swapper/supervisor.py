@@ -0,0 +1,258 @@
+"""
+Keeps market data streaming through dropped connections, stalled streams and the connection
+limit of 24 hours
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+from urllib.parse import urlsplit
+
+import websockets
+
+from swapper.constants import BINANCE_WS_MARKET_STREAM_MIRRORS
+from swapper.constants import MARKET_DATA_CONNECT_TIMEOUT
+from swapper.constants import MARKET_DATA_MAX_CONNECTION_AGE
+from swapper.constants import MARKET_DATA_MAX_RECONNECT_DELAY
+from swapper.constants import MARKET_DATA_PING_INTERVAL
+from swapper.constants import MARKET_DATA_STALE_AFTER
+from swapper.constants import MARKET_DATA_STANDBY
+from swapper.market_data import MarketDataReader
+from swapper.metrics import MARKET_DATA_GAP_SECONDS
+from swapper.metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+Websocket = websockets.WebSocketClientProtocol
+
+
+def market_stream_urls(
+        url: str, mirrors: Dict[str, List[str]] = BINANCE_WS_MARKET_STREAM_MIRRORS
+) -> List[str]:
+    """
+    The URL and the same stream on every mirror of its host
+    """
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    path = url[len(origin):]
+    return [url] + [mirror + path for mirror in mirrors.get(origin, [])]
+
+
+def backoff_delay(
+        attempt: int, base: float = 0.5, cap: float = MARKET_DATA_MAX_RECONNECT_DELAY
+) -> float:
+    """
+    Seconds to wait before reconnect attempt number `attempt`, counting from 0. Full jitter, so
+    clients dropped at the same time don't reconnect at the same time
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+@dataclass
+class SupervisorStats:
+    connects: int = 0
+    disconnects: int = 0
+    # Connections replaced for not streaming
+    stale: int = 0
+    # Frames already published from another connection
+    duplicates: int = 0
+    # Seconds without any connection streaming, from the last frame to the next
+    gaps: int = 0
+    last_gap: float = 0.0
+    max_gap: float = 0.0
+
+
+class MarketDataSupervisor:
+    """
+    Keeps a connection streaming into a `MarketDataReader`, or two with `standby`. A connection
+    races all endpoints and keeps the first one to open, the standby prefers an endpoint the other
+    connection isn't on. Both stream at the same time and every frame is published once, by its
+    exchange event time, so losing either connection loses no frames.
+
+    A connection is replaced when it stops answering pings, hasn't streamed for `stale_after`
+    seconds or reaches `max_connection_age`. Reconnects back off exponentially with jitter
+    """
+
+    def __init__(
+            self,
+            urls: List[str],
+            reader: MarketDataReader,
+            on_connect: Optional[Callable[[Websocket], Awaitable[None]]] = None,
+            standby: bool = MARKET_DATA_STANDBY,
+            connect_timeout: float = MARKET_DATA_CONNECT_TIMEOUT,
+            ping_interval: float = MARKET_DATA_PING_INTERVAL,
+            stale_after: float = MARKET_DATA_STALE_AFTER,
+            max_connection_age: float = MARKET_DATA_MAX_CONNECTION_AGE,
+    ) -> None:
+        """
+        :param urls: Endpoints of the same streams, see `market_stream_urls()`
+        :param on_connect: Called with every new connection, e.g. to subscribe to streams
+        """
+        self.urls = urls
+        self.reader = reader
+        self.on_connect = on_connect
+        self.standby = standby
+        self.connect_timeout = connect_timeout
+        self.ping_interval = ping_interval
+        self.stale_after = stale_after
+        self.max_connection_age = max_connection_age
+        self.stats = SupervisorStats()
+        # Connection slot -> URL it's connected to
+        self._urls_in_use: Dict[int, str] = {}
+        # Connection -> when it last received a message, on the monotonic clock
+        self._received_at: Dict[Websocket, float] = {}
+        # Connections that have published or deduplicated a frame
+        self._streaming: Set[Websocket] = set()
+        # Stream -> event time of the last frame published
+        self._event_times: Dict[object, int] = {}
+        self._last_frame: Optional[float] = None
+        self._gap_started: Optional[float] = None
+
+    async def run(self) -> None:
+        await asyncio.gather(*(
+            self._keep_connected(slot) for slot in range(2 if self.standby else 1)
+        ))
+
+    async def _keep_connected(self, slot: int) -> None:
+        attempt = 0
+        while True:
+            try:
+                url, websocket = await self._connect(slot)
+            except (OSError, websockets.WebSocketException, asyncio.TimeoutError) as err:
+                delay = backoff_delay(attempt)
+                attempt += 1
+                logger.error(f"Market data connection failed: {err!r}. Retrying in {delay:.1f}s")
+                RETRIES.labels("market_data").inc()
+                await asyncio.sleep(delay)
+                continue
+
+            self._urls_in_use[slot] = url
+            self.stats.connects += 1
+            logger.info(f"Market data connected to {url}")
+            try:
+                if self.on_connect is not None:
+                    await self.on_connect(websocket)
+                await self._stream(websocket)
+            except (OSError, websockets.ConnectionClosed) as err:
+                logger.warning(f"Market data connection to {url} lost: {err!r}")
+            finally:
+                if websocket in self._streaming:
+                    # Connections that streamed reconnect right away, the others back off
+                    attempt = 0
+                self._urls_in_use.pop(slot, None)
+                self._lost(websocket)
+                await websocket.close()
+
+            self.stats.disconnects += 1
+            RETRIES.labels("market_data").inc()
+            delay = backoff_delay(attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _connect(self, slot: int) -> Tuple[str, Websocket]:
+        """
+        Open a connection to every endpoint at the same time and keep the first one to open.
+        Endpoints the other slot is on are only tried when there are no others
+        """
+        taken = {url for other, url in self._urls_in_use.items() if other != slot}
+        urls = [url for url in self.urls if url not in taken] or self.urls
+        tasks = {asyncio.create_task(self._open(url)): url for url in urls}
+        winner = None
+        error: Optional[BaseException] = None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return tasks[task], task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif task is not winner and not task.cancelled() and task.exception() is None:
+                    # Opened at the same time as the winner
+                    await task.result().close()
+
+    async def _open(self, url: str) -> Websocket:
+        return await websockets.connect(
+            url,
+            open_timeout=self.connect_timeout,
+            ping_interval=self.ping_interval,
+            ping_timeout=self.ping_interval,
+        )
+
+    async def _stream(self, websocket: Websocket) -> None:
+        self._received_at[websocket] = time.monotonic()
+        watching = asyncio.create_task(self._watch(websocket))
+        try:
+            async for message in websocket:
+                self._receive(websocket, message)
+                # Let the trading loop pick the frame up if it is waiting for one
+                await asyncio.sleep(0)
+        finally:
+            watching.cancel()
+
+    async def _watch(self, websocket: Websocket) -> None:
+        """
+        Close the connection once it's stale or too old, which ends `_stream()`
+        """
+        opened = time.monotonic()
+        while True:
+            await asyncio.sleep(min(self.stale_after, self.max_connection_age) / 4)
+            now = time.monotonic()
+            if now - opened >= self.max_connection_age:
+                logger.info("Replacing market data connection before the exchange drops it")
+                break
+            if now - self._received_at[websocket] >= self.stale_after:
+                logger.warning(f"No market data for {self.stale_after}s. Replacing connection")
+                self.stats.stale += 1
+                break
+        await websocket.close()
+
+    def _receive(self, websocket: Websocket, message: Union[bytes, str]) -> None:
+        now = time.monotonic()
+        self._received_at[websocket] = now
+        data = self.reader.parse(message)
+        if data is None:
+            return
+        self._streaming.add(websocket)
+
+        event = data.get("data", data)
+        event_time = event.get("E")
+        if event_time is not None:
+            # Combined streams are named in the envelope, raw streams by event type and symbol
+            key = data.get("stream") or (event.get("e"), event.get("s"))
+            if event_time <= self._event_times.get(key, 0):
+                self.stats.duplicates += 1
+                return
+            self._event_times[key] = event_time
+
+        if self._gap_started is not None:
+            gap = now - self._gap_started
+            self._gap_started = None
+            self.stats.gaps += 1
+            self.stats.last_gap = gap
+            self.stats.max_gap = max(self.stats.max_gap, gap)
+            MARKET_DATA_GAP_SECONDS.labels().observe(gap)
+            logger.warning(f"Market data gap of {gap:.3f}s")
+        self._last_frame = now
+        self.reader.publish(data)
+
+    def _lost(self, websocket: Websocket) -> None:
+        self._received_at.pop(websocket, None)
+        self._streaming.discard(websocket)
+        if not self._streaming and self._gap_started is None and self._last_frame is not None:
+            self._gap_started = self._last_frame
@@ -2,6 +2,12 @@ import time
 
 import pytest
 
+from swapper.client import set_client
+from swapper.clock import clock
+from swapper.exchange_info import exchange_info
+from swapper.metrics import registry
+from swapper.ratelimit import limiter
+
 
 @pytest.fixture
 def patch_time(monkeypatch):
@@ -10,3 +16,20 @@ def patch_time(monkeypatch):
 
     monkeypatch.setattr(time, "time", mock_time)
     yield
+
+
+@pytest.fixture(autouse=True)
+def reset_client():
+    # Every test runs on its own event loop, so don't share the pooled client between them.
+    # Metrics, rate limits and exchange info start from zero too
+    set_client(None)
+    clock.samples.clear()
+    registry.reset()
+    limiter.reset()
+    exchange_info.clear()
+    yield
+    set_client(None)
+    clock.samples.clear()
+    registry.reset()
+    limiter.reset()
+    exchange_info.clear()
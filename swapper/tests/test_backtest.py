@@ -0,0 +1,113 @@
+import json
+from decimal import Decimal
+
+from swapper.backtest import load_klines
+from swapper.backtest import replay
+from swapper.backtest import SimulatedExchange
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.models import Kline
+from swapper.policy import RepricingPolicy
+from swapper.prices import to_ticks
+
+
+def _kline(open_time: int, high: str, low: str, close: str = None) -> Kline:
+    return Kline(open_time, to_ticks(low), to_ticks(high), to_ticks(low), to_ticks(close or high))
+
+
+def test_load_klines_csv(tmp_path):
+    path = tmp_path / "BTCUSDT-1m-2023-02.csv"
+    path.write_text(
+        "open_time,open,high,low,close,volume,close_time,quote_volume,count,"
+        "taker_buy_volume,taker_buy_quote_volume,ignore\n"
+        "1675209600000,23125.13,23135.83,23114.01,23127.33,128.42,1675209659999,"
+        "2969786.97,4122,63.63,1471455.07,0\n"
+    )
+    assert list(load_klines(str(path))) == [
+        Kline(
+            1675209600000,
+            2312513, 2313583, 2311401, 2312733,
+        )
+    ]
+
+
+def test_load_klines_jsonl(tmp_path):
+    path = tmp_path / "klines.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"e": "kline", "s": "BTCUSDT", "k": {
+            "t": 1, "o": "1.0", "h": "3.0", "l": "0.5", "c": "2.0"
+        }}),
+        json.dumps({"stream": "btcusdt@kline_1m", "data": {"k": {
+            "t": 2, "o": "2.0", "h": "3.0", "l": "1.5", "c": "2.5"
+        }}}),
+        json.dumps([3, "2.5", "4.0", "2.0", "3.5", "10.0", 4]),
+        "",
+    ]))
+    assert [kline.open_time for kline in load_klines(str(path))] == [1, 2, 3]
+    assert list(load_klines(str(path)))[2].high == 400
+
+
+def test_simulated_exchange_fills():
+    exchange = SimulatedExchange(quantity=Decimal("1"))
+    bid = exchange.place(SIDE_BID, 10000, now=1)
+    ask = exchange.place(SIDE_ASK, 11000, now=1)
+
+    fills = exchange.match(_kline(2, high="105", low="100"))
+    assert [(order.order_id, order.status) for order, _ in fills] == [(bid.order_id, "FILLED")]
+    assert list(exchange.resting) == [ask.order_id]
+
+
+def test_simulated_exchange_replace_filled_order():
+    exchange = SimulatedExchange()
+    bid = exchange.place(SIDE_BID, 10000, now=1)
+    exchange.match(_kline(2, high="105", low="99"))
+    assert exchange.replace(bid.order_id, SIDE_BID, 9800, now=3) == (None, None)
+    assert exchange.placed == 1
+
+
+def test_replay():
+    klines = [
+        # Places bid at 80 and ask at 111.11
+        _kline(1, high="100", low="90"),
+        # Fills the bid and places a new one
+        _kline(2, high="100", low="75"),
+        _kline(3, high="100", low="95"),
+    ]
+    result, fills = replay(klines)
+    assert [(fill.side, fill.price) for fill in fills] == [(SIDE_BID, 8000)]
+    assert result.klines == 3
+    assert result.decisions == 3
+    assert result.fills == 1
+    assert result.position == Decimal("0.01")
+    assert result.cash == Decimal("-0.8")
+    assert result.pnl == Decimal("0.2")
+    assert result.order_churn == result.orders_placed + result.orders_cancelled
+    assert result.summary()["fills"] == 1
+
+
+def test_replay_rolling_spread_model():
+    # A quiet kline after a wide one. Priced off its own range the orders get filled when the
+    # market moves again, priced off the range of the window they stay clear
+    klines = [
+        _kline(1, "10100", "10000"),
+        _kline(2, "10010", "10000"),
+        _kline(3, "10030", "9985"),
+    ]
+    _, fills = replay(klines)
+    assert len(fills) == 2
+    _, fills = replay(klines, spread_model="rolling")
+    assert fills == []
+
+
+def test_replay_repricing_policy():
+    klines = [
+        _kline(1, "10100", "10000"),
+        _kline(2, "10010", "10000"),
+        _kline(3, "10030", "9985"),
+        _kline(4, "10030", "9985"),
+    ]
+    result, _ = replay(klines)
+    assert (result.orders_cancelled, result.repricings_suppressed) == (4, 0)
+    # The second replaces of both sides come too soon after the first
+    result, _ = replay(klines, policy=RepricingPolicy(cooldown=10))
+    assert (result.orders_cancelled, result.repricings_suppressed) == (2, 2)
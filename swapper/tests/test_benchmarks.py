@@ -0,0 +1,30 @@
+from benchmarks.run import Benchmark
+from benchmarks.run import BENCHMARKS
+from benchmarks.run import compare
+from benchmarks.run import measure
+
+
+def test_compare():
+    baseline = {"fast": 100.0, "slow": 100.0, "removed": 100.0}
+    results = {"fast": 80.0, "slow": 131.0, "new": 1000.0}
+    assert compare(results, baseline, tolerance=0.3) == ["slow"]
+    assert compare(results, baseline, tolerance=0.4) == []
+
+
+def test_measure():
+    assert measure(Benchmark(lambda: lambda: None, is_async=False), repeat=1) > 0
+
+
+def test_hot_paths_are_covered():
+    assert {
+        "calculate_signature",
+        "calculate_bid_ask_spread",
+        "calculate_bid_price_based_on_spread",
+        "calculate_ask_price_based_on_spread",
+        "order_at_risk",
+        "state_lookup_10",
+        "state_lookup_1000",
+        "state_lookup_100000",
+        "kline_decode",
+        "tick",
+    } <= set(BENCHMARKS)
@@ -0,0 +1,39 @@
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from swapper.client import create_client
+from swapper.client import get_client
+from swapper.client import open_client
+from swapper.constants import BINANCE_REST_API_BASE_URL
+from swapper.constants import HTTP_MAX_CONNECTIONS
+from swapper.service import get_all_orders
+
+
+def test_get_client_is_reused():
+    assert get_client() is get_client()
+
+
+def test_create_client_limits():
+    client = create_client(http2=False)
+    pool = client._transport._pool
+    assert pool._max_connections == HTTP_MAX_CONNECTIONS
+
+
+@pytest.mark.asyncio
+async def test_open_client_closes_pool():
+    async with open_client() as client:
+        assert get_client() is client
+    assert client.is_closed
+    assert get_client() is not client
+
+
+@pytest.mark.asyncio
+async def test_open_client_injected(httpx_mock: HTTPXMock, patch_time):
+    httpx_mock.add_response(json=[])
+    injected = httpx.AsyncClient()
+    async with open_client(injected):
+        assert await get_all_orders() == []
+    request = httpx_mock.get_request()
+    assert str(request.url).startswith(f"{BINANCE_REST_API_BASE_URL}/allOrders")
+    assert injected.is_closed
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from swapper.clock import ClockSample
+from swapper.clock import ClockSync
+from swapper.constants import BINANCE_TIME_API_URL
+
+
+def test_no_samples_uses_local_time(patch_time):
+    clock = ClockSync()
+    assert clock.offset == 0
+    assert clock.now_ms() == int(time.time() * 1000)
+    assert clock.timestamp() == str(int(time.time() * 1000))
+
+
+def test_best_sample_has_lowest_rtt(patch_time):
+    clock = ClockSync()
+    clock.samples.extend([
+        ClockSample(offset=500, rtt=80),
+        ClockSample(offset=250, rtt=10),
+        ClockSample(offset=-100, rtt=40),
+    ])
+    assert clock.offset == 250
+    assert clock.now_ms() == int(time.time() * 1000 + 250)
+
+
+def test_old_samples_are_dropped():
+    clock = ClockSync(max_samples=2)
+    clock.samples.extend([
+        ClockSample(offset=1, rtt=1),
+        ClockSample(offset=2, rtt=20),
+        ClockSample(offset=3, rtt=30),
+    ])
+    assert clock.offset == 2
+
+
+@pytest.mark.asyncio
+async def test_sync(httpx_mock: HTTPXMock, patch_time):
+    server_time = int(time.time() * 1000) + 1000
+    httpx_mock.add_response(url=BINANCE_TIME_API_URL, json={"serverTime": server_time})
+    clock = ClockSync()
+    best = await clock.sync(burst=1)
+    # Server is assumed to read its clock halfway through the round trip
+    assert best.offset + best.rtt / 2 == pytest.approx(1000)
+    assert clock.now_ms() == int(time.time() * 1000 + best.offset)
+
+
+@pytest.mark.asyncio
+async def test_sync_failure_keeps_previous_estimate(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(url=BINANCE_TIME_API_URL, status_code=500)
+    clock = ClockSync()
+    clock.samples.append(ClockSample(offset=42, rtt=5))
+    assert await clock.sync(burst=1) == ClockSample(offset=42, rtt=5)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content", [b"<html>Bad gateway</html>", b"{}"])
+async def test_sync_invalid_response_keeps_previous_estimate(httpx_mock: HTTPXMock, content):
+    httpx_mock.add_response(url=BINANCE_TIME_API_URL, content=content)
+    clock = ClockSync()
+    clock.samples.append(ClockSample(offset=42, rtt=5))
+    assert await clock.sync(burst=1) == ClockSample(offset=42, rtt=5)
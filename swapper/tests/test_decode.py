@@ -0,0 +1,27 @@
+from swapper.decode import decode_kline
+from swapper.decode import loads
+from swapper.exchange_info import exchange_info
+from swapper.models import KlineEvent
+
+FRAME = b'{"e":"kline","E":1675609847732,"s":"BTCUSDT","k":{"h":"23180.67","l":"23167.50"}}'
+
+
+def test_decode_kline():
+    assert decode_kline(loads(FRAME)) == KlineEvent(
+        "BTCUSDT", 1675609847732, 2318067, 2316750
+    )
+
+
+def test_decode_kline_in_ticks_of_symbol():
+    exchange_info.load({"symbols": [{"symbol": "DOGEUSDT", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.00001000", "maxPrice": "0",
+         "tickSize": "0.00001000"},
+    ]}]})
+    frame = b'{"e":"kline","E":1,"s":"DOGEUSDT","k":{"h":"0.08213","l":"0.08209"}}'
+    assert decode_kline(loads(frame)) == KlineEvent("DOGEUSDT", 1, 8213, 8209)
+
+
+def test_loads_without_orjson(monkeypatch):
+    monkeypatch.setattr("swapper.decode.ORJSON_AVAILABLE", False)
+    assert loads(FRAME)["k"] == {"h": "23180.67", "l": "23167.50"}
+    assert loads(FRAME.decode())["s"] == "BTCUSDT"
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+
+import pytest
+from httpx import HTTPStatusError
+
+from swapper.engine import Engine
+from swapper.models import KlineEvent
+from swapper.state import State
+
+
+class _ExitLoop(Exception):
+    pass
+
+
+def _kline(symbol: str) -> str:
+    return json.dumps({
+        "stream": f"{symbol.lower()}@kline_1m",
+        "data": {"e": "kline", "s": symbol, "k": {"h": "23180.67", "l": "23167.50"}},
+    })
+
+
+@pytest.mark.asyncio
+async def test_subscribe_in_batches(mocker):
+    mocker.patch("swapper.engine.ENGINE_SUBSCRIBE_BATCH", 2)
+    sleep = mocker.patch("swapper.engine.asyncio.sleep")
+    websocket = MagicMock(send=AsyncMock())
+    await Engine(["BTCUSDT", "ETHUSDT", "BNBUSDT"]).subscribe(websocket)
+
+    messages = [json.loads(call.args[0]) for call in websocket.send.await_args_list]
+    assert [message["params"] for message in messages] == [
+        ["btcusdt@kline_1m", "ethusdt@kline_1m"], ["bnbusdt@kline_1m"]
+    ]
+    assert [message["id"] for message in messages] == [1, 2]
+    assert sleep.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_state_per_symbol(mocker):
+    place_order = mocker.patch(
+        "swapper.subscribe.place_order",
+        side_effect=lambda side, price, symbol: {
+            "orderId": f"{symbol}-{side}", "status": "NEW", "side": side, "symbol": symbol
+        },
+    )
+    get_all_orders = mocker.patch("swapper.subscribe.get_all_orders")
+    frames = [_kline("BTCUSDT"), _kline("ETHUSDT"), _kline("XRPUSDT"), _ExitLoop()]
+    websocket = MagicMock(send=AsyncMock(), recv=AsyncMock(side_effect=frames))
+    states = {"BTCUSDT": State(), "ETHUSDT": State()}
+
+    with pytest.raises(_ExitLoop):
+        await Engine(["BTCUSDT", "ETHUSDT"], states, workers=2).run(websocket)
+
+    assert get_all_orders.call_count == 0
+    assert place_order.call_count == 4
+    for symbol, state in states.items():
+        assert state.has_both_bid_ask()
+        assert state.get_active_bid_order().symbol == symbol
+
+
+@pytest.mark.asyncio
+async def test_busy_symbol_gets_latest_kline_next(mocker):
+    engine = Engine(["BTCUSDT"], {"BTCUSDT": State()}, workers=2)
+    release = asyncio.Event()
+    ticks = []
+
+    async def tick(symbol, kline):
+        ticks.append(kline.high)
+        await release.wait()
+
+    mocker.patch.object(engine, "tick", side_effect=tick)
+    reader = MagicMock(get=AsyncMock(side_effect=[
+        KlineEvent("BTCUSDT", 0, 1, 1),
+        KlineEvent("BTCUSDT", 0, 2, 2),
+        KlineEvent("BTCUSDT", 0, 3, 3),
+        _ExitLoop(),
+    ]))
+    first = asyncio.create_task(engine._work(reader))
+    await asyncio.sleep(0)
+    # Second worker finds the symbol busy and leaves the newest kline for the first one
+    with pytest.raises(_ExitLoop):
+        await engine._work(reader)
+    release.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    first.cancel()
+    assert ticks == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_tick_failure_is_contained(mocker):
+    mocker.patch(
+        "swapper.engine.on_kline",
+        side_effect=HTTPStatusError("Bad Request", request=MagicMock(), response=MagicMock()),
+    )
+    engine = Engine(["BTCUSDT"], {"BTCUSDT": State()})
+    await engine.tick("BTCUSDT", KlineEvent("BTCUSDT", 0, 1, 1))
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from decimal import Decimal
+
+import pytest
+from httpx import HTTPStatusError
+from pytest_httpx import HTTPXMock
+
+from swapper.constants import BINANCE_REST_API_BASE_URL
+from swapper.constants import PRICE_PRECISION
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.exchange_info import exchange_info
+from swapper.exchange_info import ExchangeInfo
+from swapper.exchange_info import OrderRejected
+from swapper.exchange_info import SymbolFilters
+from swapper.metrics import ORDERS_REJECTED
+from swapper.prices import price_precision
+from swapper.service import calculate_signature
+from swapper.service import place_order
+from swapper.service import replace_order
+
+FILTERS = [
+    {"filterType": "PRICE_FILTER", "minPrice": "0.10000000", "maxPrice": "1000000.00000000",
+     "tickSize": "0.05000000"},
+    {"filterType": "LOT_SIZE", "minQty": "0.00100000", "maxQty": "100.00000000",
+     "stepSize": "0.00100000"},
+    {"filterType": "NOTIONAL", "minNotional": "5.00000000", "applyMinToMarket": True,
+     "maxNotional": "9000000.00000000", "applyMaxToMarket": False, "avgPriceMins": 5},
+    {"filterType": "PERCENT_PRICE_BY_SIDE", "bidMultiplierUp": "5", "bidMultiplierDown": "0.2",
+     "askMultiplierUp": "5", "askMultiplierDown": "0.2", "avgPriceMins": 5},
+]
+EXCHANGE_INFO = {"symbols": [{"symbol": "BTCUSDT", "status": "TRADING", "filters": FILTERS}]}
+
+
+def test_compile_filters():
+    filters = SymbolFilters("BTCUSDT", FILTERS, Decimal("0.0125"))
+    assert filters.precision == 2
+    assert filters.tick == 5
+    assert (filters.min_price, filters.max_price) == (10, 100000000)
+    assert filters.quantity_text == "0.012"
+    assert filters.quantity_valid
+    # 5 / 0.012 = 416.67 rounded up, 9000000 / 0.012 rounded down
+    assert filters.min_notional_price == 41667
+    assert filters.max_notional_price == 75000000000
+    assert filters.percent_price[SIDE_ASK] == (0.2, 5.0)
+
+
+def test_compile_sub_cent_filters():
+    filters = SymbolFilters("DOGEUSDT", [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.00001000", "maxPrice": "1000.00000000",
+         "tickSize": "0.00001000"},
+        {"filterType": "NOTIONAL", "minNotional": "1.00000000"},
+    ], Decimal("100"))
+    assert (filters.precision, filters.tick) == (5, 1)
+    assert (filters.min_price, filters.max_price) == (1, 100000000)
+    # 1 / 100 = 0.01
+    assert filters.min_notional_price == 1000
+
+
+def test_load_sets_price_precision(caplog):
+    cache = ExchangeInfo()
+    cache.load({"symbols": [
+        {"symbol": "BTCUSDT", "filters": FILTERS},
+        {"symbol": "DOGEUSDT", "filters": [
+            {"filterType": "PRICE_FILTER", "minPrice": "0.00001000", "maxPrice": "0",
+             "tickSize": "0.00001000"},
+        ]},
+    ]})
+    assert (price_precision("BTCUSDT"), price_precision("DOGEUSDT")) == (2, 5)
+    assert price_precision("ETHUSDT") == PRICE_PRECISION
+
+    # Prices already in ticks keep their value. A coarser tick is a multiple of the old one
+    cache.load({"symbols": [{"symbol": "DOGEUSDT", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.00010000", "maxPrice": "0",
+         "tickSize": "0.00010000"},
+    ]}]})
+    assert price_precision("DOGEUSDT") == 5
+    assert cache.get("DOGEUSDT").tick == 10
+    cache.load({"symbols": [{"symbol": "BTCUSDT", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.00100000", "maxPrice": "0",
+         "tickSize": "0.00100000"},
+    ]}]})
+    assert price_precision("BTCUSDT") == 2
+    assert "prices stay in 2 until restarted" in caplog.text
+
+    cache.clear()
+    assert price_precision("DOGEUSDT") == PRICE_PRECISION
+
+
+def test_round_price_away_from_market():
+    filters = SymbolFilters("BTCUSDT", FILTERS)
+    assert filters.round_price(SIDE_BID, 2316759) == 2316755
+    assert filters.round_price(SIDE_ASK, 2316751) == 2316755
+    assert filters.round_price(SIDE_ASK, 2316750) == 2316750
+
+
+@pytest.mark.parametrize("side, price, quantity, reference, filter_type", [
+    (SIDE_BID, 0, "0.01", None, "PRICE_FILTER"),
+    (SIDE_BID, 2316750, "0.0001", None, "LOT_SIZE"),
+    (SIDE_BID, 40000, "0.01", None, "NOTIONAL"),
+    (SIDE_BID, 200000, "0.01", 2316750, "PERCENT_PRICE_BY_SIDE"),
+    (SIDE_ASK, 12000000, "0.01", 2316750, "PERCENT_PRICE_BY_SIDE"),
+])
+def test_check_rejects(side, price, quantity, reference, filter_type):
+    filters = SymbolFilters("BTCUSDT", FILTERS, Decimal(quantity))
+    with pytest.raises(OrderRejected) as err:
+        filters.check(side, price, reference)
+    assert err.value.filter_type == filter_type
+
+
+def test_check_passes():
+    filters = SymbolFilters("BTCUSDT", FILTERS)
+    filters.check(SIDE_BID, 2316750, 2316750)
+    # Too far from the average price, but there's none to check against
+    filters.check(SIDE_BID, 200000)
+
+
+def test_prepare():
+    cache = ExchangeInfo()
+    assert cache.prepare("BTCUSDT", SIDE_BID, 2316759) == (2316759, 0.01)
+
+    cache.load(EXCHANGE_INFO)
+    assert cache.prepare("BTCUSDT", SIDE_BID, 2316759) == (2316755, "0.01")
+    cache.set_reference_price("BTCUSDT", 2316750)
+    with pytest.raises(OrderRejected):
+        cache.prepare("BTCUSDT", SIDE_BID, 200000)
+    assert ORDERS_REJECTED.labels("PERCENT_PRICE_BY_SIDE").value == 1
+
+
+@pytest.mark.asyncio
+async def test_run_refreshes_on_ttl_and_filter_failure():
+    fetched = []
+
+    async def fetch(symbols):
+        fetched.append(symbols)
+        return EXCHANGE_INFO
+
+    cache = ExchangeInfo(ttl=0.05, min_refresh_interval=0)
+    cache.load(EXCHANGE_INFO)
+    running = asyncio.create_task(cache.run(fetch))
+    await asyncio.sleep(0.01)
+    assert fetched == []
+    await asyncio.sleep(0.07)
+    assert fetched == [["BTCUSDT"]]
+
+    cache.invalidate("Filter failure: PRICE_FILTER")
+    await asyncio.sleep(0.01)
+    running.cancel()
+    assert cache.refreshes == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_order_is_not_sent(httpx_mock: HTTPXMock, mocker):
+    exchange_info.load(EXCHANGE_INFO)
+    cancel = mocker.patch("swapper.service._cancel_order")
+    with pytest.raises(OrderRejected):
+        await place_order(SIDE_BID, 40000)
+    with pytest.raises(OrderRejected):
+        await replace_order(1, SIDE_BID, 40000)
+    assert not httpx_mock.get_requests()
+    assert not cancel.called
+    assert ORDERS_REJECTED.labels("NOTIONAL").value == 2
+
+
+@pytest.mark.asyncio
+async def test_order_is_rounded(httpx_mock: HTTPXMock, patch_time):
+    exchange_info.load(EXCHANGE_INFO)
+    data = {
+        "symbol": "BTCUSDT",
+        "side": SIDE_ASK,
+        "type": "LIMIT",
+        "timeInForce": "GTC",
+        "quantity": "0.01",
+        "price": "23167.55",
+        "timestamp": str(int(time.time() * 1000)),
+    }
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/order?signature={calculate_signature(data)}",
+        json={"orderId": 1, "status": "NEW", "side": SIDE_ASK},
+    )
+    assert (await place_order(SIDE_ASK, 2316751))["orderId"] == 1
+
+
+@pytest.mark.asyncio
+async def test_filter_failure_refreshes(httpx_mock: HTTPXMock, mocker):
+    invalidate = mocker.patch.object(exchange_info, "invalidate")
+    httpx_mock.add_response(status_code=400, json={"code": -1013, "msg": "Filter failure: LOT"})
+    with pytest.raises(HTTPStatusError):
+        await place_order(SIDE_BID, 2316750)
+    invalidate.assert_called_once_with("Filter failure: LOT")
+
+    httpx_mock.add_response(status_code=400, json={"code": -2010, "msg": "Insufficient"})
+    with pytest.raises(HTTPStatusError):
+        await place_order(SIDE_BID, 2316750)
+    assert invalidate.call_count == 1
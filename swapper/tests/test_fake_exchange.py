@@ -0,0 +1,207 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+import websockets
+from httpx import HTTPStatusError
+
+from swapper import service
+from swapper.client import open_client
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.errors import ExchangeError
+from swapper.exchange_info import exchange_info
+from swapper.exchange_info import OrderRejected
+from swapper.fake_exchange import FakeExchange
+from swapper.fake_exchange import FakeExchangeConfig
+from swapper.orderbook import OrderBook
+from swapper.prices import to_ticks
+from swapper.ws_api import WebSocketApi
+
+
+@pytest_asyncio.fixture
+async def exchange(monkeypatch):
+    exchange = FakeExchange(FakeExchangeConfig(secret_key=service.SECRET_KEY, tick_interval=60))
+    await exchange.start()
+    monkeypatch.setattr(service, "BINANCE_REST_API_BASE_URL", exchange.env[
+        "BINANCE_REST_API_BASE_URL"
+    ])
+    exchange.prices["BTCUSDT"] = 23000.0
+    async with open_client():
+        yield exchange
+    await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_place_and_cancel_order(exchange):
+    order = await service.place_order(SIDE_BID, 2200000)
+    assert order["status"] == "NEW"
+    assert order["price"] == "22000.00000000"
+
+    cancelled = await service.cancel_order(order["orderId"])
+    assert cancelled["status"] == "CANCELED"
+    assert await service.cancel_order(order["orderId"]) is None
+
+    orders = await service.get_all_orders()
+    assert [(order["orderId"], order["status"]) for order in orders] == [(1, "CANCELED")]
+
+
+@pytest.mark.asyncio
+async def test_replace_order(exchange):
+    order = await service.place_order(SIDE_ASK, 2400000)
+    result = await service.replace_order(order["orderId"], SIDE_ASK, 2410000)
+    assert result["cancelResponse"]["orderId"] == order["orderId"]
+    assert result["newOrderResponse"]["price"] == "24100.00000000"
+
+
+@pytest.mark.asyncio
+async def test_filters(exchange, mocker):
+    exchange_info.load(await service.get_exchange_info(["BTCUSDT"]))
+    requests = exchange.requests
+    # 0.01 at 400.00 is below the minimum notional of 5
+    with pytest.raises(OrderRejected):
+        await service.place_order(SIDE_BID, 40000)
+    assert exchange.requests == requests
+
+    # The exchange changed its filters since
+    exchange.config.tick_size = "0.10"
+    invalidate = mocker.patch.object(exchange_info, "invalidate")
+    order = await service.place_order(SIDE_ASK, 2400000)
+    result = await service.replace_order(order["orderId"], SIDE_ASK, 2400001)
+    assert result["cancelResponse"]["orderId"] == order["orderId"]
+    assert result["newOrderResponse"] is None
+    invalidate.assert_called_once_with("Filter failure: PRICE_FILTER")
+
+    exchange_info.load(await service.get_exchange_info(["BTCUSDT"]))
+    order = await service.place_order(SIDE_ASK, 2400001)
+    assert order["price"] == "24000.10000000"
+
+
+@pytest.mark.asyncio
+async def test_get_all_orders_from_order_id(exchange):
+    for price in (2200000, 2210000, 2220000):
+        await service.place_order(SIDE_BID, price)
+    orders = await service.get_all_orders(from_order_id=2)
+    assert [order["orderId"] for order in orders] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_invalid_signature(exchange, monkeypatch):
+    monkeypatch.setattr(service, "SECRET_KEY", "wrong")
+    with pytest.raises(HTTPStatusError) as err:
+        await service.place_order(SIDE_BID, 2200000)
+    assert err.value.response.json()["code"] == -1022
+    assert exchange.orders == {}
+
+
+@pytest.mark.asyncio
+async def test_rate_limit(exchange):
+    exchange.config.rate_limit = 1
+    await service.get_all_orders()
+    with pytest.raises(HTTPStatusError) as err:
+        await service.get_all_orders()
+    assert err.value.response.status_code == 429
+    assert int(err.value.response.headers["Retry-After"]) > 0
+    assert err.value.response.headers["X-MBX-USED-WEIGHT-1M"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_error_injection(exchange):
+    exchange.config.error_rate = 1
+    with pytest.raises(HTTPStatusError) as err:
+        await service.get_all_orders()
+    assert err.value.response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_streams(exchange):
+    market_url = exchange.env["BINANCE_WS_MARKET_STREAM_URL"]
+    listen_key = await service.create_listen_key()
+    user_url = f"{exchange.env['BINANCE_WS_USER_STREAM_URL']}/{listen_key}"
+    async with websockets.connect(market_url) as market, websockets.connect(user_url) as user:
+        order = await service.place_order(SIDE_BID, 2200000)
+        new_event = json.loads(await asyncio.wait_for(user.recv(), 1))
+        assert (new_event["i"], new_event["X"]) == (order["orderId"], "NEW")
+
+        # Price drops through the bid
+        exchange.config.volatility = 0
+        exchange.prices["BTCUSDT"] = 21000.0
+        exchange.tick()
+        kline = json.loads(await asyncio.wait_for(market.recv(), 1))
+        assert kline["s"] == "BTCUSDT"
+        assert kline["k"]["c"] == "21000.00000000"
+        fill_event = json.loads(await asyncio.wait_for(user.recv(), 1))
+        assert (fill_event["i"], fill_event["X"]) == (order["orderId"], "FILLED")
+
+
+@pytest_asyncio.fixture
+async def ws_api(exchange):
+    ws_api = WebSocketApi(
+        exchange.env["BINANCE_WS_API_URL"], api_key="key", secret_key=service.SECRET_KEY
+    )
+    await ws_api.connect()
+    service.set_ws_api(ws_api)
+    yield ws_api
+    service.set_ws_api(None)
+    await ws_api.close()
+
+
+@pytest.mark.asyncio
+async def test_orders_over_ws_api(exchange, ws_api, httpx_mock):
+    orders = await asyncio.gather(
+        service.place_order(SIDE_BID, 2200000),
+        service.place_order(SIDE_ASK, 2400000),
+    )
+    assert [order["side"] for order in orders] == [SIDE_BID, SIDE_ASK]
+
+    result = await service.replace_order(orders[1]["orderId"], SIDE_ASK, 2410000)
+    assert result["newOrderResponse"]["price"] == "24100.00000000"
+    assert (await service.cancel_order(orders[0]["orderId"]))["status"] == "CANCELED"
+    assert await service.cancel_order(orders[0]["orderId"]) is None
+    assert len(await service.get_all_orders()) == 3
+    # Nothing went over REST
+    assert httpx_mock.get_requests() == []
+
+
+@pytest.mark.asyncio
+async def test_ws_api_falls_back_to_rest(exchange, ws_api):
+    await ws_api.websocket.close()
+    order = await service.place_order(SIDE_BID, 2200000)
+    assert order["status"] == "NEW"
+
+    # The session reconnects and orders go over it again
+    running = asyncio.create_task(ws_api.run())
+    while not ws_api.connected:
+        await asyncio.sleep(0.01)
+    assert (await service.cancel_order(order["orderId"]))["status"] == "CANCELED"
+    running.cancel()
+
+
+@pytest.mark.asyncio
+async def test_ws_api_invalid_signature(exchange, ws_api):
+    ws_api.secret_key = "wrong"
+    with pytest.raises(ExchangeError):
+        await service.place_order(SIDE_BID, 2200000)
+    assert exchange.orders == {}
+
+
+@pytest.mark.asyncio
+async def test_order_book_from_depth_stream(exchange):
+    book = OrderBook("BTCUSDT")
+    async with websockets.connect(exchange.env["BINANCE_WS_COMBINED_STREAM_URL"]) as market:
+        await market.send(json.dumps({
+            "method": "SUBSCRIBE", "params": ["btcusdt@depth@100ms"], "id": 1,
+        }))
+        await asyncio.wait_for(market.recv(), 1)
+        exchange.tick()
+        book.apply(json.loads(await asyncio.wait_for(market.recv(), 1))["data"])
+        assert book.load(await service.get_depth("BTCUSDT"))
+        exchange.tick()
+        book.apply(json.loads(await asyncio.wait_for(market.recv(), 1))["data"])
+
+    bids, asks = exchange.depth["BTCUSDT"]
+    assert book.synced
+    assert book.best_bid == max(to_ticks(price) for price in bids)
+    assert book.best_ask == min(to_ticks(price) for price in asks)
+    assert len(book.bids) == len(book.asks) == exchange.config.depth_levels
@@ -1,3 +1,4 @@
+import random
 from decimal import Decimal
 
 import pytest
@@ -7,69 +8,142 @@ from swapper.constants import SIDE_BID
 from swapper.helpers import calculate_ask_price_based_on_spread
 from swapper.helpers import calculate_bid_ask_spread
 from swapper.helpers import calculate_bid_price_based_on_spread
+from swapper.helpers import calculate_candle_prices
+from swapper.helpers import calculate_prices_batch
 from swapper.helpers import order_at_risk
+from swapper.models import Order
 
 
 def test_calculate_bid_ask_spread():
-    assert calculate_bid_ask_spread(Decimal("10000"), Decimal("10010")) == Decimal("0.1")
-    assert calculate_bid_ask_spread(Decimal("10000"), Decimal("10020")) == Decimal("0.2")
+    assert calculate_bid_ask_spread(1000000, 1001000) == pytest.approx(0.1)
+    assert calculate_bid_ask_spread(1000000, 1002000) == pytest.approx(0.2)
 
 
 def test_calculate_bid_ask_spread_with_negative_values():
     with pytest.raises(ValueError) as err:
-        calculate_bid_ask_spread(Decimal("-10000"), Decimal("10010"))
+        calculate_bid_ask_spread(-1000000, 1001000)
 
     assert err.value.args[0] == "Prices cannot be negative"
 
 
 def test_calculate_bid_price_based_on_spread():
-    assert calculate_bid_price_based_on_spread(Decimal("10000"), Decimal("0.1")) == Decimal("9990")
-    assert calculate_bid_price_based_on_spread(Decimal("10000"), Decimal("0.2")) == Decimal("9980")
+    assert calculate_bid_price_based_on_spread(1000000, 0.1) == 999000
+    assert calculate_bid_price_based_on_spread(1000000, 0.2) == 998000
 
 
 def test_calculate_bid_price_based_on_spread_with_negative_values():
     with pytest.raises(ValueError) as err:
-        calculate_bid_price_based_on_spread(Decimal("-10000"), Decimal("0.1"))
+        calculate_bid_price_based_on_spread(-1000000, 0.1)
 
     assert err.value.args[0] == "Prices and spread cannot be negative"
 
 
 def test_calculate_ask_price_based_on_spread():
-    assert calculate_ask_price_based_on_spread(Decimal("10000"), Decimal("0.1")) == Decimal("10010")
-    assert calculate_ask_price_based_on_spread(Decimal("10000"), Decimal("0.2")) == Decimal("10020")
+    assert calculate_ask_price_based_on_spread(1000000, 0.1) == 1001000
+    assert calculate_ask_price_based_on_spread(1000000, 0.2) == 1002000
 
 
 def test_calculate_ask_price_based_on_spread_with_negative_values():
     with pytest.raises(ValueError) as err:
-        calculate_ask_price_based_on_spread(Decimal("-10000"), Decimal("0.1"))
+        calculate_ask_price_based_on_spread(-1000000, 0.1)
 
     assert err.value.args[0] == "Prices and spread cannot be negative"
 
 
+def test_calculate_candle_prices():
+    assert calculate_candle_prices(1000000, 1001000) == (999000, 1002001)
+    # 210 * 210 / 200 = 220.5 rounds to even, 230 * 230 / 200 = 264.5 too
+    assert calculate_candle_prices(200, 210) == (190, 220)
+    assert calculate_candle_prices(200, 230) == (170, 264)
+
+
+def test_calculate_candle_prices_matches_decimal():
+    rng = random.Random(0)
+    for _ in range(1000):
+        low = rng.randint(100, 10_000_000)
+        high = low + rng.randint(0, 50_000)
+        low_price, high_price = Decimal(low) / 100, Decimal(high) / 100
+        spread = (high_price - low_price) / low_price * 100
+        bid_price = round(low_price * (1 - spread / 100), 2)
+        ask_price = round(high_price * (1 + spread / 100), 2)
+        assert calculate_candle_prices(low, high) == (
+            int(bid_price * 100), int(ask_price * 100)
+        )
+
+
+def test_calculate_candle_prices_with_negative_values():
+    with pytest.raises(ValueError) as err:
+        calculate_candle_prices(-1000000, 1001000)
+    assert err.value.args[0] == "Prices cannot be negative"
+
+    with pytest.raises(ValueError) as err:
+        calculate_candle_prices(1000000, 999000)
+    assert err.value.args[0] == "Prices and spread cannot be negative"
+
+
 def test_order_at_risk():
     assert order_at_risk(
-        bid_price=Decimal("10000"), ask_price=Decimal("10010"),
-        order={"side": SIDE_BID, "price": "10000"}
+        bid_price=1000000, ask_price=1001000,
+        order=Order(order_id=1, side=SIDE_BID, price=1000000)
     )
     assert order_at_risk(
-        bid_price=Decimal("10000"), ask_price=Decimal("10010"),
-        order={"side": SIDE_ASK, "price": "10010"}
+        bid_price=1000000, ask_price=1001000,
+        order=Order(order_id=1, side=SIDE_ASK, price=1001000)
     )
     assert not order_at_risk(
-        bid_price=Decimal("10000"), ask_price=Decimal("10010"),
-        order={"side": SIDE_BID, "price": "10001"}
+        bid_price=1000000, ask_price=1001000,
+        order=Order(order_id=1, side=SIDE_BID, price=1000100)
     )
     assert not order_at_risk(
-        bid_price=Decimal("10000"), ask_price=Decimal("10010"),
-        order={"side": SIDE_ASK, "price": "10009"}
+        bid_price=1000000, ask_price=1001000,
+        order=Order(order_id=1, side=SIDE_ASK, price=1000900)
     )
 
 
 def test_order_at_risk_with_negative_values():
     with pytest.raises(ValueError) as err:
         order_at_risk(
-            bid_price=Decimal("-10000"), ask_price=Decimal("10010"),
-            order={"side": SIDE_BID, "price": "10000"}
+            bid_price=-1000000, ask_price=1001000,
+            order=Order(order_id=1, side=SIDE_BID, price=1000000)
         )
 
     assert err.value.args[0] == "Prices cannot be negative"
+
+
+def test_calculate_prices_batch_matches_scalar():
+    rng = random.Random(0)
+    lows = [rng.randint(100, 10_000_000) for _ in range(1000)]
+    highs = [low + rng.randint(0, 50_000) for low in lows]
+
+    spreads, bid_prices, ask_prices = calculate_prices_batch(highs, lows)
+    for high, low, spread, bid_price, ask_price in zip(
+            highs, lows, spreads, bid_prices, ask_prices
+    ):
+        assert spread == pytest.approx(calculate_bid_ask_spread(low, high))
+        assert (bid_price, ask_price) == calculate_candle_prices(low, high)
+
+
+def test_calculate_prices_batch_rounds_half_to_even():
+    _, bid_prices, ask_prices = calculate_prices_batch([210, 230], [200, 200])
+    assert list(bid_prices) == [190, 170]
+    assert list(ask_prices) == [220, 264]
+
+
+def test_calculate_prices_batch_with_negative_values():
+    with pytest.raises(ValueError) as err:
+        calculate_prices_batch([1001000, 1001000], [1000000, -1000000])
+    assert err.value.args[0] == "Prices cannot be negative"
+
+    with pytest.raises(ValueError) as err:
+        calculate_prices_batch([1001000, 999000], [1000000, 1000000])
+    assert err.value.args[0] == "Prices and spread cannot be negative"
+
+
+def test_calculate_prices_batch_with_large_prices():
+    # 100000.00000000 at 8 decimal places squares past int64
+    lows = [10_000_000_000_000, 3_037_000_499, 5_000_000_000]
+    highs = [10_000_100_000_000, 3_037_000_500, 5_000_000_001]
+
+    _, bid_prices, ask_prices = calculate_prices_batch(highs, lows)
+    for high, low, bid_price, ask_price in zip(highs, lows, bid_prices, ask_prices):
+        assert (bid_price, ask_price) == calculate_candle_prices(low, high)
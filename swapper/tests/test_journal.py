@@ -0,0 +1,126 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.journal import OrderJournal
+from swapper.models import Order
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"))
+    yield journal
+    journal.close()
+
+
+def _order(order_id: int, status: str, update_time: int, symbol: str = "BTCUSDT") -> Order:
+    return Order(order_id, SIDE_BID, status, 2300001, symbol, update_time, 1)
+
+
+def test_wal_mode(journal):
+    assert journal._connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_append_and_replay(journal):
+    journal.append([_order(1, "NEW", 1), _order(2, "NEW", 1, "ETHUSDT")])
+    journal.append([_order(1, "FILLED", 2)])
+    assert list(journal.replay("BTCUSDT")) == [_order(1, "NEW", 1), _order(1, "FILLED", 2)]
+    assert list(journal.replay("ETHUSDT")) == [_order(2, "NEW", 1, "ETHUSDT")]
+
+
+def test_load_journals_accepted_updates(journal, tmp_path):
+    journal.append([_order(1, "NEW", 2)])
+    state = journal.load("BTCUSDT")
+    assert state.get_active_bid_order() == _order(1, "NEW", 2)
+
+    state.add_orders([
+        # Stale and unchanged updates aren't journaled
+        _order(1, "NEW", 1),
+        _order(1, "NEW", 2),
+        {"orderId": 2, "status": "NEW", "side": SIDE_ASK, "price": "23100", "symbol": "BTCUSDT",
+         "time": 3, "updateTime": 3},
+    ])
+    journal.close()
+
+    # A restart picks up where the last run left off
+    restarted = OrderJournal(journal.path)
+    state = restarted.load("BTCUSDT")
+    assert [order.order_id for order in state.get_active_orders()] == [1, 2]
+    assert state.get_active_ask_order().price == 2310000
+    assert state.resume_order_id() == 1
+    restarted.close()
+
+
+def test_compact(journal):
+    journal.append([_order(1, "NEW", 1), _order(2, "NEW", 1)])
+    journal.append([_order(1, "FILLED", 2)])
+    journal.compact()
+    assert list(journal.replay("BTCUSDT")) == [_order(2, "NEW", 1), _order(1, "FILLED", 2)]
+
+
+def test_compact_prunes_old_terminal_orders(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"), history_size=2)
+    journal.append([_order(order_id, "FILLED", order_id) for order_id in range(1, 5)])
+    journal.append([_order(5, "NEW", 5), _order(1, "CANCELED", 6, "ETHUSDT")])
+    journal.compact()
+    assert [order.order_id for order in journal.replay("BTCUSDT")] == [3, 4, 5]
+    assert [order.order_id for order in journal.replay("ETHUSDT")] == [1]
+    journal.close()
+
+
+def test_append_is_written_in_batches(journal):
+    journal.append([_order(1, "NEW", 1)])
+    journal.append([_order(2, "NEW", 1)])
+    count = "SELECT COUNT(*) FROM order_events"
+    assert journal._connection.execute(count).fetchone() == (0,)
+    journal.flush()
+    assert journal._connection.execute(count).fetchone() == (2,)
+
+
+@pytest.mark.asyncio
+async def test_run_flushes_and_compacts(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"), flush_interval=0.01, compact_interval=0)
+    running = asyncio.create_task(journal.run())
+    journal.append([_order(1, "NEW", 1), _order(1, "FILLED", 2)])
+    await asyncio.sleep(0.05)
+    running.cancel()
+    rows = journal._connection.execute("SELECT order_id, status FROM order_events").fetchall()
+    assert rows == [(1, "FILLED")]
+    journal.close()
+
+
+@pytest.mark.asyncio
+async def test_run_writes_off_the_loop(tmp_path, mocker):
+    journal = OrderJournal(str(tmp_path / "orders.db"), flush_interval=0.01, compact_interval=None)
+    write_rows = journal._write_rows
+    threads = []
+
+    def _write_rows(rows, compact):
+        threads.append(threading.current_thread())
+        if len(threads) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        write_rows(rows, compact)
+
+    mocker.patch.object(journal, "_write_rows", side_effect=_write_rows)
+    running = asyncio.create_task(journal.run())
+    journal.append([_order(1, "NEW", 1), _order(1, "FILLED", 2)])
+    await asyncio.sleep(0.05)
+    running.cancel()
+    assert threading.current_thread() not in threads
+    # Kept after the failed write, and not compacted
+    rows = journal._connection.execute("SELECT order_id, status FROM order_events").fetchall()
+    assert rows == [(1, "NEW"), (1, "FILLED")]
+    journal.close()
+
+
+def test_close_writes_queued_updates(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"))
+    journal.append([_order(1, "NEW", 1)])
+    journal.close()
+    restarted = OrderJournal(journal.path)
+    assert list(restarted.replay("BTCUSDT")) == [_order(1, "NEW", 1)]
+    restarted.close()
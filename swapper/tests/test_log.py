@@ -0,0 +1,98 @@
+import io
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+from swapper.log import JsonFormatter
+from swapper.log import NonBlockingHandler
+from swapper.log import setup_logging
+from swapper.metrics import LOG_RECORDS_DROPPED
+
+
+def make_record(level=logging.INFO, msg="Placed %(order_id)s", args=({"order_id": 1},)):
+    return logging.LogRecord("swapper.subscribe", level, __file__, 1, msg, args, None)
+
+
+@pytest.fixture
+def root_handlers():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_json_formatter():
+    event = json.loads(JsonFormatter().format(make_record()))
+    assert event["level"] == "INFO"
+    assert event["logger"] == "swapper.subscribe"
+    assert event["message"] == "Placed 1"
+    assert event["order_id"] == 1
+
+
+def test_json_formatter_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(logging.ERROR, "Failed: %r", (1,))
+        record.exc_info = sys.exc_info()
+    event = json.loads(JsonFormatter().format(record))
+    assert event["message"] == "Failed: 1"
+    assert "ValueError: boom" in event["exception"]
+
+
+def test_handler_does_not_format():
+    log_queue = queue.Queue()
+    record = make_record()
+    NonBlockingHandler(log_queue).handle(record)
+    queued = log_queue.get_nowait()
+    assert queued is record
+    assert queued.msg == "Placed %(order_id)s"
+    assert queued.args == {"order_id": 1}
+
+
+def test_full_queue_drops():
+    handler = NonBlockingHandler(queue.Queue(1))
+    for _ in range(3):
+        handler.handle(make_record())
+    assert LOG_RECORDS_DROPPED.labels("queue_full").value == 2
+
+
+def test_sampling_keeps_warnings():
+    log_queue = queue.Queue()
+    handler = NonBlockingHandler(log_queue, sample_every=3)
+    for _ in range(6):
+        handler.handle(make_record())
+    handler.handle(make_record(logging.WARNING))
+    assert log_queue.qsize() == 3
+    assert LOG_RECORDS_DROPPED.labels("sampled").value == 4
+
+
+@pytest.mark.usefixtures("root_handlers")
+def test_setup_logging_json_lines():
+    stream = io.StringIO()
+    listener = setup_logging(stream=stream)
+    logging.getLogger("swapper.subscribe").info(
+        "Placed %(order_id)s", {"order_id": 7, "latency_ms": 1.5}
+    )
+    logging.getLogger("swapper").debug("Not written")
+    listener.stop()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    event = json.loads(lines[0])
+    assert (event["message"], event["order_id"], event["latency_ms"]) == ("Placed 7", 7, 1.5)
+
+
+@pytest.mark.usefixtures("root_handlers")
+def test_setup_logging_text():
+    stream = io.StringIO()
+    listener = setup_logging(log_format="text", stream=stream)
+    logging.getLogger("swapper").warning("Replacing %s", 1)
+    listener.stop()
+    assert stream.getvalue() == "WARNING:swapper:Replacing 1\n"
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+from swapper.market_data import MarketDataReader
+from swapper.models import KlineEvent
+
+
+def _kline(symbol: str, high: str) -> str:
+    return json.dumps({"e": "kline", "s": symbol, "k": {"h": high, "l": "1.0"}})
+
+
+class _Websocket:
+    """
+    Returns queued messages and then waits forever, like a quiet market
+    """
+
+    def __init__(self, *messages):
+        self.messages = list(messages)
+
+    async def recv(self) -> str:
+        if self.messages:
+            message = self.messages.pop(0)
+            if isinstance(message, Exception):
+                raise message
+            return message
+        await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_keeps_latest_frame():
+    reader = MarketDataReader(_Websocket(
+        json.dumps({"result": None, "id": 1}),
+        _kline("BTCUSDT", "2.0"),
+        _kline("BTCUSDT", "3.0"),
+        _kline("BTCUSDT", "4.0"),
+    ))
+    reading = asyncio.create_task(reader.run())
+    # Let the reader drain the socket while the trading loop is busy
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    data = await reader.get()
+    reading.cancel()
+    assert data == KlineEvent("BTCUSDT", 0, 400, 100)
+    assert reader.stats.frames_received == 4
+    assert reader.stats.frames_conflated == 2
+    assert reader.stats.frames_consumed == 1
+    assert reader.stats.max_age >= reader.stats.last_age >= 0
+
+
+@pytest.mark.asyncio
+async def test_streams_are_consumed_in_arrival_order():
+    reader = MarketDataReader(_Websocket())
+    reader.publish({"stream": "ethusdt@depth", "data": {"lastUpdateId": 1}})
+    reader.publish({
+        "stream": "btcusdt@kline_1m", "data": {"s": "BTCUSDT", "k": {"h": "1", "l": "1"}}
+    })
+    reader.publish({"stream": "ethusdt@depth", "data": {"lastUpdateId": 2}})
+
+    # Frames that aren't klines are passed on as they are
+    assert await reader.get() == {"lastUpdateId": 2}
+    assert await reader.get() == KlineEvent("BTCUSDT", 0, 100, 100)
+    assert reader.stats.frames_conflated == 1
+
+
+@pytest.mark.asyncio
+async def test_get_waits_for_data():
+    reader = MarketDataReader(_Websocket())
+    waiting = asyncio.create_task(reader.get())
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    reader.publish({"E": 1675609847732, "s": "BTCUSDT", "k": {"h": "1", "l": "1"}})
+    assert await waiting == KlineEvent("BTCUSDT", 1675609847732, 100, 100)
+
+
+@pytest.mark.asyncio
+async def test_error_is_raised_after_pending_data():
+    reader = MarketDataReader(_Websocket(_kline("BTCUSDT", "2.0"), ConnectionError("closed")))
+    await reader.run()
+
+    assert (await reader.get()).high == 200
+    with pytest.raises(ConnectionError):
+        await reader.get()
+
+
+@pytest.mark.asyncio
+async def test_wait_for_data_does_not_consume():
+    reader = MarketDataReader()
+    waiting = asyncio.create_task(reader.wait_for_data())
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    reader.publish({"stream": "ethusdt@depth", "data": {"lastUpdateId": 1}})
+    await asyncio.wait_for(waiting, 1)
+    assert reader.stats.frames_consumed == 0
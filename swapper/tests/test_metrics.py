@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from swapper.constants import SIDE_BID
+from swapper.metrics import Counter
+from swapper.metrics import Gauge
+from swapper.metrics import Histogram
+from swapper.metrics import REST_ERRORS
+from swapper.metrics import REST_REQUESTS
+from swapper.metrics import serve
+from swapper.metrics import STAGE_SECONDS
+from swapper.models import KlineEvent
+from swapper.service import place_order
+from swapper.state import State
+from swapper.subscribe import on_kline
+
+
+def test_histogram():
+    histogram = Histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    child = histogram.labels("decode")
+    for value in (0.05, 0.1, 0.5, 2.0):
+        child.observe(value)
+
+    assert child.counts == [2, 1, 1]
+    assert child.count == 4
+    assert child.sum == pytest.approx(2.65)
+    assert child.quantile(0.5) == 0.1
+    assert child.quantile(0.75) == 1.0
+    assert child.quantile(1) == float("inf")
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="decode",le="0.1"} 2',
+        'latency_seconds_bucket{stage="decode",le="1.0"} 3',
+        'latency_seconds_bucket{stage="decode",le="+Inf"} 4',
+        'latency_seconds_sum{stage="decode"} 2.65',
+        'latency_seconds_count{stage="decode"} 4',
+    ]
+
+
+def test_counter():
+    counter = Counter("requests", "Requests", ("status",))
+    counter.labels("200").inc()
+    counter.labels("200").inc()
+    counter.labels("429").inc()
+
+    assert counter.render()[2:] == [
+        'requests_total{status="200"} 2',
+        'requests_total{status="429"} 1',
+    ]
+
+
+def test_gauge():
+    gauge = Gauge("startup_seconds", "Startup", ("phase",))
+    gauge.labels("ready").set(1.5)
+    gauge.labels("ready").set(0.25)
+
+    assert gauge.render() == [
+        "# HELP startup_seconds Startup",
+        "# TYPE startup_seconds gauge",
+        'startup_seconds{phase="ready"} 0.25',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rest_counters(httpx_mock: HTTPXMock, patch_time):
+    httpx_mock.add_response(json={"orderId": 1, "status": "NEW", "side": SIDE_BID})
+    httpx_mock.add_exception(httpx.ConnectTimeout("Timed out"))
+
+    await place_order(SIDE_BID, 100)
+    with pytest.raises(httpx.ConnectTimeout):
+        await place_order(SIDE_BID, 100)
+
+    assert REST_REQUESTS.labels("/order", "200").value == 1
+    assert REST_ERRORS.labels("/order", "ConnectTimeout").value == 1
+    assert STAGE_SECONDS.labels("place_order").count == 2
+
+
+@pytest.mark.asyncio
+async def test_tick_stages(mocker):
+    mocker.patch(
+        "swapper.subscribe.place_order", return_value={"orderId": 1, "status": "NEW", "side": "BUY"}
+    )
+    await on_kline(State(), KlineEvent("BTCUSDT", 0, 10100, 10000))
+
+    assert STAGE_SECONDS.labels("tick").count == 1
+    assert STAGE_SECONDS.labels("pricing").count == 1
+
+
+@pytest.mark.asyncio
+async def test_serve():
+    STAGE_SECONDS.labels("decode").observe(0.001)
+    server = await serve(port=0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b'swapper_stage_seconds_count{stage="decode"} 1' in response
@@ -0,0 +1,171 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from swapper.constants import BINANCE_REST_API_BASE_URL
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.exchange_info import exchange_info
+from swapper.market_data import MarketDataReader
+from swapper.metrics import ORDER_BOOK_RESYNCS
+from swapper.models import Order
+from swapper.orderbook import BookSide
+from swapper.orderbook import get_book
+from swapper.orderbook import OrderBook
+from swapper.state import State
+from swapper.strategy import Action
+from swapper.strategy import decide
+from swapper.strategy import get_prices
+from swapper.strategy import REPLACE
+
+SNAPSHOT = {
+    "lastUpdateId": 10,
+    "bids": [["99.00", "1.0"], ["98.00", "2.0"], ["97.00", "3.0"]],
+    "asks": [["101.00", "1.5"], ["102.00", "2.5"]],
+}
+
+
+def _diff(first: int, last: int, bids=(), asks=()) -> dict:
+    return {
+        "e": "depthUpdate", "E": last, "s": "BTCUSDT", "U": first, "u": last,
+        "b": [list(level) for level in bids], "a": [list(level) for level in asks],
+    }
+
+
+def test_book_side_keeps_best_level_last():
+    asks = BookSide(SIDE_ASK)
+    for price, quantity in ((10200, "1"), (10000, "2"), (10100, "3")):
+        asks.update(price, Decimal(quantity))
+    assert (asks.best_price, asks.best_quantity) == (10000, Decimal("2"))
+
+    asks.update(10000, Decimal("0"))
+    asks.update(10100, Decimal("4"))
+    asks.update(9950, Decimal("0"))
+    assert len(asks) == 2
+    assert (asks.best_price, asks.best_quantity) == (10100, Decimal("4"))
+    assert asks.quantity(10200) == Decimal("1")
+    assert asks.quantity(10000) == Decimal("0")
+
+
+def test_sub_cent_levels_stay_apart():
+    exchange_info.load({"symbols": [{"symbol": "DOGEUSDT", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.00001000", "maxPrice": "0",
+         "tickSize": "0.00001000"},
+    ]}]})
+    book = OrderBook("DOGEUSDT")
+    book.apply(_diff(11, 11))
+    assert book.load({
+        "lastUpdateId": 10,
+        "bids": [["0.08209", "100"], ["0.08208", "200"]],
+        "asks": [["0.08213", "300"]],
+    })
+    book.apply({**_diff(12, 12, bids=[("0.08207", "50")]), "s": "DOGEUSDT"})
+    assert len(book.bids) == 3
+    assert (book.best_bid, book.best_ask) == (8209, 8213)
+    assert book.bids.quantity(8208) == Decimal("200")
+
+
+def test_depth_ahead():
+    bids = BookSide(SIDE_BID)
+    bids.load(SNAPSHOT["bids"])
+    assert bids.depth_ahead(9700) == Decimal("3.0")
+    assert bids.depth_ahead(9900) == Decimal("0")
+    assert bids.depth_ahead(10000) == Decimal("0")
+    # Stops adding up once past the limit
+    assert bids.depth_ahead(9600, Decimal("0.5")) == Decimal("1.0")
+
+
+def test_snapshot_and_buffered_diffs():
+    book = OrderBook("BTCUSDT")
+    book.apply(_diff(9, 10, bids=[("99.00", "5.0")]))
+    book.apply(_diff(11, 12, bids=[("100.00", "1.0")], asks=[("101.00", "0")]))
+    assert not book.synced
+
+    assert book.load(SNAPSHOT)
+    assert book.synced and book.ready
+    assert book.last_update_id == 12
+    # The diff already in the snapshot was dropped, the newer one applied
+    assert book.bids.quantity(9900) == Decimal("1.0")
+    assert (book.best_bid, book.best_ask) == (10000, 10200)
+
+    book.apply(_diff(13, 13, asks=[("100.50", "1.0")]))
+    book.apply(_diff(12, 13, asks=[("100.50", "9.0")]))
+    assert book.best_ask == 10050
+    assert book.asks.best_quantity == Decimal("1.0")
+
+
+def test_snapshot_older_than_stream():
+    book = OrderBook("BTCUSDT")
+    book.apply(_diff(15, 16))
+    assert not book.load(SNAPSHOT)
+    assert not book.synced
+
+
+def test_gap_resyncs():
+    book = OrderBook("BTCUSDT")
+    book.load(SNAPSHOT)
+    book.apply(_diff(11, 11))
+    book.apply(_diff(13, 14, bids=[("99.50", "1.0")]))
+
+    assert not book.synced
+    assert book.resyncs == 1
+    assert ORDER_BOOK_RESYNCS.labels().value == 1
+    assert book.load({**SNAPSHOT, "lastUpdateId": 13})
+    assert book.last_update_id == 14
+    assert book.best_bid == 9950
+
+
+@pytest.mark.asyncio
+async def test_run_loads_snapshot(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/depth?symbol=BTCUSDT&limit=1000", json=SNAPSHOT
+    )
+    book = OrderBook("BTCUSDT")
+    running = asyncio.create_task(book.run())
+    await asyncio.sleep(0)
+    # The snapshot waits for the stream
+    assert not httpx_mock.get_requests()
+
+    book.apply(_diff(10, 11, bids=[("99.00", "0")]))
+    for _ in range(20):
+        if book.synced:
+            break
+        await asyncio.sleep(0.01)
+    running.cancel()
+    assert book.synced
+    assert book.best_bid == 9800
+
+
+def test_reader_applies_depth_updates():
+    reader = MarketDataReader()
+    reader.publish({"stream": "btcusdt@depth@100ms", "data": _diff(1, 2)})
+    assert not reader._latest
+    assert get_book("BTCUSDT")._buffer[-1]["u"] == 2
+
+
+def test_order_at_risk():
+    book = OrderBook("BTCUSDT")
+    book.load(SNAPSHOT)
+    bid = Order(1, SIDE_BID, "NEW", 9800)
+    ask = Order(2, SIDE_ASK, "NEW", 10100)
+    assert not book.order_at_risk(bid)
+    assert book.order_at_risk(bid, Decimal("1.0"))
+    assert book.order_at_risk(ask)
+
+
+def test_decide_with_book():
+    book = OrderBook("BTCUSDT")
+    book.load(SNAPSHOT)
+    state = State()
+    state.add_orders([
+        {"orderId": 1, "status": "NEW", "side": SIDE_BID, "price": "99.00"},
+        {"orderId": 2, "status": "NEW", "side": SIDE_ASK, "price": "102.00"},
+    ])
+    # The kline alone puts neither order at risk, but the bid is at the top of the book
+    bid_price, _ = get_prices(10100, 9950)
+    assert decide(state, 10100, 9950) == []
+    assert decide(state, 10100, 9950, book=book) == [
+        Action(REPLACE, SIDE_BID, bid_price, state.get_active_bid_order()),
+    ]
@@ -0,0 +1,115 @@
+import pytest
+
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.exchange_info import exchange_info
+from swapper.metrics import REPRICINGS_SUPPRESSED
+from swapper.models import Order
+from swapper.policy import get_policy
+from swapper.policy import RepricingPolicy
+from swapper.policy import TICKS
+from swapper.state import State
+from swapper.strategy import Action
+from swapper.strategy import decide
+from swapper.strategy import REPLACE
+
+BID = Order(order_id=1, side=SIDE_BID, status="NEW", price=1000000, created_time=1000)
+ASK = Order(order_id=2, side=SIDE_ASK, status="NEW", price=1010000, created_time=1000)
+
+
+def test_distance():
+    policy = RepricingPolicy()
+    assert policy.distance(1000100, 1020000, BID) == pytest.approx(1)
+    assert policy.distance(990000, 1009950, ASK) == pytest.approx(0.5 / 10100 * 10000)
+    assert RepricingPolicy(unit=TICKS).distance(1000100, 1020000, BID) == 100
+
+
+def test_distance_in_exchange_ticks():
+    # 0.05 is 5 units at 2 decimals
+    exchange_info.load({"symbols": [{"symbol": "BTCUSDT", "status": "TRADING", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.01000000", "maxPrice": "1000000.00000000",
+         "tickSize": "0.05000000"},
+    ]}]})
+    bid = BID._replace(symbol="BTCUSDT")
+    assert RepricingPolicy(unit=TICKS).distance(1000100, 1020000, bid) == 20
+
+
+def test_defaults_hold_nothing_back():
+    policy = RepricingPolicy()
+    assert policy.should_reprice(1000000, 1020000, BID, 1000)
+    assert policy.should_reprice(1000000, 1020000, BID, 1000)
+    assert policy.suppressed == 0
+
+
+def test_threshold():
+    policy = RepricingPolicy(threshold=2.0)
+    assert not policy.should_reprice(1000100, 1020000, BID, 2000)
+    assert policy.should_reprice(1000200, 1020000, BID, 2000)
+    assert policy.suppressed == 1
+    assert REPRICINGS_SUPPRESSED.labels("threshold").value == 1
+
+
+def test_hysteresis():
+    policy = RepricingPolicy(threshold=2.0, hysteresis=1.0, cooldown=1000)
+    policy._replaced_at[SIDE_BID] = 1500
+    # Past the threshold, but held by the cooldown
+    assert not policy.should_reprice(1000300, 1020000, BID, 2000)
+    # Still due inside the hysteresis band
+    assert not policy.should_reprice(1000150, 1020000, BID, 2000)
+    assert policy.should_reprice(1000150, 1020000, BID, 2500)
+
+
+def test_hysteresis_released():
+    policy = RepricingPolicy(threshold=2.0, hysteresis=1.0, cooldown=1000)
+    policy._replaced_at[SIDE_BID] = 1500
+    assert not policy.should_reprice(1000300, 1020000, BID, 2000)
+    policy.forget(SIDE_BID)
+    # Not due anymore, has to go past the threshold again
+    assert not policy.should_reprice(1000150, 1020000, BID, 2500)
+    assert REPRICINGS_SUPPRESSED.labels("threshold").value == 1
+
+
+def test_min_order_age():
+    policy = RepricingPolicy(min_order_age=500)
+    assert not policy.should_reprice(1000000, 1020000, BID, 1499)
+    assert policy.should_reprice(1000000, 1020000, BID, 1500)
+    assert REPRICINGS_SUPPRESSED.labels("min_order_age").value == 1
+
+
+def test_cooldown_per_side():
+    policy = RepricingPolicy(cooldown=1000)
+    assert policy.should_reprice(1000000, 1010000, BID, 2000)
+    assert not policy.should_reprice(1000000, 1010000, BID, 2999)
+    assert policy.should_reprice(1000000, 1010000, ASK, 2999)
+    assert policy.should_reprice(1000000, 1010000, BID, 3000)
+    assert REPRICINGS_SUPPRESSED.labels("cooldown").value == 1
+
+
+@pytest.mark.parametrize("threshold, hysteresis", [
+    (1.0, 2.0),
+    (-1.0, 0.0),
+])
+def test_invalid_hysteresis(threshold, hysteresis):
+    with pytest.raises(ValueError):
+        RepricingPolicy(threshold=threshold, hysteresis=hysteresis)
+
+
+def test_decide_with_policy():
+    state = State()
+    state.add_orders([
+        {"orderId": 1, "status": "NEW", "side": SIDE_BID, "price": "9995", "time": 1000},
+        {"orderId": 2, "status": "NEW", "side": SIDE_ASK, "price": "10030", "time": 1000},
+    ])
+    # New bid 9990 doesn't reach the bid, new ask 10020.01 is 999 ticks past the ask
+    policy = RepricingPolicy(threshold=5.0, unit=TICKS)
+    assert decide(state, 1001000, 1000000, policy=policy, now=2000) == [
+        Action(REPLACE, SIDE_ASK, 1002001, state.get_order(2)),
+    ]
+    policy = RepricingPolicy(threshold=1000.0, unit=TICKS)
+    assert decide(state, 1001000, 1000000, policy=policy, now=2000) == []
+    assert policy.suppressed == 1
+
+
+def test_get_policy():
+    assert get_policy("BTCUSDT") is get_policy("BTCUSDT")
+    assert get_policy("BTCUSDT") is not get_policy("ETHUSDT")
@@ -0,0 +1,79 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from swapper.constants import PRICE_PRECISION
+from swapper.prices import clear_price_precisions
+from swapper.prices import from_ticks
+from swapper.prices import price_precision
+from swapper.prices import set_price_precision
+from swapper.prices import tick_precision
+from swapper.prices import to_decimal
+from swapper.prices import to_ticks
+
+
+@pytest.mark.parametrize("price, ticks", [
+    ("23167.50000000", 2316750),
+    ("23167.5", 2316750),
+    ("23167", 2316700),
+    ("0.01", 1),
+    ("0.005", 0),
+    ("0.015", 2),
+    ("0.0151", 2),
+    # Too many ticks for a double to hold exactly
+    ("1234567890123456.785", 123456789012345678),
+])
+def test_to_ticks(price, ticks):
+    assert to_ticks(price) == ticks
+
+
+def test_to_ticks_matches_decimal():
+    rng = random.Random(0)
+    for _ in range(1000):
+        price = f"{rng.randint(0, 100_000)}.{rng.randint(0, 99_999):05d}"
+        assert to_ticks(price) == int(round(Decimal(price), 2) * 100)
+
+
+def test_to_ticks_precision():
+    assert to_ticks("1.2345", 4) == 12345
+    assert to_ticks("1.2345", 0) == 1
+
+
+@pytest.mark.parametrize("ticks, price", [
+    (2316750, "23167.50"),
+    (1, "0.01"),
+    (0, "0.00"),
+])
+def test_from_ticks(ticks, price):
+    assert from_ticks(ticks) == price
+
+
+def test_from_ticks_precision():
+    assert from_ticks(12345, 4) == "1.2345"
+    assert from_ticks(12345, 0) == "12345"
+
+
+@pytest.mark.parametrize("tick_size, precision", [
+    ("0.01000000", 2),
+    ("0.05000000", 2),
+    ("0.00001000", 5),
+    ("1.00000000", 0),
+    ("10.00000000", 0),
+])
+def test_tick_precision(tick_size, precision):
+    assert tick_precision(tick_size) == precision
+
+
+def test_price_precision():
+    assert price_precision("BTCUSDT") == PRICE_PRECISION
+    assert set_price_precision("BTCUSDT", 4) == 4
+    # Prices already in ticks would change value
+    assert set_price_precision("BTCUSDT", 5) == 4
+    assert price_precision("BTCUSDT") == 4
+    clear_price_precisions()
+    assert price_precision("BTCUSDT") == PRICE_PRECISION
+
+
+def test_to_decimal():
+    assert to_decimal(2316750) == Decimal("23167.50")
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from httpx import HTTPStatusError
+from pytest_httpx import HTTPXMock
+
+from swapper.constants import SIDE_BID
+from swapper.ratelimit import limiter
+from swapper.ratelimit import PRIORITY_CANCEL
+from swapper.ratelimit import PRIORITY_PLACE
+from swapper.ratelimit import PRIORITY_QUERY
+from swapper.ratelimit import RateLimited
+from swapper.ratelimit import RateLimiter
+from swapper.service import place_order
+
+LIMITS = {"USED-WEIGHT-1M": ("WEIGHT", 2, 0.1), "ORDER-COUNT-10S": ("ORDERS", 100, 10)}
+
+
+@pytest.mark.asyncio
+async def test_cancels_go_first():
+    rate_limiter = RateLimiter(LIMITS, usage=1)
+    await rate_limiter.acquire(2)
+    done = []
+
+    async def acquire(name, priority):
+        await rate_limiter.acquire(1, priority=priority)
+        done.append(name)
+
+    await asyncio.wait_for(asyncio.gather(
+        acquire("query", PRIORITY_QUERY),
+        acquire("place", PRIORITY_PLACE),
+        acquire("cancel", PRIORITY_CANCEL),
+    ), timeout=1)
+    assert done == ["cancel", "place", "query"]
+
+
+@pytest.mark.asyncio
+async def test_shapes_to_the_limit():
+    rate_limiter = RateLimiter(LIMITS, usage=1)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for _ in range(4):
+        await rate_limiter.acquire(1)
+    # 2 right away, then 1 every 50ms
+    assert loop.time() - started >= 0.09
+
+
+def test_update_from_headers():
+    rate_limiter = RateLimiter(usage=0.5)
+    rate_limiter.update({"X-MBX-USED-WEIGHT-1M": "5000", "X-MBX-ORDER-COUNT-10S": "10"})
+    # Half of what's left under the exchange limit
+    assert rate_limiter.buckets["USED-WEIGHT-1M"].tokens == 500
+    assert rate_limiter.buckets["ORDER-COUNT-10S"].tokens == 45
+
+    rate_limiter.update_from_rate_limits([
+        {"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE", "intervalNum": 1,
+         "limit": 6000, "count": 5800},
+    ])
+    assert rate_limiter.buckets["USED-WEIGHT-1M"].tokens == 100
+
+
+@pytest.mark.asyncio
+async def test_back_off_on_429(httpx_mock: HTTPXMock, patch_time):
+    httpx_mock.add_response(
+        status_code=429, headers={"Retry-After": "30"}, json={"code": -1003, "msg": "Too many"}
+    )
+    with pytest.raises(HTTPStatusError):
+        await place_order(SIDE_BID, 10000)
+
+    with pytest.raises(RateLimited):
+        await place_order(SIDE_BID, 10000)
+    # The second order never reached the exchange
+    assert len(httpx_mock.get_requests()) == 1
+    assert limiter.blocked_until > 0
+
+
+@pytest.mark.asyncio
+async def test_cancels_wait_out_a_back_off():
+    rate_limiter = RateLimiter(LIMITS, usage=1)
+    rate_limiter.back_off(0.05)
+    with pytest.raises(RateLimited):
+        await rate_limiter.acquire(1, priority=PRIORITY_PLACE)
+
+    started = asyncio.get_running_loop().time()
+    await rate_limiter.acquire(1, priority=PRIORITY_CANCEL)
+    assert asyncio.get_running_loop().time() - started >= 0.04
@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from swapper.market_data import MarketDataReader
+from swapper.metrics import RING_LAG
+from swapper.metrics import RING_OVERRUNS
+from swapper.models import KlineEvent
+from swapper.ring import RingPublisher
+from swapper.ring import TickRing
+
+
+def _tick(number: int, symbol: str = "BTCUSDT") -> KlineEvent:
+    return KlineEvent(symbol, number, number * 100 + 50, 1, 60000)
+
+
+@pytest.fixture
+def ring():
+    ring = TickRing(size=4)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def _write(name: str, count: int) -> None:
+    ring = TickRing(name)
+    for number in range(1, count + 1):
+        ring.write(_tick(number))
+    ring.close()
+
+
+def test_reads_ticks_in_order(ring):
+    reader = TickRing(ring.name)
+    assert reader.size == 4
+    assert reader.read() is None
+
+    ring.write(_tick(1))
+    ring.write(_tick(2, "ETHUSDT"))
+    assert reader.read() == _tick(1)
+    assert reader.stats.lag == 1
+    assert reader.read() == _tick(2, "ETHUSDT")
+    assert reader.read() is None
+    assert reader.stats.ticks_read == 2
+    assert reader.stats.overruns == 0
+    reader.close()
+
+
+def test_counts_overruns(ring):
+    reader = TickRing(ring.name)
+    for number in range(1, 11):
+        ring.write(_tick(number))
+
+    # Ticks 1 to 7 were overwritten or are in the slot the writer takes next
+    assert reader.read() == _tick(8)
+    assert reader.stats.overruns == 7
+    assert RING_OVERRUNS.labels().value == 7
+    assert reader.stats.max_lag == 2
+    assert [reader.read(), reader.read(), reader.read()] == [_tick(9), _tick(10), None]
+    reader.close()
+
+
+def test_detects_slot_being_written(ring):
+    reader = TickRing(ring.name)
+    ring.write(_tick(1))
+    # The writer lapped the reader and is halfway through the slot
+    ring._buffer[64:72] = bytes(8)
+
+    assert reader.read() is None
+    assert reader.stats.overruns == 1
+    reader.close()
+
+
+def test_reads_ticks_written_by_another_process(ring):
+    reader = TickRing(ring.name)
+    process = multiprocessing.get_context("spawn").Process(target=_write, args=(ring.name, 3))
+    process.start()
+    process.join(30)
+
+    assert [reader.read() for _ in range(4)] == [_tick(1), _tick(2), _tick(3), None]
+    reader.close()
+
+
+@pytest.mark.asyncio
+async def test_consume_feeds_reader(ring):
+    publisher = RingPublisher(ring)
+    publisher.publish({"stream": "ethusdt@depth", "data": {"lastUpdateId": 1}})
+    publisher.publish({
+        "stream": "btcusdt@kline_1m",
+        "data": {"s": "BTCUSDT", "E": 1, "k": {"h": "1.5", "l": "0.01", "t": 60000}},
+    })
+    ring.write(_tick(2, "ETHUSDT"))
+    ring.write(_tick(3))
+
+    reader = MarketDataReader()
+    consumer = TickRing(ring.name)
+    consumer.position = 0
+    consuming = asyncio.create_task(consumer.consume(reader, {"BTCUSDT"}))
+    try:
+        assert await asyncio.wait_for(reader.get(), 1) == _tick(3)
+    finally:
+        consuming.cancel()
+    assert reader.stats.frames_conflated == 1
+    assert RING_LAG.labels().value == 2
+    consumer.close()
@@ -1,5 +1,4 @@
 import time
-from decimal import Decimal
 
 import pytest
 from httpx import HTTPStatusError
@@ -8,14 +7,18 @@ from pytest_httpx import HTTPXMock
 from swapper.constants import BINANCE_REST_API_BASE_URL
 from swapper.constants import SIDE_BID
 from swapper.service import calculate_signature
+from swapper.service import cancel_replace_order
 from swapper.service import cancel_order
+from swapper.service import create_listen_key
 from swapper.service import get_all_orders
+from swapper.service import keepalive_listen_key
 from swapper.service import place_order
+from swapper.service import replace_order
 
 
 @pytest.mark.asyncio
 async def test_place_order(httpx_mock: HTTPXMock, patch_time):
-    price = round(Decimal(100), 2)
+    price = "100.00"
 
     data = {
         "symbol": "BTCUSDT",
@@ -31,13 +34,13 @@ async def test_place_order(httpx_mock: HTTPXMock, patch_time):
         url=f"{BINANCE_REST_API_BASE_URL}/order?signature={signature}",
         json={"orderId": 1, "status": "NEW", "side": SIDE_BID}
     )
-    response = await place_order(SIDE_BID, Decimal(100))
+    response = await place_order(SIDE_BID, 10000)
     assert response == {"orderId": 1, "status": "NEW", "side": SIDE_BID}
 
 
 @pytest.mark.asyncio
 async def test_place_order_unhappy(httpx_mock: HTTPXMock, patch_time):
-    price = round(Decimal(100), 2)
+    price = "100.00"
 
     data = {
         "symbol": "BTCUSDT",
@@ -55,7 +58,7 @@ async def test_place_order_unhappy(httpx_mock: HTTPXMock, patch_time):
         json={"code": -2010, "msg": "Account has insufficient balance for requested action."}
     )
     with pytest.raises(HTTPStatusError):
-        await place_order(SIDE_BID, Decimal(100))
+        await place_order(SIDE_BID, 10000)
 
 
 @pytest.mark.asyncio
@@ -76,6 +79,24 @@ async def test_get_all_orders(httpx_mock: HTTPXMock, patch_time):
     assert response == [{"orderId": 1, "status": "NEW", "side": SIDE_BID}]
 
 
+@pytest.mark.asyncio
+async def test_get_all_orders_from_order_id(httpx_mock: HTTPXMock, patch_time):
+    params = {
+        "symbol": "BTCUSDT",
+        "timestamp": str(int(time.time() * 1000)),
+        "orderId": "5",
+        "limit": "1000",
+    }
+    signature = calculate_signature(params)
+    query_string = "&".join([f"{k}={v}" for k, v in params.items()])
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/allOrders?{query_string}&signature={signature}",
+        json=[{"orderId": 5, "status": "NEW", "side": SIDE_BID}]
+    )
+    response = await get_all_orders(from_order_id=5)
+    assert response == [{"orderId": 5, "status": "NEW", "side": SIDE_BID}]
+
+
 @pytest.mark.asyncio
 async def test_get_all_orders_unhappy(httpx_mock: HTTPXMock, patch_time):
     params = {
@@ -97,10 +118,6 @@ async def test_get_all_orders_unhappy(httpx_mock: HTTPXMock, patch_time):
 
 @pytest.mark.asyncio
 async def test_cancel_order(httpx_mock: HTTPXMock, patch_time):
-    httpx_mock.add_response(
-        url="https://api.binance.com/api/v3/time",
-        json={"serverTime": int(time.time() * 1000)}
-    )
     params = {
         "symbol": "BTCUSDT",
         "orderId": 1,
@@ -119,10 +136,6 @@ async def test_cancel_order(httpx_mock: HTTPXMock, patch_time):
 
 @pytest.mark.asyncio
 async def test_cancel_order_unhappy(httpx_mock: HTTPXMock, patch_time):
-    httpx_mock.add_response(
-        url="https://api.binance.com/api/v3/time",
-        json={"serverTime": int(time.time() * 1000)}
-    )
     params = {
         "symbol": "BTCUSDT",
         "orderId": 1,
@@ -138,3 +151,131 @@ async def test_cancel_order_unhappy(httpx_mock: HTTPXMock, patch_time):
     )
     response = await cancel_order(1)
     assert response is None
+
+
+@pytest.mark.asyncio
+async def test_create_listen_key(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        method="POST",
+        url=f"{BINANCE_REST_API_BASE_URL}/userDataStream",
+        json={"listenKey": "pqia91ma19a5s61cv6a81va65sdf19v8a65a1a5s61cv6a81va65sdf19v8a65a1"}
+    )
+    listen_key = await create_listen_key()
+    assert listen_key == "pqia91ma19a5s61cv6a81va65sdf19v8a65a1a5s61cv6a81va65sdf19v8a65a1"
+
+
+@pytest.mark.asyncio
+async def test_keepalive_listen_key(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        method="PUT",
+        url=f"{BINANCE_REST_API_BASE_URL}/userDataStream?listenKey=key",
+        json={}
+    )
+    await keepalive_listen_key("key")
+
+
+@pytest.mark.asyncio
+async def test_keepalive_listen_key_unhappy(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        method="PUT",
+        url=f"{BINANCE_REST_API_BASE_URL}/userDataStream?listenKey=key",
+        status_code=400,
+        json={"code": -1125, "msg": "This listenKey does not exist."}
+    )
+    with pytest.raises(HTTPStatusError):
+        await keepalive_listen_key("key")
+
+
+def _cancel_replace_data(order_id: int, price: str) -> dict:
+    return {
+        "symbol": "BTCUSDT",
+        "side": SIDE_BID,
+        "type": "LIMIT",
+        "cancelReplaceMode": "STOP_ON_FAILURE",
+        "timeInForce": "GTC",
+        "quantity": 0.01,
+        "price": price,
+        "cancelOrderId": order_id,
+        "timestamp": str(int(time.time() * 1000)),
+    }
+
+
+@pytest.mark.asyncio
+async def test_cancel_replace_order(httpx_mock: HTTPXMock, patch_time):
+    signature = calculate_signature(_cancel_replace_data(1, "100.00"))
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/order/cancelReplace?signature={signature}",
+        json={
+            "cancelResult": "SUCCESS",
+            "newOrderResult": "SUCCESS",
+            "cancelResponse": {"orderId": 1, "status": "CANCELED", "side": SIDE_BID},
+            "newOrderResponse": {"orderId": 2, "status": "NEW", "side": SIDE_BID},
+        }
+    )
+    response = await cancel_replace_order(1, SIDE_BID, 10000)
+    assert response == {
+        "cancelResponse": {"orderId": 1, "status": "CANCELED", "side": SIDE_BID},
+        "newOrderResponse": {"orderId": 2, "status": "NEW", "side": SIDE_BID},
+    }
+
+
+@pytest.mark.asyncio
+async def test_cancel_replace_order_cancel_failed(httpx_mock: HTTPXMock, patch_time):
+    signature = calculate_signature(_cancel_replace_data(1, "100.00"))
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/order/cancelReplace?signature={signature}",
+        status_code=400,
+        json={
+            "code": -2022,
+            "msg": "Order cancel-replace failed.",
+            "data": {
+                "cancelResult": "FAILURE",
+                "newOrderResult": "NOT_ATTEMPTED",
+                "cancelResponse": {"code": -2011, "msg": "Unknown order sent."},
+                "newOrderResponse": None,
+            }
+        }
+    )
+    response = await cancel_replace_order(1, SIDE_BID, 10000)
+    assert response == {"cancelResponse": None, "newOrderResponse": None}
+
+
+@pytest.mark.asyncio
+async def test_cancel_replace_order_unhappy(httpx_mock: HTTPXMock, patch_time):
+    httpx_mock.add_response(status_code=400, json={"code": -1021, "msg": "Timestamp"})
+    with pytest.raises(HTTPStatusError):
+        await cancel_replace_order(1, SIDE_BID, 10000)
+
+
+@pytest.mark.asyncio
+async def test_replace_order_falls_back(httpx_mock: HTTPXMock, patch_time, mocker, monkeypatch):
+    monkeypatch.setattr("swapper.service._cancel_replace_supported", True)
+    httpx_mock.add_response(status_code=404)
+    cancel = mocker.patch("swapper.service._cancel_order", return_value=({"orderId": 1}, None))
+    place = mocker.patch("swapper.service.place_order", return_value={"orderId": 2})
+
+    response = await replace_order(1, SIDE_BID, 10000)
+    assert response == {"cancelResponse": {"orderId": 1}, "newOrderResponse": {"orderId": 2}}
+    # Endpoint isn't tried again
+    await replace_order(2, SIDE_BID, 10000)
+    assert len(httpx_mock.get_requests()) == 1
+    assert cancel.call_count == 2
+    assert place.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_replace_order_fallback_needs_a_cancel(
+        httpx_mock: HTTPXMock, patch_time, mocker, monkeypatch
+):
+    monkeypatch.setattr("swapper.service._cancel_replace_supported", False)
+    place = mocker.patch("swapper.service.place_order", return_value={"orderId": 2})
+    httpx_mock.add_response(status_code=400, json={"code": -1021, "msg": "Timestamp"})
+    response = await replace_order(1, SIDE_BID, 10000)
+    # The order can still be live
+    assert response == {"cancelResponse": None, "newOrderResponse": None}
+    assert not place.called
+
+    # It's gone already
+    httpx_mock.add_response(status_code=400, json={"code": -2011, "msg": "Unknown order sent."})
+    response = await replace_order(1, SIDE_BID, 10000)
+    assert response == {"cancelResponse": None, "newOrderResponse": {"orderId": 2}}
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from swapper.constants import BINANCE_REST_API_BASE_URL
+from swapper.metrics import STARTUP_SECONDS
+from swapper.startup import Startup
+from swapper.state import State
+
+
+@pytest.mark.asyncio
+async def test_run_phases_concurrently():
+    startup = Startup()
+    started = asyncio.get_running_loop().time()
+    await startup.run(("a", asyncio.sleep(0.05)), ("b", asyncio.sleep(0.05)))
+    assert asyncio.get_running_loop().time() - started < 0.09
+    assert set(STARTUP_SECONDS._children) == {("a",), ("b",), ("ready",)}
+    assert STARTUP_SECONDS.labels("ready").value >= STARTUP_SECONDS.labels("a").value > 0
+
+
+@pytest.mark.asyncio
+async def test_run_cancels_other_phases_on_failure():
+    async def fail():
+        raise ValueError("Boom")
+
+    slow = asyncio.ensure_future(asyncio.sleep(10))
+    with pytest.raises(ValueError):
+        await Startup().run(("fail", fail()), ("slow", slow))
+    await asyncio.sleep(0)
+    assert slow.cancelled()
+    assert ("ready",) not in STARTUP_SECONDS._children
+
+
+def test_order_placed_records_first_order_only():
+    startup = Startup(started=0.0)
+    startup.order_placed()
+    first = STARTUP_SECONDS.labels("first_order").value
+    startup.order_placed()
+    assert STARTUP_SECONDS.labels("first_order").value == first
+
+
+@pytest.mark.asyncio
+async def test_check_symbols(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/exchangeInfo?symbols=%5B%22BTCUSDT%22,%22ETHUSDT%22%5D",
+        json={"symbols": [
+            {"symbol": "BTCUSDT", "status": "TRADING"},
+            {"symbol": "ETHUSDT", "status": "BREAK"},
+        ]},
+    )
+    startup = Startup()
+    with pytest.raises(ValueError, match="ETHUSDT"):
+        await startup.check_symbols(["BTCUSDT", "ETHUSDT"])
+    assert startup.exchange_info["symbols"][0]["symbol"] == "BTCUSDT"
+
+
+@pytest.mark.asyncio
+async def test_connect_user_stream_waits_for_clock_before_snapshot(mocker):
+    calls = []
+    stream = mocker.MagicMock()
+    stream.open = mocker.AsyncMock(side_effect=lambda: calls.append("open"))
+    stream.snapshot = mocker.AsyncMock(side_effect=lambda: calls.append("snapshot"))
+
+    async def sync(burst):
+        await asyncio.sleep(0.01)
+        calls.append("clock")
+
+    sync_mock = mocker.patch("swapper.startup.clock.sync", side_effect=sync)
+    startup = Startup()
+    await asyncio.gather(startup.connect_user_stream(stream), startup.sync_clock())
+    assert calls == ["open", "clock", "snapshot"]
+    # One sample for both
+    sync_mock.assert_called_once_with(burst=1)
+
+
+@pytest.mark.asyncio
+async def test_connect_user_stream_loads_journal_after_symbols(mocker):
+    calls = []
+    stream = mocker.MagicMock(states={"BTCUSDT": State()})
+    stream.open = mocker.AsyncMock(side_effect=lambda: calls.append("open"))
+    stream.snapshot = mocker.AsyncMock()
+    journal = mocker.MagicMock()
+    journal.load.side_effect = lambda symbol, state: calls.append("journal")
+    mocker.patch("swapper.startup.clock.sync", mocker.AsyncMock())
+
+    async def get_exchange_info(symbols):
+        await asyncio.sleep(0.01)
+        calls.append("exchange_info")
+        return {"symbols": [{"symbol": "BTCUSDT", "status": "TRADING"}]}
+
+    mocker.patch("swapper.startup.get_exchange_info", side_effect=get_exchange_info)
+    startup = Startup()
+    await asyncio.gather(
+        startup.check_symbols(["BTCUSDT"]), startup.connect_user_stream(stream, journal)
+    )
+    assert calls == ["open", "exchange_info", "journal"]
+    journal.load.assert_called_once_with("BTCUSDT", stream.states["BTCUSDT"])
@@ -1,5 +1,6 @@
 from swapper.constants import SIDE_ASK
 from swapper.constants import SIDE_BID
+from swapper.models import Order
 from swapper.state import State
 
 
@@ -10,7 +11,25 @@ def test_add_orders():
         {"orderId": 2, "status": "NEW"},
     ]
     state.add_orders(orders)
-    assert state.orders == {1: {"orderId": 1, "status": "NEW"}, 2: {"orderId": 2, "status": "NEW"}}
+    assert state.orders == {
+        1: Order(order_id=1, status="NEW"), 2: Order(order_id=2, status="NEW")
+    }
+
+
+def test_add_orders_from_response():
+    state = State()
+    state.add_orders([{
+        "symbol": "BTCUSDT", "orderId": 1, "price": "23000.01000000", "status": "NEW",
+        "side": SIDE_BID, "updateTime": 1675609847999, "origQty": "0.01000000",
+    }])
+    assert state.orders[1] == Order(
+        order_id=1,
+        side=SIDE_BID,
+        status="NEW",
+        price=2300001,
+        symbol="BTCUSDT",
+        update_time=1675609847999,
+    )
 
 
 def test_get_active_orders():
@@ -20,7 +39,7 @@ def test_get_active_orders():
         {"orderId": 2, "status": "NEW"},
     ]
     state.add_orders(orders)
-    assert state.get_active_orders() == orders
+    assert [order.order_id for order in state.get_active_orders()] == [1, 2]
     assert state.has_active_orders() is True
 
 
@@ -44,6 +63,16 @@ def test_has_both_bid_ask():
     assert state.has_both_bid_ask() is True
 
 
+def test_has_both_bid_ask_same_side():
+    state = State()
+    orders = [
+        {"orderId": 1, "status": "NEW", "side": SIDE_BID},
+        {"orderId": 2, "status": "NEW", "side": SIDE_BID},
+    ]
+    state.add_orders(orders)
+    assert state.has_both_bid_ask() is False
+
+
 def test_get_active_bid_order():
     state = State()
     orders = [
@@ -51,7 +80,7 @@ def test_get_active_bid_order():
         {"orderId": 2, "status": "NEW", "side": SIDE_ASK},
     ]
     state.add_orders(orders)
-    assert state.get_active_bid_order() == orders[0]
+    assert state.get_active_bid_order() == Order.from_dict(orders[0])
 
 
 def test_get_active_ask_order():
@@ -61,7 +90,7 @@ def test_get_active_ask_order():
         {"orderId": 2, "status": "NEW", "side": SIDE_ASK},
     ]
     state.add_orders(orders)
-    assert state.get_active_ask_order() == orders[1]
+    assert state.get_active_ask_order() == Order.from_dict(orders[1])
 
 
 def test_get_active_orders_empty():
@@ -73,3 +102,50 @@ def test_get_active_orders_empty():
 def test_has_both_bid_ask_empty():
     state = State()
     assert state.has_both_bid_ask() is False
+
+
+def test_status_transition_updates_indexes():
+    state = State()
+    state.add_orders([
+        {"orderId": 1, "status": "NEW", "side": SIDE_BID, "updateTime": 1},
+        {"orderId": 2, "status": "NEW", "side": SIDE_BID, "updateTime": 1},
+    ])
+    state.add_orders([{"orderId": 1, "status": "PARTIALLY_FILLED", "side": SIDE_BID,
+                       "updateTime": 2}])
+    assert state.get_active_bid_order().order_id == 2
+    assert [order.order_id for order in state.get_orders_by_status("PARTIALLY_FILLED")] == [1]
+
+    state.add_orders([{"orderId": 1, "status": "FILLED", "side": SIDE_BID, "updateTime": 3}])
+    assert state.get_orders_by_status("PARTIALLY_FILLED") == []
+    assert 1 not in state.orders
+    assert state.get_order(1).status == "FILLED"
+
+
+def test_stale_update_is_ignored():
+    state = State()
+    state.add_orders([{"orderId": 1, "status": "CANCELED", "side": SIDE_BID, "updateTime": 2}])
+    state.add_orders([{"orderId": 1, "status": "NEW", "side": SIDE_BID, "updateTime": 1}])
+    assert not state.has_active_orders()
+    assert state.get_order(1).status == "CANCELED"
+
+
+def test_history_is_bounded():
+    state = State(history_size=2)
+    state.add_orders([
+        {"orderId": order_id, "status": "FILLED", "side": SIDE_ASK} for order_id in range(5)
+    ])
+    assert list(state.history) == [3, 4]
+    assert state.orders == {}
+    assert state.get_order(0) is None
+
+
+def test_resume_order_id():
+    state = State()
+    assert state.resume_order_id() is None
+    state.add_orders([{"orderId": 7, "status": "FILLED", "side": SIDE_BID}])
+    assert state.resume_order_id() == 8
+    state.add_orders([
+        {"orderId": 9, "status": "NEW", "side": SIDE_BID},
+        {"orderId": 8, "status": "NEW", "side": SIDE_ASK},
+    ])
+    assert state.resume_order_id() == 8
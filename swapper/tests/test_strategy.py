@@ -0,0 +1,42 @@
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.strategy import Action
+from swapper.strategy import decide
+from swapper.strategy import get_prices
+from swapper.strategy import PLACE
+from swapper.strategy import REPLACE
+from swapper.state import State
+
+
+def test_get_prices():
+    assert get_prices(1001000, 1000000) == (999000, 1002001)
+
+
+def test_decide_no_orders():
+    assert decide(State(), 1001000, 1000000) == [
+        Action(PLACE, SIDE_BID, 999000),
+        Action(PLACE, SIDE_ASK, 1002001),
+    ]
+
+
+def test_decide_orders_at_risk():
+    state = State()
+    state.add_orders([
+        {"orderId": 1, "status": "NEW", "side": SIDE_BID, "price": "9995"},
+        {"orderId": 2, "status": "NEW", "side": SIDE_ASK, "price": "10030"},
+    ])
+    assert decide(state, 1001000, 1000000) == [
+        Action(REPLACE, SIDE_ASK, 1002001, state.get_active_ask_order()),
+    ]
+
+
+def test_decide_missing_side():
+    state = State()
+    state.add_orders([{"orderId": 1, "status": "NEW", "side": SIDE_BID, "price": "9995"}])
+    assert decide(state, 1001000, 1000000) == [
+        Action(PLACE, SIDE_ASK, 1002001),
+    ]
+
+
+def test_get_prices_with_spread():
+    assert get_prices(1001000, 1000000, 1.0) == (990000, 1011010)
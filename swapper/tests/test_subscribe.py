@@ -1,9 +1,16 @@
 from typing import Optional
+from unittest.mock import AsyncMock
 from unittest.mock import MagicMock
 
 import pytest
+from httpx import HTTPStatusError
 from pytest_httpx import HTTPXMock
 
+from swapper.errors import RequestFateUnknown
+from swapper.exchange_info import OrderRejected
+from swapper.ratelimit import RateLimited
+from swapper.state import State
+from swapper.subscribe import _run_concurrently
 from swapper.subscribe import subscribe
 
 
@@ -47,7 +54,7 @@ async def test_subscribe_no_orders(httpx_mock: HTTPXMock, patch_time, mocker):
 @pytest.mark.asyncio
 async def test_subscribe_orders_at_risk(httpx_mock: HTTPXMock, patch_time, mocker):
     """
-    2 existing orders at risk to be filled. Should cancel both and place 2 new orders.
+    2 existing orders at risk to be filled. Should replace both.
     """
     mocker.patch(
         "swapper.subscribe.get_all_orders",
@@ -60,21 +67,21 @@ async def test_subscribe_orders_at_risk(httpx_mock: HTTPXMock, patch_time, mocke
         ],
     )
     order_at_risk = mocker.patch(
-        "swapper.subscribe.order_at_risk",
+        "swapper.strategy.order_at_risk",
         side_effect=[True, True],
     )
-    place_order = mocker.patch(
-        "swapper.subscribe.place_order",
+    replace_order = mocker.patch(
+        "swapper.subscribe.replace_order",
         side_effect=[
-            {"orderId": 3, "status": "NEW", "side": "BUY"},
-            {"orderId": 4, "status": "NEW", "side": "SELL"},
+            {"cancelResponse": {"orderId": 1}, "newOrderResponse": {"orderId": 3}},
+            {"cancelResponse": {"orderId": 2}, "newOrderResponse": {"orderId": 4}},
         ],
     )
-    cancel_order = mocker.patch("swapper.subscribe.cancel_order",)
+    place_order = mocker.patch("swapper.subscribe.place_order")
     with pytest.raises(_ExitLoop):
         await subscribe(MagicMock(send=_ws, recv=_ws_recv))
-    assert place_order.call_count == 2
-    assert cancel_order.call_count == 2
+    assert replace_order.call_count == 2
+    assert place_order.call_count == 0
     assert order_at_risk.call_count == 2
 
 
@@ -94,28 +101,28 @@ async def test_subscribe_orders_not_at_risk(httpx_mock: HTTPXMock, patch_time, m
         ],
     )
     order_at_risk = mocker.patch(
-        "swapper.subscribe.order_at_risk",
+        "swapper.strategy.order_at_risk",
         side_effect=[False, False],
     )
-    place_order = mocker.patch(
-        "swapper.subscribe.place_order",
+    replace_order = mocker.patch(
+        "swapper.subscribe.replace_order",
         side_effect=[
-            {"orderId": 3, "status": "NEW", "side": "BUY"},
-            {"orderId": 4, "status": "NEW", "side": "SELL"},
+            {"cancelResponse": {"orderId": 1}, "newOrderResponse": {"orderId": 3}},
+            {"cancelResponse": {"orderId": 2}, "newOrderResponse": {"orderId": 4}},
         ],
     )
-    cancel_order = mocker.patch("swapper.subscribe.cancel_order",)
+    place_order = mocker.patch("swapper.subscribe.place_order")
     with pytest.raises(_ExitLoop):
         await subscribe(MagicMock(send=_ws, recv=_ws_recv))
     assert place_order.call_count == 0
-    assert cancel_order.call_count == 0
+    assert replace_order.call_count == 0
     assert order_at_risk.call_count == 2
 
 
 @pytest.mark.asyncio
 async def test_one_order_at_risk(httpx_mock: HTTPXMock, patch_time, mocker):
     """
-    1 existing order at risk to be filled. Should cancel and place 1 new order.
+    1 existing order at risk to be filled. Should replace 1 order.
     """
     mocker.patch(
         "swapper.subscribe.get_all_orders",
@@ -128,19 +135,91 @@ async def test_one_order_at_risk(httpx_mock: HTTPXMock, patch_time, mocker):
         ],
     )
     order_at_risk = mocker.patch(
-        "swapper.subscribe.order_at_risk",
+        "swapper.strategy.order_at_risk",
         side_effect=[True, False],
     )
+    replace_order = mocker.patch(
+        "swapper.subscribe.replace_order",
+        side_effect=[
+            {"cancelResponse": {"orderId": 1}, "newOrderResponse": {"orderId": 3}},
+            {"cancelResponse": {"orderId": 2}, "newOrderResponse": {"orderId": 4}},
+        ],
+    )
+    place_order = mocker.patch("swapper.subscribe.place_order")
+    with pytest.raises(_ExitLoop):
+        await subscribe(MagicMock(send=_ws, recv=_ws_recv))
+    assert replace_order.call_count == 1
+    assert place_order.call_count == 0
+    assert order_at_risk.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_subscribe_with_streamed_state(httpx_mock: HTTPXMock, patch_time, mocker):
+    """
+    State kept up to date by the user data stream. Should not poll orders from REST and should
+    record placed orders in the given state.
+    """
+    get_all_orders = mocker.patch("swapper.subscribe.get_all_orders")
     place_order = mocker.patch(
         "swapper.subscribe.place_order",
         side_effect=[
-            {"orderId": 3, "status": "NEW", "side": "BUY"},
-            {"orderId": 4, "status": "NEW", "side": "SELL"},
+            {"orderId": 1, "status": "NEW", "side": "BUY"},
+            {"orderId": 2, "status": "NEW", "side": "SELL"},
         ],
     )
-    cancel_order = mocker.patch("swapper.subscribe.cancel_order",)
+    order_at_risk = mocker.patch("swapper.strategy.order_at_risk", return_value=False)
+    recv = AsyncMock(side_effect=[await _ws_recv(), await _ws_recv(), _ExitLoop()])
+    state = State()
     with pytest.raises(_ExitLoop):
-        await subscribe(MagicMock(send=_ws, recv=_ws_recv))
-    assert place_order.call_count == 1
-    assert cancel_order.call_count == 1
+        await subscribe(MagicMock(send=_ws, recv=recv), state)
+    assert get_all_orders.call_count == 0
+    assert place_order.call_count == 2
+    # Second message found both orders in memory
     assert order_at_risk.call_count == 2
+    assert state.has_both_bid_ask()
+
+
+@pytest.mark.asyncio
+async def test_subscribe_partial_failure(httpx_mock: HTTPXMock, patch_time, mocker):
+    """
+    Replacing the bid fails. Should still replace the ask and keep the loop running.
+    """
+    mocker.patch(
+        "swapper.subscribe.get_all_orders",
+        side_effect=[
+            [
+                {"orderId": 1, "status": "NEW", "side": "BUY"},
+                {"orderId": 2, "status": "NEW", "side": "SELL"},
+            ],
+            _ExitLoop("To exit the loop"),
+        ],
+    )
+    mocker.patch("swapper.strategy.order_at_risk", side_effect=[True, True])
+    replace_order = mocker.patch(
+        "swapper.subscribe.replace_order",
+        side_effect=[
+            HTTPStatusError("Bad Request", request=MagicMock(), response=MagicMock()),
+            {"cancelResponse": {"orderId": 2}, "newOrderResponse": {"orderId": 4}},
+        ],
+    )
+    with pytest.raises(_ExitLoop):
+        await subscribe(MagicMock(send=_ws, recv=_ws_recv))
+    assert replace_order.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_run_concurrently_logs_failed_requests(caplog):
+    async def _fail(err: Exception) -> None:
+        raise err
+
+    await _run_concurrently([
+        _fail(OrderRejected("PRICE_FILTER", "Too low")),
+        _fail(RateLimited("Rate limited for another 1.0s")),
+        _fail(RequestFateUnknown("order.place failed")),
+    ])
+    assert [record.getMessage().split(":")[0] for record in caplog.records] == [
+        "Order request not sent", "Order request not sent", "Order request got no response",
+    ]
+
+    with pytest.raises(_ExitLoop):
+        await _run_concurrently([_fail(_ExitLoop())])
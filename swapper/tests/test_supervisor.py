@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+
+from swapper.fake_exchange import FakeExchange
+from swapper.fake_exchange import FakeExchangeConfig
+from swapper.market_data import MarketDataReader
+from swapper.metrics import MARKET_DATA_GAP_SECONDS
+from swapper.supervisor import backoff_delay
+from swapper.supervisor import market_stream_urls
+from swapper.supervisor import MarketDataSupervisor
+
+
+@pytest_asyncio.fixture
+async def exchange():
+    exchange = FakeExchange(FakeExchangeConfig(tick_interval=60))
+    await exchange.start()
+    yield exchange
+    await exchange.close()
+
+
+@pytest_asyncio.fixture
+async def run_supervisor():
+    tasks = []
+
+    def run(supervisor: MarketDataSupervisor) -> MarketDataSupervisor:
+        tasks.append(asyncio.create_task(supervisor.run()))
+        return supervisor
+
+    yield run
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _wait_for(condition, timeout: float = 2.0) -> None:
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(wait(), timeout)
+
+
+def test_market_stream_urls():
+    assert market_stream_urls("wss://stream.binance.com:9443/ws/btcusdt@kline_1m") == [
+        "wss://stream.binance.com:9443/ws/btcusdt@kline_1m",
+        "wss://stream.binance.com:443/ws/btcusdt@kline_1m",
+        "wss://data-stream.binance.vision/ws/btcusdt@kline_1m",
+    ]
+    assert market_stream_urls("ws://127.0.0.1:8081/stream") == ["ws://127.0.0.1:8081/stream"]
+
+
+def test_backoff_delay():
+    assert all(0 <= backoff_delay(attempt, base=1, cap=10) <= 10 for attempt in range(20))
+    assert all(backoff_delay(0, base=1) <= 1 for _ in range(20))
+
+
+@pytest.mark.asyncio
+async def test_standby_publishes_every_frame_once(exchange, run_supervisor):
+    reader = MarketDataReader()
+    supervisor = run_supervisor(MarketDataSupervisor(
+        [exchange.env["BINANCE_WS_MARKET_STREAM_URL"]], reader, standby=True
+    ))
+    await _wait_for(lambda: len(exchange._market_subscribers) == 2)
+
+    exchange.tick()
+    kline = await asyncio.wait_for(reader.get(), 1)
+    assert kline.symbol == "BTCUSDT"
+    await _wait_for(lambda: supervisor.stats.duplicates == 1)
+    assert reader.stats.frames_received == 2
+
+    # Losing one connection loses no frames
+    await exchange._market_subscribers[0].websocket.close()
+    await _wait_for(lambda: supervisor.stats.disconnects == 1)
+    await asyncio.sleep(0.01)
+    exchange.tick()
+    assert (await asyncio.wait_for(reader.get(), 1)).symbol == "BTCUSDT"
+    assert supervisor.stats.gaps == 0
+    # And the standby comes back
+    await _wait_for(lambda: supervisor.stats.connects == 3)
+
+
+@pytest.mark.asyncio
+async def test_reports_gaps(exchange, run_supervisor, mocker):
+    mocker.patch("swapper.supervisor.backoff_delay", return_value=0)
+    reader = MarketDataReader()
+    supervisor = run_supervisor(MarketDataSupervisor(
+        [exchange.env["BINANCE_WS_MARKET_STREAM_URL"]], reader, standby=False
+    ))
+    await _wait_for(lambda: len(exchange._market_subscribers) == 1)
+    exchange.tick()
+    await asyncio.wait_for(reader.get(), 1)
+
+    await exchange._market_subscribers[0].websocket.close()
+    await _wait_for(lambda: supervisor.stats.connects == 2)
+    await _wait_for(lambda: len(exchange._market_subscribers) == 1)
+    exchange.tick()
+    await asyncio.wait_for(reader.get(), 1)
+    assert supervisor.stats.gaps == 1
+    assert 0 < supervisor.stats.last_gap < 1
+    assert MARKET_DATA_GAP_SECONDS.labels().count == 1
+
+
+@pytest.mark.asyncio
+async def test_replaces_stale_connection(exchange, run_supervisor, mocker):
+    mocker.patch("swapper.supervisor.backoff_delay", return_value=0)
+    supervisor = run_supervisor(MarketDataSupervisor(
+        [exchange.env["BINANCE_WS_MARKET_STREAM_URL"]], MarketDataReader(), standby=False,
+        stale_after=0.1,
+    ))
+    await _wait_for(lambda: supervisor.stats.stale >= 1 and supervisor.stats.connects >= 2)
+
+
+@pytest.mark.asyncio
+async def test_races_endpoints(exchange, run_supervisor):
+    sent = []
+
+    async def on_connect(websocket):
+        await websocket.send(json.dumps({"method": "SUBSCRIBE", "params": [], "id": 1}))
+        sent.append(websocket)
+
+    # Nothing listens on port 9
+    url = exchange.env["BINANCE_WS_MARKET_STREAM_URL"]
+    supervisor = run_supervisor(MarketDataSupervisor(
+        ["ws://127.0.0.1:9/ws/btcusdt@kline_1m", url], MarketDataReader(), on_connect,
+        standby=False,
+    ))
+    await _wait_for(lambda: len(sent) == 1)
+    assert supervisor._urls_in_use == {0: url}
@@ -0,0 +1,167 @@
+import json
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from swapper.constants import BINANCE_REST_API_BASE_URL
+from swapper.constants import SIDE_ASK
+from swapper.constants import SIDE_BID
+from swapper.models import Order
+from swapper.state import State
+from swapper.user_stream import UserDataStream
+from swapper.user_stream import execution_report_to_order
+
+EXECUTION_REPORT = {
+    "e": "executionReport", "E": 1675609848000, "s": "BTCUSDT", "c": "web_1", "S": "BUY",
+    "o": "LIMIT", "f": "GTC", "q": "0.01000000", "p": "23000.00000000", "x": "TRADE",
+    "X": "FILLED", "i": 1, "T": 1675609847999, "O": 1675609840000,
+}
+
+
+def test_execution_report_to_order():
+    assert execution_report_to_order(EXECUTION_REPORT) == Order(
+        order_id=1,
+        side=SIDE_BID,
+        status="FILLED",
+        price=2300000,
+        symbol="BTCUSDT",
+        update_time=1675609847999,
+        created_time=1675609840000,
+    )
+
+
+def test_handle_execution_report():
+    state = State()
+    state.add_orders([{"orderId": 1, "status": "NEW", "side": SIDE_BID, "updateTime": 1}])
+    UserDataStream({"BTCUSDT": state}).handle(EXECUTION_REPORT)
+    assert state.get_order(1).status == "FILLED"
+    assert not state.has_active_orders()
+
+
+def test_handle_execution_report_other_symbol():
+    state = State()
+    UserDataStream({"ETHUSDT": state}).handle(EXECUTION_REPORT)
+    assert state.get_order(1) is None
+
+
+def test_stale_snapshot_does_not_override_event():
+    state = State()
+    UserDataStream({"BTCUSDT": state}).handle(EXECUTION_REPORT)
+    state.add_orders([{"orderId": 1, "status": "NEW", "side": SIDE_BID, "updateTime": 1}])
+    assert state.get_order(1).status == "FILLED"
+
+
+def test_handle_listen_key_expired():
+    stream = UserDataStream({"BTCUSDT": State()})
+    stream.listen_key = "key"
+    stream.handle({"e": "listenKeyExpired", "E": 1576653824250})
+    assert stream.listen_key is None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_resumes_from_known_orders(mocker):
+    mocker.patch("swapper.user_stream.ALL_ORDERS_LIMIT", 2)
+    get_all_orders = mocker.patch(
+        "swapper.user_stream.get_all_orders",
+        side_effect=[
+            [
+                {"orderId": 3, "status": "FILLED", "side": SIDE_BID, "updateTime": 2},
+                {"orderId": 4, "status": "NEW", "side": SIDE_ASK, "updateTime": 2},
+            ],
+            [{"orderId": 5, "status": "NEW", "side": SIDE_BID, "updateTime": 3}],
+        ],
+    )
+    state = State()
+    state.add_orders([
+        {"orderId": 1, "status": "FILLED", "side": SIDE_BID, "updateTime": 1},
+        {"orderId": 3, "status": "NEW", "side": SIDE_BID, "updateTime": 1},
+    ])
+    await UserDataStream({"BTCUSDT": state}).snapshot()
+    # From the oldest open order, then the next page
+    get_all_orders.assert_has_awaits([mocker.call("BTCUSDT", 3), mocker.call("BTCUSDT", 5)])
+    assert state.get_order(3).status == "FILLED"
+    assert [order.order_id for order in state.get_active_orders()] == [4, 5]
+
+
+@pytest.mark.asyncio
+async def test_connect_takes_snapshot(httpx_mock: HTTPXMock, patch_time, mocker):
+    httpx_mock.add_response(
+        url=f"{BINANCE_REST_API_BASE_URL}/userDataStream", json={"listenKey": "key"}
+    )
+    get_all_orders = mocker.patch(
+        "swapper.user_stream.get_all_orders",
+        side_effect=[
+            [{"orderId": 1, "status": "NEW", "side": SIDE_BID}],
+            [{"orderId": 2, "status": "NEW", "side": SIDE_BID}],
+        ],
+    )
+    connect = mocker.patch("swapper.user_stream.websockets.connect", new=AsyncMock())
+    states = {"BTCUSDT": State(), "ETHUSDT": State()}
+    stream = UserDataStream(states, url="wss://example.com/ws")
+    await stream.connect()
+    connect.assert_awaited_once_with("wss://example.com/ws/key")
+    assert stream.listen_key == "key"
+    get_all_orders.assert_has_awaits([mocker.call("BTCUSDT"), mocker.call("ETHUSDT")])
+    assert states["BTCUSDT"].get_active_bid_order().order_id == 1
+    assert states["ETHUSDT"].get_active_bid_order().order_id == 2
+
+
+class _Websocket:
+    def __init__(self, messages):
+        self.messages = messages
+        self.close = AsyncMock()
+
+    async def __aiter__(self):
+        for message in self.messages:
+            yield message
+
+
+class _Stop(Exception):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_listen_reconnects_after_expiry(mocker):
+    stream = UserDataStream({"BTCUSDT": State()})
+    stream.listen_key = "key"
+    stream.websocket = _Websocket([
+        json.dumps(EXECUTION_REPORT), json.dumps({"e": "listenKeyExpired"})
+    ])
+    connect = mocker.patch.object(stream, "connect", side_effect=_Stop)
+    with pytest.raises(_Stop):
+        await stream.listen()
+    assert stream.states["BTCUSDT"].get_order(1).status == "FILLED"
+    assert stream.listen_key is None
+    connect.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_listen_reconnects_after_bad_event(mocker):
+    stream = UserDataStream({"BTCUSDT": State()})
+    stream.listen_key = "key"
+    stream.websocket = _Websocket([
+        json.dumps({**EXECUTION_REPORT, "p": "bad"}), json.dumps(EXECUTION_REPORT)
+    ])
+    connect = mocker.patch.object(stream, "connect", side_effect=_Stop)
+    with pytest.raises(_Stop):
+        await stream.listen()
+    # The rest of the stream is dropped, the snapshot after reconnecting catches up
+    assert stream.states["BTCUSDT"].get_order(1) is None
+    connect.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_reconnect_backs_off_while_failing(mocker):
+    sleep = mocker.patch("swapper.user_stream.asyncio.sleep", AsyncMock())
+    mocker.patch("swapper.user_stream.backoff_delay", return_value=0.5)
+    stream = UserDataStream({"BTCUSDT": State()})
+    stream.listen_key = "key"
+    connect = mocker.patch.object(
+        stream, "connect", side_effect=[httpx.ConnectError("down"), OSError("down"), None]
+    )
+    await stream.reconnect()
+    assert connect.await_count == 3
+    assert sleep.await_count == 2
+    assert stream.listen_key is None
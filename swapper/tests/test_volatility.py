@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from swapper.helpers import calculate_bid_ask_spread
+from swapper.volatility import CANDLE
+from swapper.volatility import EWMA
+from swapper.volatility import get_model
+from swapper.volatility import ROLLING
+from swapper.volatility import RollingSpread
+
+
+def test_rolling_spread_window():
+    model = RollingSpread(window=3)
+    model.update(1, 110, 100)
+    model.update(2, 105, 95)
+    model.update(3, 102, 100)
+    assert (model.high, model.low) == (110, 95)
+
+    # The first kline falls out of the window
+    model.update(4, 101, 99)
+    assert (model.high, model.low) == (105, 95)
+    model.update(5, 101, 99)
+    assert (model.high, model.low) == (102, 99)
+    assert model.rolling_spread() == calculate_bid_ask_spread(99, 102)
+
+
+def test_rolling_spread_updates_current_kline():
+    model = RollingSpread(window=3)
+    model.update(1, 110, 100)
+    model.update(2, 101, 100)
+    model.update(2, 112, 99)
+    assert (model.high, model.low) == (112, 99)
+    assert model.candle_spread() == calculate_bid_ask_spread(99, 112)
+
+    # Late updates of closed klines are ignored
+    model.update(1, 200, 1)
+    assert (model.high, model.low) == (112, 99)
+
+
+def test_rolling_spread_matches_brute_force():
+    window = 5
+    model = RollingSpread(window=window)
+    random.seed(0)
+    klines = []
+    for open_time in range(200):
+        low = random.randint(100, 200)
+        high = low + random.randint(0, 20)
+        model.update(open_time, high, low)
+        klines.append((high, low))
+        last = klines[-window:]
+        assert model.high == max(high for high, _ in last)
+        assert model.low == min(low for _, low in last)
+
+
+def test_ewma_spread():
+    model = RollingSpread(alpha=0.5)
+    model.update(1, 102, 100)
+    assert model.ewma_spread() == pytest.approx(2)
+    model.update(2, 101, 100)
+    # Half the closed kline, half the current one
+    assert model.ewma_spread() == pytest.approx(1.5)
+    model.update(2, 104, 100)
+    assert model.ewma_spread() == pytest.approx(3)
+    model.update(3, 100, 100)
+    assert model.ewma_spread() == pytest.approx(1.5)
+
+
+@pytest.mark.parametrize("name, expected", [
+    (CANDLE, 1),
+    (ROLLING, 10),
+    (EWMA, 7.75),
+])
+def test_spread(name, expected):
+    model = RollingSpread(alpha=0.25)
+    model.update(1, 110, 100)
+    model.update(2, 101, 100)
+    assert model.spread(name) == pytest.approx(expected)
+
+
+def test_get_model():
+    assert get_model("BTCUSDT") is get_model("BTCUSDT")
+    assert get_model("BTCUSDT") is not get_model("ETHUSDT")
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import pytest
+import websockets
+
+from swapper.errors import RequestNotSent
+from swapper.ws_api import WebSocketApi
+from swapper.ws_api import WebSocketApiError
+
+
+class _Websocket:
+    """
+    Records sent requests and yields the responses put in `incoming`
+    """
+
+    def __init__(self):
+        self.open = True
+        self.sent = []
+        self.incoming = asyncio.Queue()
+
+    async def send(self, message: str) -> None:
+        self.sent.append(json.loads(message))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        message = await self.incoming.get()
+        if isinstance(message, Exception):
+            self.open = False
+            raise message
+        return message
+
+
+def _session() -> WebSocketApi:
+    ws_api = WebSocketApi(api_key="key", secret_key="secret")
+    ws_api.websocket = _Websocket()
+    ws_api._reading = asyncio.create_task(ws_api._read(ws_api.websocket))
+    return ws_api
+
+
+def test_sign():
+    params = WebSocketApi(api_key="key", secret_key="secret").sign({"symbol": "BTCUSDT", "a": 1})
+    assert list(params) == ["symbol", "a", "apiKey", "signature"]
+    # Signed sorted by name
+    assert params["signature"] == hmac.new(
+        b"secret", b"a=1&apiKey=key&symbol=BTCUSDT", hashlib.sha256
+    ).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_responses_are_matched_by_id():
+    ws_api = _session()
+    first = asyncio.create_task(ws_api.request("order.place", {"side": "BUY"}))
+    second = asyncio.create_task(ws_api.request("order.place", {"side": "SELL"}))
+    await asyncio.sleep(0)
+    first_id, second_id = [request["id"] for request in ws_api.websocket.sent]
+
+    # Responses arrive in a different order than the requests went out
+    ws_api.websocket.incoming.put_nowait(json.dumps({"id": second_id, "status": 200, "result": 2}))
+    ws_api.websocket.incoming.put_nowait(json.dumps({"id": first_id, "status": 200, "result": 1}))
+
+    assert (await first)["result"] == 1
+    assert (await second)["result"] == 2
+    assert ws_api._pending == {}
+    ws_api._reading.cancel()
+
+
+@pytest.mark.asyncio
+async def test_pending_requests_fail_on_disconnect():
+    ws_api = _session()
+    request = asyncio.create_task(ws_api.request("order.cancel", {"orderId": 1}))
+    await asyncio.sleep(0)
+    ws_api.websocket.incoming.put_nowait(websockets.ConnectionClosed(None, None))
+
+    with pytest.raises(WebSocketApiError):
+        await request
+    # Requests made after it dropped aren't sent at all
+    with pytest.raises(RequestNotSent):
+        await ws_api.request("order.cancel", {"orderId": 1})
+
+
+@pytest.mark.asyncio
+async def test_try_connect_failure_is_not_fatal(mocker):
+    mocker.patch("swapper.ws_api.websockets.connect", side_effect=OSError("Unreachable"))
+    ws_api = WebSocketApi("ws://127.0.0.1:1", api_key="key", secret_key="secret")
+    assert not await ws_api.try_connect()
+    assert not ws_api.connected
+
+    mocker.patch("swapper.ws_api.websockets.connect", mocker.AsyncMock(return_value=_Websocket()))
+    assert await ws_api.try_connect()
+    assert ws_api.connected
+    ws_api._reading.cancel()
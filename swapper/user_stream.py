@@ -0,0 +1,187 @@
+"""
+Keeps a long-lived State up to date from the Binance user data stream
+"""
+import asyncio
+import logging
+import sys
+from typing import Dict
+from typing import Optional
+
+import websockets
+from httpx import HTTPError
+
+from swapper.constants import ALL_ORDERS_LIMIT
+from swapper.constants import BINANCE_WS_USER_STREAM_URL
+from swapper.constants import LISTEN_KEY_KEEPALIVE_INTERVAL
+from swapper.constants import RECONCILE_INTERVAL
+from swapper.constants import SLEEP_TIME
+from swapper.constants import USER_STREAM_MAX_RECONNECT_DELAY
+from swapper.decode import loads
+from swapper.errors import RequestNotSent
+from swapper.errors import SwapperError
+from swapper.metrics import RETRIES
+from swapper.models import Order
+from swapper.prices import price_precision
+from swapper.prices import to_ticks
+from swapper.service import create_listen_key
+from swapper.service import get_all_orders
+from swapper.service import keepalive_listen_key
+from swapper.state import State
+from swapper.supervisor import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+def execution_report_to_order(event: dict) -> Order:
+    """
+    Convert an `executionReport` event to an order record
+    """
+    symbol = sys.intern(event["s"])
+    return Order(
+        order_id=event["i"],
+        side=sys.intern(event["S"]),
+        status=sys.intern(event["X"]),
+        price=to_ticks(event["p"], price_precision(symbol)),
+        symbol=symbol,
+        update_time=event["T"],
+        created_time=event.get("O", 0),
+    )
+
+
+class UserDataStream:
+    """
+    Order updates come from `executionReport` events and go to the State of their symbol. REST is
+    only used for the initial snapshot and for periodic reconciliation in case an event was missed
+    """
+
+    def __init__(
+            self,
+            states: Dict[str, State],
+            url: str = BINANCE_WS_USER_STREAM_URL,
+            keepalive_interval: float = LISTEN_KEY_KEEPALIVE_INTERVAL,
+            reconcile_interval: float = RECONCILE_INTERVAL,
+    ) -> None:
+        self.states = states
+        self.url = url
+        self.keepalive_interval = keepalive_interval
+        self.reconcile_interval = reconcile_interval
+        self.listen_key: Optional[str] = None
+        self.websocket: Optional[websockets.WebSocketClientProtocol] = None
+
+    def handle(self, event: dict) -> None:
+        if event.get("e") == "executionReport":
+            state = self.states.get(event["s"])
+            if state is not None:
+                state.add_orders([execution_report_to_order(event)])
+        elif event.get("e") == "listenKeyExpired":
+            logger.warning("Listen key expired")
+            self.listen_key = None
+
+    async def snapshot(self) -> None:
+        """
+        Fetch the orders that can have changed since the states were last up to date. States that
+        know no orders get the orders of the last hour
+        """
+        # One symbol at a time to spread the request weight
+        for symbol, state in self.states.items():
+            from_order_id = state.resume_order_id()
+            if from_order_id is None:
+                state.add_orders(await get_all_orders(symbol))
+                continue
+            while True:
+                orders = await get_all_orders(symbol, from_order_id)
+                state.add_orders(orders)
+                if len(orders) < ALL_ORDERS_LIMIT:
+                    break
+                from_order_id = orders[-1]["orderId"] + 1
+
+    async def open(self) -> None:
+        """
+        Connect to the stream. Events are buffered until `listen()` reads them
+        """
+        if self.listen_key is None:
+            self.listen_key = await create_listen_key()
+        self.websocket = await websockets.connect(f"{self.url}/{self.listen_key}")
+
+    async def connect(self) -> None:
+        """
+        Connect to the stream before taking a snapshot, so no event falls in between
+        """
+        await self.open()
+        await self.snapshot()
+
+    async def reconnect(self) -> None:
+        """
+        Connect again with a fresh snapshot, backing off with jitter while it fails
+        """
+        attempt = 0
+        while True:
+            try:
+                await self.connect()
+                return
+            except (
+                    HTTPError, SwapperError, OSError, asyncio.TimeoutError,
+                    websockets.WebSocketException,
+            ) as err:
+                delay = backoff_delay(attempt, cap=USER_STREAM_MAX_RECONNECT_DELAY)
+                logger.error(f"User data stream reconnect failed: {err!r}. Retry in {delay:.1f}s")
+                RETRIES.labels("user_stream").inc()
+                await self.close()
+                # The key may have expired while the stream was down, a new one is cheap
+                self.listen_key = None
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def listen(self) -> None:
+        """
+        Apply events until cancelled, reconnecting when the stream drops, the listen key expires
+        or an event can't be applied
+        """
+        while True:
+            try:
+                async for message in self.websocket:
+                    self.handle(loads(message))
+                    if self.listen_key is None:
+                        break
+            except websockets.ConnectionClosed:
+                logger.warning("User data stream disconnected. Reconnecting")
+            except Exception:
+                # The snapshot after reconnecting catches up on the event
+                logger.exception("User data stream event failed. Reconnecting")
+            RETRIES.labels("user_stream").inc()
+            await self.close()
+            await self.reconnect()
+
+    async def keepalive(self) -> None:
+        delay = self.keepalive_interval
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.keepalive_interval
+            if self.listen_key:
+                try:
+                    await keepalive_listen_key(self.listen_key)
+                except RequestNotSent as err:
+                    # E.g. rate limited. Retried soon, so the key doesn't expire meanwhile
+                    logger.warning(f"Listen key keepalive not sent: {err!r}")
+                    delay = SLEEP_TIME
+                except (HTTPError, SwapperError) as err:
+                    logger.error(f"Listen key keepalive failed: {err!r}")
+
+    async def reconcile(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.snapshot()
+            except (HTTPError, SwapperError) as err:
+                # Events keep the state up to date meanwhile, the next reconciliation retries
+                logger.error(f"Reconciliation failed: {err!r}")
+
+    async def run(self) -> None:
+        """
+        Listen to the stream and keep the listen key alive. `connect()` has to be awaited first
+        """
+        await asyncio.gather(self.listen(), self.keepalive(), self.reconcile())
+
+    async def close(self) -> None:
+        if self.websocket is not None:
+            await self.websocket.close()
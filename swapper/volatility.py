@@ -0,0 +1,123 @@
+"""
+Spread estimates over the last klines instead of the current one only, which is narrow right after
+a candle opens and wide before it closes
+"""
+from collections import deque
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from swapper.constants import SPREAD_EWMA_ALPHA
+from swapper.constants import SPREAD_MODEL
+from swapper.constants import SPREAD_WINDOW
+from swapper.helpers import calculate_bid_ask_spread
+
+CANDLE = "candle"
+EWMA = "ewma"
+ROLLING = "rolling"
+
+
+class RollingSpread:
+    """
+    Keeps the high and low of the last `window` klines in a ring buffer. Every update is O(1):
+    the rolling high and low come from monotonic deques of kline numbers, and the moving average
+    of the range is only folded in when a kline closes.
+
+    Updates of the current kline replace it, so it can be fed every frame of the stream
+    """
+
+    def __init__(self, window: int = SPREAD_WINDOW, alpha: float = float(SPREAD_EWMA_ALPHA)):
+        self.window = window
+        self.alpha = alpha
+        # Prices in ticks
+        self._highs: List[Optional[int]] = [None] * window
+        self._lows: List[Optional[int]] = [None] * window
+        # Numbers of the klines that can still be the rolling high (low), their highs decreasing
+        # (lows increasing) from the left
+        self._max: Deque[int] = deque()
+        self._min: Deque[int] = deque()
+        self._open_time: Optional[int] = None
+        # Number of the current kline, counting from 0
+        self._current = -1
+        # Moving average of the range of the closed klines
+        self._ewma: Optional[float] = None
+
+    def update(self, open_time: int, high: int, low: int) -> None:
+        """
+        Add a kline, or update the current one if it has the same open time
+        """
+        if self._open_time is not None and open_time < self._open_time:
+            return  # Late update of a kline already closed
+        if open_time != self._open_time:
+            if self._current >= 0:
+                self._ewma = self._average(self.candle_spread())
+            self._open_time = open_time
+            self._current += 1
+            # The slot of the kline falling out of the window
+            expired = self._current - self.window
+            if self._max and self._max[0] <= expired:
+                self._max.popleft()
+            if self._min and self._min[0] <= expired:
+                self._min.popleft()
+
+        slot = self._current % self.window
+        self._highs[slot] = high
+        self._lows[slot] = low
+        # The current kline only ever gets a higher high and a lower low, so it pops its own
+        # previous entry as well
+        while self._max and self._highs[self._max[-1] % self.window] <= high:
+            self._max.pop()
+        self._max.append(self._current)
+        while self._min and self._lows[self._min[-1] % self.window] >= low:
+            self._min.pop()
+        self._min.append(self._current)
+
+    def _average(self, spread: float) -> float:
+        if self._ewma is None:
+            return spread
+        return self.alpha * spread + (1 - self.alpha) * self._ewma
+
+    @property
+    def high(self) -> int:
+        return self._highs[self._max[0] % self.window]
+
+    @property
+    def low(self) -> int:
+        return self._lows[self._min[0] % self.window]
+
+    def candle_spread(self) -> float:
+        slot = self._current % self.window
+        return calculate_bid_ask_spread(self._lows[slot], self._highs[slot])
+
+    def rolling_spread(self) -> float:
+        """
+        Spread of the range of all klines in the window together
+        """
+        return calculate_bid_ask_spread(self.low, self.high)
+
+    def ewma_spread(self) -> float:
+        """
+        Moving average of the spread of every kline, the current one included
+        """
+        return self._average(self.candle_spread())
+
+    def spread(self, model: str = SPREAD_MODEL) -> float:
+        if model == EWMA:
+            return self.ewma_spread()
+        if model == ROLLING:
+            return self.rolling_spread()
+        return self.candle_spread()
+
+
+_models: Dict[str, RollingSpread] = {}
+
+
+def get_model(symbol: str) -> RollingSpread:
+    """
+    The spread model of a symbol, shared by everything trading it
+    """
+    model = _models.get(symbol)
+    if model is None:
+        model = _models[symbol] = RollingSpread()
+    return model
@@ -0,0 +1,167 @@
+"""
+Persistent session with the Binance WebSocket API, which takes the same signed order requests as
+REST over one connection
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+from decimal import Decimal
+from typing import Dict
+from typing import Optional
+
+import websockets
+
+from swapper.constants import BINANCE_WS_API_URL
+from swapper.constants import HTTP_TIMEOUT
+from swapper.constants import WS_API_MAX_RECONNECT_DELAY
+from swapper.decode import loads
+from swapper.errors import RequestFateUnknown
+from swapper.errors import RequestNotSent
+from swapper.metrics import REST_ERRORS
+from swapper.metrics import REST_REQUESTS
+from swapper.metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class WebSocketApiError(RequestFateUnknown):
+    """
+    A request that was sent but got no response in time, or whose connection dropped
+    """
+
+
+class WebSocketApi:
+    """
+    Requests are sent as soon as they are made and matched to their responses by id, so any
+    number of them can be in flight at the same time.
+
+    `run()` keeps the session connected. Requests waiting on a connection that dropped fail with
+    `WebSocketApiError`, as it's unknown whether the exchange got them
+    """
+
+    def __init__(
+            self,
+            url: str = BINANCE_WS_API_URL,
+            api_key: Optional[str] = None,
+            secret_key: Optional[str] = None,
+            timeout: float = HTTP_TIMEOUT,
+    ) -> None:
+        self.url = url
+        self.api_key = api_key or os.getenv("API_KEY")
+        self.secret_key = secret_key or os.getenv("SECRET_KEY")
+        self.timeout = timeout
+        self.websocket: Optional[websockets.WebSocketClientProtocol] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reading: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def connected(self) -> bool:
+        return self.websocket is not None and self.websocket.open
+
+    def sign(self, params: dict) -> dict:
+        """
+        Add the API key and the signature of the parameters sorted by name
+        """
+        params = {**params, "apiKey": self.api_key}
+        query_string = "&".join(f"{key}={params[key]}" for key in sorted(params))
+        signature = hmac.new(
+            self.secret_key.encode("utf-8"), query_string.encode("utf-8"), hashlib.sha256
+        )
+        return {**params, "signature": signature.hexdigest()}
+
+    async def connect(self) -> None:
+        self.websocket = await websockets.connect(self.url)
+        self._reading = asyncio.create_task(self._read(self.websocket))
+
+    async def try_connect(self) -> bool:
+        """
+        Connect, or log why it failed. Orders go over REST until `run()` gets the session up
+        :return: Whether the session is connected
+        """
+        try:
+            await self.connect()
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as err:
+            logger.error(f"WebSocket API connection failed: {err!r}")
+            return False
+        return True
+
+    async def _read(self, websocket: websockets.WebSocketClientProtocol) -> None:
+        try:
+            async for message in websocket:
+                response = loads(message)
+                future = self._pending.pop(str(response.get("id")), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(WebSocketApiError("WebSocket API connection closed"))
+            self._pending.clear()
+
+    async def run(self) -> None:
+        """
+        Keep the session connected, backing off while the exchange is unreachable
+        """
+        delay = 1.0
+        while not self._closed:
+            if not self.connected:
+                if not await self.try_connect():
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, WS_API_MAX_RECONNECT_DELAY)
+                    continue
+                delay = 1.0
+            # Not awaited directly, so cancelling `run()` leaves the connection alone
+            await asyncio.wait({self._reading})
+            if not self._closed:
+                logger.warning("WebSocket API disconnected. Reconnecting")
+                RETRIES.labels("ws_api").inc()
+                await self.websocket.close()
+
+    async def request(self, method: str, params: dict, signed: bool = True) -> dict:
+        """
+        Send a request and wait for its response
+        :param method: The WebSocket API method, e.g. "order.place"
+        :param params: The request parameters, without the API key and signature
+        :param signed: Whether the method needs a signature
+        :return: The whole response, with "status" and either "result" or "error"
+        :raises RequestNotSent: While disconnected
+        :raises WebSocketApiError: If no response came
+        """
+        if not self.connected:
+            raise RequestNotSent("WebSocket API is not connected")
+        params = {
+            key: str(value) if isinstance(value, Decimal) else value
+            for key, value in params.items()
+        }
+        request_id = str(next(self._ids))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.websocket.send(json.dumps({
+                "id": request_id,
+                "method": method,
+                "params": self.sign(params) if signed else params,
+            }))
+            response = await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, websockets.ConnectionClosed, WebSocketApiError) as err:
+            REST_ERRORS.labels(method, type(err).__name__).inc()
+            raise WebSocketApiError(f"{method} failed: {err!r}") from err
+        finally:
+            self._pending.pop(request_id, None)
+        REST_REQUESTS.labels(method, str(response.get("status"))).inc()
+        return response
+
+    async def close(self) -> None:
+        self._closed = True
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self._reading is not None:
+            await self._reading